@@ -1,27 +1,53 @@
-from flask import Flask
-import tensorflow as tf
-from groq import Groq
-import os
-import cloudinary
 from dotenv import load_dotenv
 
 load_dotenv()
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable is required")
-client = Groq(api_key=GROQ_API_KEY)
+# Thread budgets must be in place before numpy, numba or TensorFlow load
+from . import resources
+resources.configure_environment()
 
-# Load the SavedModel
-model_path = "app/lsm_model3"
-loaded_model = tf.saved_model.load(model_path)
+from flask import Flask, Request
+import hashlib
+import os
+import threading
+import time
+
+# TensorFlow, the Groq client and Cloudinary are set up on first use (get_model,
+# get_client, configure_cloudinary) rather than on import, so processes that only
+# import the light modules (PDF workers, tooling) don't pay for them.
+# create_app() loads them up front for the inference service.
+_client = None
+_model = None
+_cloudinary_configured = False
+_init_lock = threading.Lock()
+
+
+def get_client():
+    """Shared Groq client (pooled keep-alive connections; calls go through app.outbound.groq_chat)"""
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                from groq import Groq
+                from .outbound import groq_client_options
+                groq_api_key = os.getenv("GROQ_API_KEY")
+                if not groq_api_key:
+                    raise ValueError("GROQ_API_KEY environment variable is required")
+                _client = Groq(api_key=groq_api_key, **groq_client_options())
+    return _client
+
+# Inference backend: "savedmodel" (full precision) or a quantized TFLite
+# export, "tflite-fp16" / "tflite-int8" (see export_tflite.py)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "savedmodel")
 
 # Create a callable wrapper that mimics TFSMLayer behavior
 # This allows the model to be called directly like model(input_tensor)
 class SavedModelWrapper:
-    def __init__(self, saved_model, signature_name="serving_default"):
+    def __init__(self, saved_model, signature_name="serving_default", backend="savedmodel", version=None):
         self._model = saved_model
         self._signature_name = signature_name
+        self.backend = backend
+        self.version = version
         # Try to get the signature, or use the model directly
         if hasattr(saved_model, 'signatures') and signature_name in saved_model.signatures:
             self._call_fn = saved_model.signatures[signature_name]
@@ -37,22 +63,130 @@ class SavedModelWrapper:
             return self._call_fn(inputs)
         return self._model(inputs)
 
-model = SavedModelWrapper(loaded_model, "serving_default")
+    @classmethod
+    def load(cls, model_path, backend=MODEL_BACKEND, signature_name="serving_default"):
+        """Load `model_path` with the configured backend"""
+        version = model_version(model_path, backend)
+        if backend.startswith("tflite"):
+            from .tflite_backend import TFLiteModel, tflite_path, backend_variant
+            return cls(TFLiteModel(tflite_path(model_path, backend_variant(backend))), signature_name, backend, version)
+        tf = resources.import_tensorflow()
+        return cls(tf.saved_model.load(model_path), signature_name, backend, version)
+
+    def warm_up(self, runs=2):
+        """Run a synthetic batch through the model so graph tracing happens before real traffic"""
+        import numpy as np
+        inputs = np.zeros((1, 128, 128), dtype=np.float32)
+        if not self.backend.startswith("tflite"):
+            inputs = resources.import_tensorflow().constant(inputs)
+        for _ in range(runs):
+            self(inputs)
+
+
+def model_version(model_path, backend=MODEL_BACKEND):
+    """'<dir name>-<content hash>' identifying the model files that were loaded"""
+    if backend.startswith("tflite"):
+        from .tflite_backend import tflite_path, backend_variant
+        files = [tflite_path(model_path, backend_variant(backend))]
+    else:
+        files = [os.path.join(model_path, name)
+                 for name in ("saved_model.pb", os.path.join("variables", "variables.index"))]
+    digest = hashlib.sha256()
+    for path in files:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return f"{os.path.basename(os.path.normpath(model_path))}-{digest.hexdigest()[:12]}"
+
+model_path = "app/lsm_model3"
 
-CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
-CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
-if not all([CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET]):
-    raise ValueError("CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET environment variables are required")
 
-cloudinary.config(
-    cloud_name=CLOUDINARY_CLOUD_NAME,
-    api_key=CLOUDINARY_API_KEY,
-    api_secret=CLOUDINARY_API_SECRET
-)
+def get_model():
+    """The active classifier, loaded on first use; callers keep the returned object for a whole request"""
+    global _model
+    if _model is None:
+        with _init_lock:
+            if _model is None:
+                _model = SavedModelWrapper.load(model_path, MODEL_BACKEND, "serving_default")
+                _model.warm_up()
+                print(f"Classifier {_model.version} loaded with backend: {_model.backend}")
+    return _model
+
+
+class ModelReloadInProgress(RuntimeError):
+    """Another reload is already loading a model"""
+
+
+_reload_lock = threading.Lock()
+
+
+def reload_model(path=None, backend=None):
+    """
+    Load and warm up a classifier next to the active one, then swap it in.
+    Requests that already hold the old model finish on it; new requests get the
+    new one. The old model is freed once the last of them lets go of it.
+    """
+    global _model, model_path
+    if not _reload_lock.acquire(blocking=False):
+        raise ModelReloadInProgress("A model reload is already in progress")
+    try:
+        path = path or model_path
+        backend = backend or MODEL_BACKEND
+        started = time.perf_counter()
+        candidate = SavedModelWrapper.load(path, backend, "serving_default")
+        loaded = time.perf_counter()
+        candidate.warm_up()
+        warmed = time.perf_counter()
+
+        with _init_lock:
+            previous, _model = _model, candidate
+            model_path = path
+        print(f"Classifier swapped: {previous.version if previous else None} -> {candidate.version}")
+        return {
+            "previous_version": previous.version if previous else None,
+            "active_version": candidate.version,
+            "backend": candidate.backend,
+            "path": path,
+            "load_s": round(loaded - started, 3),
+            "warm_up_s": round(warmed - loaded, 3),
+        }
+    finally:
+        _reload_lock.release()
+
+
+def configure_cloudinary():
+    global _cloudinary_configured
+    if _cloudinary_configured:
+        return
+    import cloudinary
+    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+    api_key = os.getenv("CLOUDINARY_API_KEY")
+    api_secret = os.getenv("CLOUDINARY_API_SECRET")
+    if not all([cloud_name, api_key, api_secret]):
+        raise ValueError("CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET environment variables are required")
+    cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+    from .outbound import pool_cloudinary
+    pool_cloudinary()
+    _cloudinary_configured = True
+
+class AudioRequest(Request):
+    """Keeps multipart uploads in memory, spilling to an unlinked temp file only past the spool threshold"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from .audio_io import spooled_buffer
+        return spooled_buffer()
 
 def create_app():
+    # The inference service fails fast on missing configuration and loads its
+    # models before taking traffic instead of on the first request
+    get_client()
+    configure_cloudinary()
+    get_model()
+    from .report_generation import get_vggish
+    get_vggish()
+
     app = Flask(__name__)
+    app.request_class = AudioRequest
     app.config['SECRET_KEY'] = "123"
 
     from .audio_bp import audio_bp
@@ -0,0 +1,164 @@
+# Admission control for the analysis endpoint.
+# Every admitted request holds VGGish, librosa and PDF work in memory at once, so
+# only MAX_IN_FLIGHT run at a time, a few more wait briefly, and the rest are shed
+# straight away with Retry-After instead of piling up until the process is OOM-killed.
+import math
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from flask import request, jsonify, g
+from app.resources import EXPECTED_CONCURRENCY
+
+MAX_IN_FLIGHT = max(1, int(os.getenv("MAX_IN_FLIGHT", str(EXPECTED_CONCURRENCY))))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", "8"))                  # Standard requests allowed to wait
+MAX_PRIORITY_QUEUE = int(os.getenv("MAX_PRIORITY_QUEUE", "8"))  # Paid requests allowed to wait
+QUEUE_TIMEOUT_S = float(os.getenv("QUEUE_TIMEOUT_S", "5"))
+RETRY_AFTER_S = int(os.getenv("RETRY_AFTER_S", "5"))
+
+PRIORITY_HEADER = "X-Request-Priority"
+STANDARD = "standard"
+PRIORITY = "priority"
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Bounded in-flight limit with two FIFO wait queues. A freed slot is handed
+    directly to the oldest priority waiter, then to the oldest standard one.
+    """
+    def __init__(self, max_in_flight, max_queue, max_priority_queue, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.queue_limits = {STANDARD: max_queue, PRIORITY: max_priority_queue}
+        self.queues = {STANDARD: deque(), PRIORITY: deque()}
+        self.in_flight = 0
+        self.admitted = {STANDARD: 0, PRIORITY: 0}
+        self.shed = {"queue_full": 0, "queue_timeout": 0}
+        self._lock = threading.Lock()
+
+    def _ahead_of(self, lane):
+        """Waiters that must be served before a new request in `lane`"""
+        if lane == PRIORITY:
+            return len(self.queues[PRIORITY])
+        return len(self.queues[PRIORITY]) + len(self.queues[STANDARD])
+
+    def acquire(self, lane):
+        """Returns None once admitted, or the shed reason ('queue_full' / 'queue_timeout')"""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and self._ahead_of(lane) == 0:
+                self.in_flight += 1
+                self.admitted[lane] += 1
+                return None
+            if len(self.queues[lane]) >= self.queue_limits[lane]:
+                self.shed["queue_full"] += 1
+                return "queue_full"
+            waiter = _Waiter()
+            self.queues[lane].append(waiter)
+
+        waiter.event.wait(self.queue_timeout)
+
+        with self._lock:
+            if waiter.granted:
+                # The releasing request passed its slot on; in_flight was not decremented
+                self.admitted[lane] += 1
+                return None
+            self.queues[lane].remove(waiter)
+            self.shed["queue_timeout"] += 1
+            return "queue_timeout"
+
+    def release(self):
+        with self._lock:
+            for lane in (PRIORITY, STANDARD):
+                if self.queues[lane]:
+                    waiter = self.queues[lane].popleft()
+                    waiter.granted = True
+                    waiter.event.set()
+                    return
+            self.in_flight -= 1
+
+    def retry_after(self):
+        """Seconds a shed client should wait, growing with the backlog"""
+        with self._lock:
+            backlog = sum(len(queue) for queue in self.queues.values())
+        return RETRY_AFTER_S * (1 + math.ceil(backlog / self.max_in_flight))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queue_depth": {lane: len(queue) for lane, queue in self.queues.items()},
+                "admitted_total": dict(self.admitted),
+                "shed_total": dict(self.shed),
+            }
+
+
+analysis_admission = AdmissionController(MAX_IN_FLIGHT, MAX_QUEUE, MAX_PRIORITY_QUEUE, QUEUE_TIMEOUT_S)
+
+
+def request_lane():
+    """Paid requests are marked by the Node server with X-Request-Priority: paid"""
+    return PRIORITY if request.headers.get(PRIORITY_HEADER, "").lower() == "paid" else STANDARD
+
+
+def admission_controlled(controller):
+    """Route decorator: run the view only once the controller admits the request"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Time spent queued counts against the request's deadline (app/tiers.py)
+            g.request_started = time.monotonic()
+            reason = controller.acquire(request_lane())
+            if reason is not None:
+                # 429 when the queue is already full, 503 when the wait ran out
+                status = 429 if reason == "queue_full" else 503
+                response = jsonify({
+                    'error': 'Server is busy, please retry later',
+                    'code': 'OVERLOADED',
+                    'reason': reason
+                })
+                response.status_code = status
+                response.headers["Retry-After"] = str(controller.retry_after())
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.release()
+        return wrapper
+    return decorator
+
+
+def prometheus_metrics(controller, prefix="sparrow_analysis"):
+    """Controller state in the Prometheus text exposition format"""
+    state = controller.snapshot()
+    lines = [
+        f"# HELP {prefix}_in_flight Analysis requests currently running",
+        f"# TYPE {prefix}_in_flight gauge",
+        f"{prefix}_in_flight {state['in_flight']}",
+        f"# HELP {prefix}_max_in_flight Configured in-flight limit",
+        f"# TYPE {prefix}_max_in_flight gauge",
+        f"{prefix}_max_in_flight {state['max_in_flight']}",
+        f"# HELP {prefix}_queue_depth Requests waiting for a slot",
+        f"# TYPE {prefix}_queue_depth gauge",
+    ]
+    lines += [f'{prefix}_queue_depth{{lane="{lane}"}} {depth}' for lane, depth in state["queue_depth"].items()]
+    lines += [
+        f"# HELP {prefix}_admitted_total Requests admitted",
+        f"# TYPE {prefix}_admitted_total counter",
+    ]
+    lines += [f'{prefix}_admitted_total{{lane="{lane}"}} {count}' for lane, count in state["admitted_total"].items()]
+    lines += [
+        f"# HELP {prefix}_shed_total Requests rejected by admission control",
+        f"# TYPE {prefix}_shed_total counter",
+    ]
+    lines += [f'{prefix}_shed_total{{reason="{reason}"}} {count}' for reason, count in state["shed_total"].items()]
+    return "\n".join(lines) + "\n"
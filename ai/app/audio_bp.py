@@ -1,29 +1,29 @@
+import hmac
 import os
-import numpy as np
-import tensorflow as tf
-from flask import Blueprint, request, jsonify, send_file
+import tempfile
+import uuid
+from flask import Blueprint, request, jsonify, make_response, g
+from flask_sock import Sock
 from typing import List, Dict
-import tensorflow as tf
-import tensorflow_hub as hub
-import librosa
-from app import client, model
-from datetime import datetime
-import json
-from fpdf import FPDF
-import cloudinary.uploader
-from flask import make_response
+from app import get_model, reload_model, ModelReloadInProgress
 from werkzeug.utils import secure_filename
-from datetime import datetime
 from app.report_generation import process_audio
+from app.audio_io import SUPPORTED_EXTENSIONS
+from app.resources import effective_settings
+from app.quality_gate import AudioQualityError
+from app.admission import RETRY_AFTER_S, analysis_admission, admission_controlled, prometheus_metrics
+from app.memory import MemoryBudgetExceeded, analysis_memory, prometheus_memory_metrics
+from app.outbound import DependencyUnavailable, cloudinary_upload, groq_chat, prometheus_outbound_metrics
+from app.profiling import profiled, profiling_authorised, load_profile
+from app.results import encode_response, recent_diagnostics
+from app.shadow import shadow_summary
+from app.streaming import serve_stream
+from app.tiers import DEADLINE_HEADER, Budget, parse_tier, timed_stage
 
 # Configure upload settings
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'wav'}
+ALLOWED_EXTENSIONS = SUPPORTED_EXTENSIONS  # wav plus compressed formats decoded in-process
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
 
-# Create upload folder if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 CHATBOT_SYSTEM_PROMPT = {
     "role":"system",
     "content": (
@@ -35,16 +35,8 @@ CHATBOT_SYSTEM_PROMPT = {
     )
 }
 
-label_mapping = {
-    0: "Healthy",
-    1: "Laryngitis",
-    2: "Vocal Polyp"
-}
-
-vggish_model_url = "https://tfhub.dev/google/vggish/1"
-vggish_model = hub.load(vggish_model_url)
-
 audio_bp = Blueprint("audio", __name__)
+sock = Sock()
 
 conversation_history: List[Dict[str, str]] = [CHATBOT_SYSTEM_PROMPT]
 MAX_HISTORY = 10
@@ -61,7 +53,7 @@ def get_response(user_input: str) -> str:
     conversation_history.append({"role": "user", "content": user_input})
     trim_conversation_history()
 
-    completion = client.chat.completions.create(
+    completion = groq_chat(
         model="mixtral-8x7b-32768",
         messages=conversation_history,
         temperature=1,
@@ -84,13 +76,21 @@ def chat():
     if not user_input:
         return jsonify({"error": "Message cannot be empty"}), 400
 
-    response_text = get_response(user_input)
+    try:
+        response_text = get_response(user_input)
+    except DependencyUnavailable as e:
+        response = jsonify({"error": "The assistant is temporarily unavailable, please retry later",
+                            "code": "DEPENDENCY_UNAVAILABLE", "dependency": e.dependency, "reason": e.reason})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 503
     return jsonify({"response": response_text})
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @audio_bp.route('/process_audio', methods=['POST'])
+@admission_controlled(analysis_admission)
+@profiled
 def analyze_voice():
     try:
         if 'audio' not in request.files:
@@ -105,62 +105,169 @@ def analyze_voice():
             return jsonify({'error': 'File type not allowed'}), 400
         
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-        file.save(filepath)
+        extension = filename.rsplit('.', 1)[1].lower()
+        # One PDF per request so concurrently admitted analyses don't overwrite each other
+        pdf_path = os.path.join(tempfile.gettempdir(), f"medical_report_{uuid.uuid4().hex}.pdf")
+
+        # fast = prediction only, standard = + rule-based findings, full = + LLM report and PDF
+        try:
+            tier = parse_tier(request.form.get('tier') or request.args.get('tier'))
+            budget = Budget.from_header(request.headers.get(DEADLINE_HEADER), g.get('request_started'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         try:
-            json_report = process_audio(filepath)
-            report_data = json.loads(json_report)
-
-            pdf_path = 'medical_report.pdf'
-            if not os.path.exists(pdf_path):
-                return jsonify({'error': 'PDF report not generated'}), 500
-
-            cloudinary_response = cloudinary.uploader.upload(pdf_path, resource_type="raw")
-            pdf_url = cloudinary_response.get("secure_url")
-            if not pdf_url:
-                return jsonify({'error': 'Failed to upload PDF to Cloudinary'}), 500
-
-            # ✅ Modify JSON structure to match the required format
-            formatted_report = {
-                "Acoustic Features": {
-                    "Jitter_Percent": report_data["acoustic_analysis"]["voice_perturbation"]["jitter"]["value"],
-                    "MFCC_Mean": report_data["mfcc_features"]["mean"],
-                    "MFCC_Std": report_data["mfcc_features"]["std"],
-                    "Shimmer_Percent": report_data["acoustic_analysis"]["voice_perturbation"]["shimmer"]["value"]
-                },
-                "Analysis Date": datetime.now().strftime("%Y-%m-%d"),
-                "Confidence Scores": {
-                    "Healthy": report_data["diagnosis"]["confidence_scores"]["Healthy"],
-                    "Laryngitis": report_data["diagnosis"]["confidence_scores"]["Laryngitis"],
-                    "Vocal Polyp": report_data["diagnosis"]["confidence_scores"]["Vocal Polyp"]
-                },
-                "Findings": report_data["detailed_report"],
-                "PDF_URL": pdf_url,
-                "Prediction": report_data["diagnosis"]["predicted_condition"]
-            }
-
-            response = make_response(json.dumps(formatted_report, indent=4))
-            response.content_type = 'application/json'
-            
-            return response
+            # Decode straight from the upload stream; nothing is written to uploads/
+            result = process_audio(file.stream, output_pdf=pdf_path, extension=extension, filename=filename,
+                                   tier=tier, budget=budget, uploads_pdf=True,
+                                   user_id=request.form.get('user_id'))
+
+            pdf_url = None
+            if result.pdf_path:
+                if not os.path.exists(pdf_path):
+                    return jsonify({'error': 'PDF report not generated'}), 500
+
+                with timed_stage("upload"):
+                    upload_budget = budget.remaining() if budget.deadline is not None else None
+                    cloudinary_response = cloudinary_upload(pdf_path, budget=upload_budget, resource_type="raw")
+                pdf_url = cloudinary_response.get("secure_url")
+                if not pdf_url:
+                    return jsonify({'error': 'Failed to upload PDF to Cloudinary'}), 500
+            result.execution_tier["elapsed_ms"] = budget.elapsed_ms()
+            recent_diagnostics.append(result.diagnostics())
+
+            # Serialized once, as compact JSON or msgpack per the Accept header
+            detail = (request.form.get('detail') or request.args.get('detail')) == 'full'
+            return encode_response(result.to_response(pdf_url, detail=detail))
             
+        except AudioQualityError as e:
+            # Nothing expensive ran; the Node server uses the code to refund the credit
+            return jsonify({
+                'error': str(e),
+                'code': 'AUDIO_QUALITY_REJECTED',
+                'reasons': e.report['reasons'],
+                'audio_quality': e.report
+            }), 422
+
+        except MemoryBudgetExceeded as e:
+            if e.oversize:
+                # Too long to analyse within MEMORY_REQUEST_LIMIT_MB under the reject policy
+                return jsonify({
+                    'error': str(e),
+                    'code': 'RECORDING_TOO_LONG',
+                    'estimated_mb': round(e.estimated_mb),
+                    'limit_mb': round(e.limit_mb)
+                }), 413
+            # Other analyses hold the memory budget; shed like admission control does
+            response = jsonify({'error': str(e), 'code': 'OVERLOADED', 'reason': 'memory'})
+            response.headers["Retry-After"] = str(RETRY_AFTER_S)
+            return response, 503
+
+        except DependencyUnavailable as e:
+            # Cloudinary's breaker is open or its bulkhead is full; shed so the credit is refunded
+            response = jsonify({'error': str(e), 'code': 'OVERLOADED', 'reason': e.dependency})
+            response.headers["Retry-After"] = str(e.retry_after or RETRY_AFTER_S)
+            return response, 503
+
         except Exception as e:
             return jsonify({'error': f'Error processing audio: {str(e)}'}), 500
         
         finally:
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            file.close()
             if os.path.exists(pdf_path):
                 os.remove(pdf_path)
-            if os.path.exists("medical_report.json"):
-                os.remove("medical_report.json")
             
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@audio_bp.route("/diagnostics/resources", methods=["GET"])
+def resource_diagnostics():
+    """Effective thread pool sizes and CPU affinity of this process."""
+    return jsonify(effective_settings())
+
+@audio_bp.route("/diagnostics/analyses", methods=["GET"])
+def analysis_diagnostics():
+    """Delivered tier, stage timings and memory of the most recent analyses, newest first (?id= picks one)."""
+    analysis_id = request.args.get("id")
+    records = [record for record in reversed(recent_diagnostics)
+               if analysis_id is None or record["analysis_id"] == analysis_id]
+    if analysis_id is not None and not records:
+        return jsonify({'error': 'Analysis not found'}), 404
+    return jsonify(records[0] if analysis_id is not None else records)
+
+@audio_bp.route("/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    """Stored profile of a request run with X-Profile (collapsed stacks or cProfile summary)."""
+    if not profiling_authorised():
+        return jsonify({'error': 'Profiling requires a valid profiling token'}), 403
+    profile = load_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    text, mode = profile
+    response = make_response(text)
+    response.content_type = 'text/plain; charset=utf-8'
+    response.headers["X-Profile-Mode"] = mode
+    return response
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Reloads may only point at model directories under here
+MODEL_ROOT = os.path.realpath(os.getenv("MODEL_ROOT", "app"))
+MODEL_BACKENDS = ("savedmodel", "tflite-fp16", "tflite-int8")
+
+def admin_authorised():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@audio_bp.route("/admin/model", methods=["GET"])
+def active_model():
+    """Version and backend of the classifier serving new requests."""
+    if not admin_authorised():
+        return jsonify({'error': 'Admin token required'}), 403
+    model = get_model()
+    return jsonify({'version': model.version, 'backend': model.backend})
+
+@audio_bp.route("/admin/shadow", methods=["GET"])
+def shadow_stats():
+    """Agreement, confusion and latency of the shadow candidates against the primary classifier."""
+    if not admin_authorised():
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify(shadow_summary())
+
+@audio_bp.route("/admin/reload-model", methods=["POST"])
+def reload_classifier():
+    """Load, warm up and atomically swap in a new classifier without dropping in-flight requests."""
+    if not admin_authorised():
+        return jsonify({'error': 'Admin token required'}), 403
+
+    data = request.get_json(silent=True) or {}
+    path = data.get("path")
+    if path and os.path.commonpath([os.path.realpath(path), MODEL_ROOT]) != MODEL_ROOT:
+        return jsonify({'error': f'Model path must be under {MODEL_ROOT}'}), 400
+    backend = data.get("backend")
+    if backend and backend not in MODEL_BACKENDS:
+        return jsonify({'error': f"backend must be one of {', '.join(MODEL_BACKENDS)}"}), 400
+
+    try:
+        return jsonify(reload_model(path, backend))
+    except ModelReloadInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        # The active model is untouched when loading or warming up the new one fails
+        return jsonify({'error': f'Model reload failed: {str(e)}'}), 500
+
+@audio_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Admission control, memory budget and outbound dependency gauges and counters for Prometheus."""
+    response = make_response(prometheus_metrics(analysis_admission) + prometheus_memory_metrics(analysis_memory)
+                             + prometheus_outbound_metrics())
+    response.content_type = 'text/plain; version=0.0.4'
+    return response
+
+@sock.route("/stream", bp=audio_bp)
+def stream_features(ws):
+    """WebSocket: PCM chunks in, rolling f0/jitter/shimmer/HNR/RMS updates out (see app.streaming)."""
+    serve_stream(ws)
+
 # ✅ Error handler for file too large
 @audio_bp.errorhandler(413)
 def too_large(e):
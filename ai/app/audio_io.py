@@ -0,0 +1,100 @@
+import os
+import subprocess
+import tempfile
+import numpy as np
+import soundfile as sf
+import soxr
+
+# Sample rate used by VGGish and every librosa feature in the pipeline
+TARGET_SR = 16000
+
+# Formats libsndfile reads natively (OGG/Opus and MP3 need libsndfile >= 1.1)
+SOUNDFILE_EXTENSIONS = {'wav', 'flac', 'ogg', 'opus', 'mp3'}
+# Containers libsndfile can't open; decoded by ffmpeg straight into memory
+FFMPEG_EXTENSIONS = {'m4a', 'mp4', 'aac', 'webm'}
+SUPPORTED_EXTENSIONS = SOUNDFILE_EXTENSIONS | FFMPEG_EXTENSIONS
+
+# Uploads up to this size stay in memory; larger ones spill to an anonymous temp file
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(8 * 1024 * 1024)))
+
+
+def get_extension(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def spooled_buffer():
+    """In-memory buffer that rolls over to an unlinked temp file past UPLOAD_SPOOL_THRESHOLD"""
+    return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='w+b')
+
+
+def _decode_soundfile(source):
+    """Decode a path or file object with libsndfile and downmix to mono float32"""
+    data, sr = sf.read(source, dtype='float32', always_2d=True)
+    return data.mean(axis=1), sr
+
+
+def _decode_ffmpeg(source, sr, extension=''):
+    """Decode with ffmpeg, resampled to `sr`, reading raw float PCM from a pipe"""
+    if not isinstance(source, str):
+        # MP4-style containers need a seekable input, which stdin isn't, so
+        # buffers are handed to ffmpeg through a temp file that's removed on close
+        with tempfile.NamedTemporaryFile(suffix=f'.{extension}' if extension else '') as tmp:
+            source.seek(0)
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+            tmp.flush()
+            return _decode_ffmpeg(tmp.name, sr)
+
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error',
+        '-i', source,
+        '-f', 'f32le', '-ac', '1', '-ar', str(sr),
+        'pipe:1'
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg is required to decode this audio format")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg could not decode audio: {e.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32), sr
+
+
+def load_audio(audio, sr=TARGET_SR, extension=None, return_source_sr=False):
+    """
+    Decode an audio file to a mono float32 waveform at `sr`.
+    `audio` may be a path or a seekable file object such as an upload stream.
+    WAV, FLAC, OGG/Opus and MP3 are decoded in-process; M4A/AAC go through ffmpeg.
+    Arrays are passed through unchanged so callers can hand in an already decoded waveform.
+    With `return_source_sr` the file's own sample rate is returned as a third value
+    (None when ffmpeg did the resampling).
+    """
+    if isinstance(audio, np.ndarray):
+        return (audio, sr, sr) if return_source_sr else (audio, sr)
+
+    if extension is None:
+        name = audio if isinstance(audio, str) else getattr(audio, 'name', None)
+        extension = get_extension(name) if isinstance(name, str) else ''
+    if not isinstance(audio, str):
+        audio.seek(0)
+
+    source_sr = None
+    if extension in FFMPEG_EXTENSIONS:
+        y, orig_sr = _decode_ffmpeg(audio, sr, extension)
+    else:
+        try:
+            y, orig_sr = _decode_soundfile(audio)
+            source_sr = orig_sr
+        except RuntimeError:
+            # soundfile's LibsndfileError; older libsndfile builds or unusual encodings
+            y, orig_sr = _decode_ffmpeg(audio, sr, extension)
+
+    if orig_sr != sr:
+        # Same resampler librosa.load uses by default (soxr_hq)
+        y = soxr.resample(y, orig_sr, sr, quality='HQ')
+
+    y = np.ascontiguousarray(y, dtype=np.float32)
+    return (y, sr, source_sr) if return_source_sr else (y, sr)
@@ -0,0 +1,121 @@
+import numpy as np
+from scipy.signal import resample_poly
+
+# Frame-wise LPC formant tracking: the signal is resampled to twice the formant
+# ceiling (as Praat does), and the pre-emphasised signal is cut into short
+# windowed frames, LPC coefficients are solved for all frames at once (batched
+# autocorrelation + Levinson-Durbin), and the poles of every frame come from one
+# batched eigenvalue call on the companion matrices. F1-F3 are the lowest
+# narrow-band poles of each voiced frame, summarised with medians and IQRs so
+# stray frames (consonants, breath, octave slips) don't move the result.
+
+FORMANT_CEILING_HZ = 5000   # F1-F3 of adult voices lie below this; LPC runs at twice it
+FRAME_S = 0.025             # 25 ms analysis frames
+HOP_S = 0.010               # every 10 ms
+N_FORMANTS = 3
+MIN_FORMANT_HZ = 90.0       # Poles below this are spectral tilt, not resonances
+MAX_BANDWIDTH_HZ = 400.0    # Wider poles shape the envelope but aren't formants
+MIN_RELATIVE_DB = -40.0     # Frames this far below the loudest are treated as silence
+DEFAULT_F1_HZ = 500.0       # Reported when no frame yields a formant
+
+
+def lpc_order(sr):
+    return int(2 + sr / 1000)
+
+
+def frame_signal(y, sr):
+    """Pre-emphasised, Hamming-windowed frames (n_frames, frame_length) and the hop"""
+    frame_length = int(round(FRAME_S * sr))
+    hop = int(round(HOP_S * sr))
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) < frame_length:
+        return np.empty((0, frame_length)), hop
+    emphasised = np.append(y[0], y[1:] - 0.97 * y[:-1])
+    n_frames = 1 + (len(emphasised) - frame_length) // hop
+    frames = np.lib.stride_tricks.sliding_window_view(emphasised, frame_length)[::hop][:n_frames]
+    return frames * np.hamming(frame_length), hop
+
+
+def batch_lpc(frames, order):
+    """
+    LPC coefficients [1, a1, ..., ap] of every frame (rows), by autocorrelation and
+    Levinson-Durbin. The recursion runs over the order; each step is vectorised
+    across frames, so the cost is O(frames * order^2) on top of one batched FFT.
+    """
+    n_frames, frame_length = frames.shape
+    n_fft = 1 << int(np.ceil(np.log2(2 * frame_length)))
+    spectrum = np.fft.rfft(frames, n=n_fft, axis=1)
+    r = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=n_fft, axis=1)[:, :order + 1]
+    r[:, 0] *= 1.0 + 1e-9  # White-noise correction keeps the recursion stable
+
+    a = np.zeros((n_frames, order + 1))
+    a[:, 0] = 1.0
+    error = r[:, 0].copy()
+    for i in range(1, order + 1):
+        reflection = -np.einsum("ij,ij->i", a[:, :i], r[:, i:0:-1]) / error
+        a[:, 1:i] = a[:, 1:i] + reflection[:, None] * a[:, i - 1:0:-1]
+        a[:, i] = reflection
+        error *= 1.0 - reflection ** 2
+    return a
+
+
+def batch_poles(a):
+    """Roots of every frame's LPC polynomial, as eigenvalues of its companion matrix"""
+    n_frames, order = a.shape[0], a.shape[1] - 1
+    companion = np.zeros((n_frames, order, order))
+    companion[:, 0, :] = -a[:, 1:]
+    companion[:, np.arange(1, order), np.arange(order - 1)] = 1.0
+    return np.linalg.eigvals(companion)
+
+
+def track_formants(y, sr, voiced_flag=None, voicing_hop=None, n_formants=N_FORMANTS):
+    """
+    F1..Fn per analysed frame, shape (n_frames, n_formants), NaN where a frame has
+    fewer formants. Only voiced frames are analysed: `voiced_flag` is a frame-level
+    voicing track (e.g. pyin's) with hop `voicing_hop`; without one, frames within
+    MIN_RELATIVE_DB of the loudest are used.
+    """
+    analysis_sr = 2 * int(FORMANT_CEILING_HZ)
+    if sr > analysis_sr:
+        gcd = np.gcd(int(sr), analysis_sr)
+        y = resample_poly(np.asarray(y, dtype=np.float64), analysis_sr // gcd, int(sr) // gcd)
+        if voicing_hop is not None:
+            voicing_hop = voicing_hop * analysis_sr / sr
+        sr = analysis_sr
+
+    frames, hop = frame_signal(y, sr)
+    if not len(frames):
+        return np.empty((0, n_formants))
+
+    energy = np.einsum("ij,ij->i", frames, frames)
+    keep = energy > energy.max() * 10 ** (MIN_RELATIVE_DB / 10)
+    if voiced_flag is not None and len(voiced_flag):
+        centres = np.arange(len(frames)) * hop + frames.shape[1] // 2
+        voicing = np.asarray(voiced_flag, dtype=bool)
+        keep &= voicing[np.minimum(np.rint(centres / voicing_hop).astype(int), len(voicing) - 1)]
+    if not keep.any():
+        return np.empty((0, n_formants))
+
+    poles = batch_poles(batch_lpc(frames[keep], lpc_order(sr)))
+    freqs = np.angle(poles) * (sr / (2 * np.pi))
+    bandwidths = -np.log(np.maximum(np.abs(poles), 1e-12)) * (sr / np.pi)
+    valid = ((poles.imag > 0) & (freqs > MIN_FORMANT_HZ) & (freqs < sr / 2 - MIN_FORMANT_HZ)
+             & (bandwidths < MAX_BANDWIDTH_HZ))
+    formants = np.sort(np.where(valid, freqs, np.inf), axis=1)[:, :n_formants]
+    formants[np.isinf(formants)] = np.nan
+    return formants
+
+
+def formant_summary(y, sr, voiced_flag=None, voicing_hop=None, n_formants=N_FORMANTS):
+    """Median and interquartile range of each formant over the voiced frames, in Hz"""
+    formants = track_formants(y, sr, voiced_flag, voicing_hop, n_formants)
+    summary = {"frames": int(len(formants))}
+    for k in range(n_formants):
+        track = formants[:, k] if len(formants) else np.empty(0)
+        track = track[np.isfinite(track)]
+        if len(track):
+            q25, median, q75 = np.percentile(track, [25, 50, 75])
+            summary[f"f{k + 1}"] = {"median": float(median), "iqr": float(q75 - q25)}
+        else:
+            summary[f"f{k + 1}"] = {"median": DEFAULT_F1_HZ if k == 0 else 0.0, "iqr": 0.0}
+    return summary
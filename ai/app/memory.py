@@ -0,0 +1,213 @@
+# Per-request memory accounting and the analysis memory budget.
+# Every request records the RSS change of each pipeline stage; a sampled share of
+# requests (MEMORY_TRACE_PERCENT) also runs under tracemalloc for exact Python and
+# numpy peak allocations per stage. TensorFlow allocates outside tracemalloc's
+# view, which is what the RSS deltas are for.
+# Before the feature stages run, a request reserves its estimated footprint
+# (samples x MEMORY_BYTES_PER_SAMPLE) against MEMORY_BUDGET_MB, shared by all
+# analyses in flight. A recording too big to ever fit is truncated or rejected
+# (MEMORY_OVERSIZE_POLICY); one that only doesn't fit right now is shed.
+import os
+import random
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+MEMORY_TRACE_PERCENT = float(os.getenv("MEMORY_TRACE_PERCENT", "0"))
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "0"))            # 0 = no budget
+MEMORY_REQUEST_LIMIT_MB = float(os.getenv("MEMORY_REQUEST_LIMIT_MB", "0"))  # 0 = MEMORY_BUDGET_MB
+MEMORY_OVERSIZE_POLICY = os.getenv("MEMORY_OVERSIZE_POLICY", "truncate")  # or "reject"
+# Peak bytes per 16 kHz sample measured across the feature stages (pyin and HPSS
+# dominate at ~150 and ~125) plus the waveform, STFT and embeddings held alongside
+MEMORY_BYTES_PER_SAMPLE = float(os.getenv("MEMORY_BYTES_PER_SAMPLE", "200"))
+MEMORY_BASE_MB = float(os.getenv("MEMORY_BASE_MB", "40"))  # Per-request cost independent of length
+
+MB = 1024 * 1024
+TRUNCATE = "truncate"
+REJECT = "reject"
+
+# tracemalloc is process-wide, so only one request is traced at a time
+_trace_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident set size of this process (0 where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def estimate_footprint_mb(n_samples):
+    return MEMORY_BASE_MB + n_samples * MEMORY_BYTES_PER_SAMPLE / MB
+
+
+def samples_within(limit_mb):
+    """Longest recording (in samples) whose estimated footprint fits `limit_mb`"""
+    return max(0, int((limit_mb - MEMORY_BASE_MB) * MB / MEMORY_BYTES_PER_SAMPLE))
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """
+    The request's estimated footprint doesn't fit. `oversize` means it never
+    could (the recording alone exceeds the per-request limit); otherwise the
+    budget is taken by other analyses and a retry may succeed.
+    """
+    def __init__(self, estimated_mb, limit_mb, oversize):
+        self.estimated_mb = estimated_mb
+        self.limit_mb = limit_mb
+        self.oversize = oversize
+        if oversize:
+            message = f"Recording needs an estimated {estimated_mb:.0f} MB, over the {limit_mb:.0f} MB per-request limit"
+        else:
+            message = f"Not enough memory budget for another analysis ({estimated_mb:.0f} MB needed)"
+        super().__init__(message)
+
+
+class MemoryBudget:
+    """Estimated megabytes reserved by the analyses in flight"""
+    def __init__(self, budget_mb, request_limit_mb=0, policy=TRUNCATE):
+        self.budget_mb = budget_mb
+        self.request_limit_mb = request_limit_mb or budget_mb
+        self.policy = policy
+        self.reserved_mb = 0.0
+        self.rejected = {"oversize": 0, "budget": 0}
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def admit(self, y, sr):
+        """
+        Reserve memory for analysing `y`. Returns the (possibly truncated)
+        waveform and the accounting record; pass the record to release().
+        """
+        estimated_mb = estimate_footprint_mb(len(y))
+        record = {"estimated_mb": round(estimated_mb, 1), "reserved_mb": 0.0, "truncated_to_s": None}
+        if not self.budget_mb:
+            return y, record
+
+        if estimated_mb > self.request_limit_mb:
+            keep = samples_within(self.request_limit_mb)
+            if self.policy != TRUNCATE or keep < sr:
+                with self._lock:
+                    self.rejected["oversize"] += 1
+                raise MemoryBudgetExceeded(estimated_mb, self.request_limit_mb, oversize=True)
+            # Analyse the leading part that fits instead of refusing the whole recording
+            y = y[:keep].copy()  # A view would keep the whole recording alive
+            estimated_mb = estimate_footprint_mb(keep)
+            record["truncated_to_s"] = round(keep / sr, 2)
+            with self._lock:
+                self.truncated += 1
+
+        with self._lock:
+            if self.reserved_mb + estimated_mb > self.budget_mb:
+                self.rejected["budget"] += 1
+                raise MemoryBudgetExceeded(estimated_mb, self.budget_mb, oversize=False)
+            self.reserved_mb += estimated_mb
+        record["reserved_mb"] = round(estimated_mb, 1)
+        record["estimated_mb"] = round(estimated_mb, 1)
+        return y, record
+
+    def release(self, record):
+        if record and record["reserved_mb"]:
+            with self._lock:
+                self.reserved_mb = max(0.0, self.reserved_mb - record["reserved_mb"])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "request_limit_mb": self.request_limit_mb,
+                "reserved_mb": round(self.reserved_mb, 1),
+                "rejected_total": dict(self.rejected),
+                "truncated_total": self.truncated,
+            }
+
+
+analysis_memory = MemoryBudget(MEMORY_BUDGET_MB, MEMORY_REQUEST_LIMIT_MB, MEMORY_OVERSIZE_POLICY)
+
+
+class MemoryTracker:
+    """
+    Stage-by-stage memory record of one request. RSS deltas are always taken;
+    when the request is the traced one, each stage also gets its tracemalloc
+    peak (which includes anything other requests allocate meanwhile, so trace
+    at low concurrency for exact per-request figures).
+    """
+    def __init__(self, traced=False):
+        self.traced = traced
+        self.stages = {}
+        self.rss_start = rss_bytes()
+        self.rss_peak = self.rss_start
+        self.traced_peak = 0
+
+    @classmethod
+    def start(cls):
+        traced = (MEMORY_TRACE_PERCENT > 0 and random.random() * 100 < MEMORY_TRACE_PERCENT
+                  and _trace_lock.acquire(blocking=False))
+        if traced:
+            tracemalloc.start()
+        return cls(traced)
+
+    @contextmanager
+    def stage(self, name):
+        before = rss_bytes()
+        if self.traced:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            after = rss_bytes()
+            self.rss_peak = max(self.rss_peak, after)
+            record = {"rss_delta_mb": round((after - before) / MB, 1)}
+            if self.traced:
+                peak = tracemalloc.get_traced_memory()[1] - traced_before
+                self.traced_peak = max(self.traced_peak, peak)
+                record["peak_mb"] = round(peak / MB, 1)
+            self.stages[name] = record
+
+    def finish(self):
+        """Stop tracing (if this request held it) and return the summary"""
+        traced = self.traced
+        if traced:
+            tracemalloc.stop()
+            _trace_lock.release()
+            self.traced = False
+        rss_end = rss_bytes()
+        summary = {
+            "traced": traced,
+            "rss_start_mb": round(self.rss_start / MB, 1),
+            "rss_end_mb": round(rss_end / MB, 1),
+            "rss_peak_mb": round(max(self.rss_peak, rss_end) / MB, 1),
+            "stages": self.stages,
+        }
+        if traced:
+            summary["peak_traced_mb"] = round(self.traced_peak / MB, 1)
+        return summary
+
+
+def prometheus_memory_metrics(budget, prefix="sparrow_analysis"):
+    """Memory budget state and process RSS in the Prometheus text exposition format"""
+    state = budget.snapshot()
+    lines = [
+        f"# HELP {prefix}_memory_reserved_bytes Estimated memory reserved by analyses in flight",
+        f"# TYPE {prefix}_memory_reserved_bytes gauge",
+        f"{prefix}_memory_reserved_bytes {int(state['reserved_mb'] * MB)}",
+        f"# HELP {prefix}_memory_budget_bytes Configured memory budget (0 = unlimited)",
+        f"# TYPE {prefix}_memory_budget_bytes gauge",
+        f"{prefix}_memory_budget_bytes {int(state['budget_mb'] * MB)}",
+        f"# HELP {prefix}_memory_rejected_total Requests rejected by the memory budget",
+        f"# TYPE {prefix}_memory_rejected_total counter",
+    ]
+    lines += [f'{prefix}_memory_rejected_total{{reason="{reason}"}} {count}'
+              for reason, count in state["rejected_total"].items()]
+    lines += [
+        f"# HELP {prefix}_memory_truncated_total Recordings truncated to fit the per-request limit",
+        f"# TYPE {prefix}_memory_truncated_total counter",
+        f"{prefix}_memory_truncated_total {state['truncated_total']}",
+        "# HELP process_resident_memory_bytes Resident memory size in bytes",
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {rss_bytes()}",
+    ]
+    return "\n".join(lines) + "\n"
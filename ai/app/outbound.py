@@ -0,0 +1,318 @@
+# Outbound calls to Groq and Cloudinary.
+# Each dependency gets its own keep-alive connection pool, timeouts, concurrency
+# bulkhead and circuit breaker, so a slow or failing service only ties up the
+# few threads its bulkhead allows; everyone else fails fast with
+# DependencyUnavailable (chat and uploads answer 503, the LLM report falls back
+# to the rule-based analysis). Transient failures (connection errors, timeouts,
+# 429, 5xx) are retried with full-jitter exponential backoff inside the call's
+# overall time budget; client errors (bad key, bad request) are not. Only a
+# real answer from the service (a 4xx) counts as the service being healthy;
+# any other exception says nothing about it and leaves the breaker alone.
+import os
+import random
+import threading
+import time
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))    # Consecutive failures that open a breaker
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", "30"))   # Open time before a trial call
+RETRY_BASE_S = float(os.getenv("RETRY_BASE_S", "0.5"))
+RETRY_MAX_S = float(os.getenv("RETRY_MAX_S", "8"))
+
+GROQ_TIMEOUT_S = float(os.getenv("GROQ_TIMEOUT_S", "60"))            # Per attempt (read)
+GROQ_CONNECT_TIMEOUT_S = float(os.getenv("GROQ_CONNECT_TIMEOUT_S", "5"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_BULKHEAD_WAIT_S = float(os.getenv("GROQ_BULKHEAD_WAIT_S", "1"))
+GROQ_RETRIES = int(os.getenv("GROQ_RETRIES", "2"))
+GROQ_KEEPALIVE_S = float(os.getenv("GROQ_KEEPALIVE_S", "60"))
+
+CLOUDINARY_TIMEOUT_S = float(os.getenv("CLOUDINARY_TIMEOUT_S", "30"))
+CLOUDINARY_CONNECT_TIMEOUT_S = float(os.getenv("CLOUDINARY_CONNECT_TIMEOUT_S", "5"))
+CLOUDINARY_MAX_CONCURRENCY = int(os.getenv("CLOUDINARY_MAX_CONCURRENCY", "4"))
+CLOUDINARY_BULKHEAD_WAIT_S = float(os.getenv("CLOUDINARY_BULKHEAD_WAIT_S", "2"))
+CLOUDINARY_RETRIES = int(os.getenv("CLOUDINARY_RETRIES", "2"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DependencyUnavailable(RuntimeError):
+    """
+    The call was refused without reaching the dependency: `reason` is
+    'circuit_open' or 'bulkhead_full'. (When the attempts themselves fail, the
+    SDK's own exception from the last attempt is raised.)
+    """
+    def __init__(self, dependency, reason, retry_after=None):
+        self.dependency = dependency
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{dependency} unavailable ({reason})")
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, calls are
+    refused until `reset_timeout` has passed; then a single trial call is let
+    through, which closes the breaker on success and reopens it on failure.
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+
+    def would_allow(self):
+        """What allow() would answer right now, without starting a trial call"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self._trial_running
+
+    def cancel_trial(self):
+        """The allowed call never reached the dependency"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened_total += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class Dependency:
+    """
+    Bulkhead, breaker and retry policy for one external service. `transient`
+    decides which exceptions are worth retrying and count against the breaker;
+    `client_error` which ones are the service rejecting the request, which
+    shows it is up.
+    """
+    def __init__(self, name, timeout, max_concurrency, bulkhead_wait, retries, transient, client_error):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.bulkhead_wait = bulkhead_wait
+        self.retries = retries
+        self.transient = transient
+        self.client_error = client_error
+        self.breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_S)
+        self.in_flight = 0
+        self.calls = {"ok": 0, "failed": 0, "circuit_open": 0, "bulkhead_full": 0}
+        self.retried = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def _count(self, outcome):
+        with self._lock:
+            self.calls[outcome] += 1
+
+    def call(self, fn, budget=None):
+        """
+        Run `fn(timeout)` under this dependency's policies. `timeout` is the
+        per-attempt limit: the configured timeout, cut down to what is left of
+        `budget` (seconds for all attempts together, e.g. a request deadline).
+        """
+        deadline = time.monotonic() + budget if budget is not None else None
+        if not self.breaker.allow():
+            self._count("circuit_open")
+            raise DependencyUnavailable(self.name, "circuit_open", self.breaker.retry_after())
+        if not self._slots.acquire(timeout=self.bulkhead_wait):
+            self._count("bulkhead_full")
+            self.breaker.cancel_trial()
+            raise DependencyUnavailable(self.name, "bulkhead_full", 1)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            for attempt in range(self.retries + 1):
+                timeout = self.timeout
+                if deadline is not None:
+                    timeout = max(0.1, min(timeout, deadline - time.monotonic()))
+                try:
+                    result = fn(timeout)
+                except Exception as e:
+                    if not self.transient(e):
+                        if self.client_error(e):
+                            # The service answered; the request itself was wrong
+                            self.breaker.record_success()
+                        else:
+                            # Failed on our side (a bug, a missing file) before or after
+                            # reaching the service: no evidence either way
+                            self.breaker.cancel_trial()
+                        self._count("failed")
+                        raise
+                    self.breaker.record_failure()
+                    backoff = random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * 2 ** attempt))
+                    out_of_time = deadline is not None and time.monotonic() + backoff >= deadline
+                    if attempt == self.retries or out_of_time or self.breaker.state == OPEN:
+                        self._count("failed")
+                        raise
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(backoff)
+                    continue
+                self.breaker.record_success()
+                self._count("ok")
+                return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def available(self):
+        """Whether a call made now would get past the breaker and find a free bulkhead slot"""
+        with self._lock:
+            free = self.in_flight < self.max_concurrency
+        return free and self.breaker.would_allow()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "breaker": self.breaker.state,
+                "breaker_opened_total": self.breaker.opened_total,
+                "calls_total": dict(self.calls),
+                "retries_total": self.retried,
+            }
+
+
+def _groq_transient(e):
+    from groq import APIConnectionError, APIStatusError
+    if isinstance(e, APIConnectionError):  # Includes APITimeoutError
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code == 429 or e.status_code >= 500)
+
+
+def _groq_client_error(e):
+    from groq import APIStatusError
+    return isinstance(e, APIStatusError) and 400 <= e.status_code < 500 and e.status_code != 429
+
+
+def _cloudinary_transient(e):
+    from cloudinary.exceptions import Error, GeneralError, RateLimited
+    # A bare Error is a socket, HTTP or response-parsing failure
+    return isinstance(e, (GeneralError, RateLimited)) or type(e) is Error
+
+
+def _cloudinary_client_error(e):
+    from cloudinary.exceptions import AlreadyExists, AuthorizationRequired, BadRequest, NotAllowed, NotFound
+    # The 4xx answers the SDK maps to their own exception types
+    return isinstance(e, (BadRequest, AuthorizationRequired, NotAllowed, NotFound, AlreadyExists))
+
+
+groq_calls = Dependency("groq", GROQ_TIMEOUT_S, GROQ_MAX_CONCURRENCY, GROQ_BULKHEAD_WAIT_S,
+                        GROQ_RETRIES, _groq_transient, _groq_client_error)
+cloudinary_calls = Dependency("cloudinary", CLOUDINARY_TIMEOUT_S, CLOUDINARY_MAX_CONCURRENCY,
+                              CLOUDINARY_BULKHEAD_WAIT_S, CLOUDINARY_RETRIES, _cloudinary_transient,
+                              _cloudinary_client_error)
+dependencies = (groq_calls, cloudinary_calls)
+
+
+def groq_client_options():
+    """Groq() keyword arguments: a keep-alive pool sized to the bulkhead, timeouts, no SDK retries"""
+    import httpx
+    from groq import DefaultHttpxClient
+    limits = httpx.Limits(max_connections=GROQ_MAX_CONCURRENCY,
+                          max_keepalive_connections=GROQ_MAX_CONCURRENCY,
+                          keepalive_expiry=GROQ_KEEPALIVE_S)
+    return {
+        "timeout": httpx.Timeout(GROQ_TIMEOUT_S, connect=GROQ_CONNECT_TIMEOUT_S),
+        "max_retries": 0,  # Retried here, where the breaker and the deadline can see it
+        "http_client": DefaultHttpxClient(limits=limits),
+    }
+
+
+def pool_cloudinary():
+    """
+    Give the Cloudinary uploader a keep-alive pool that holds a connection per
+    bulkhead slot. The SDK's own pool keeps one per host, so concurrent uploads
+    used to open (and throw away) a fresh TLS connection each time.
+    """
+    import cloudinary.uploader
+    from cloudinary import utils
+    from urllib3 import Timeout
+    options = dict(cloudinary.CERT_KWARGS, maxsize=CLOUDINARY_MAX_CONCURRENCY,
+                   timeout=Timeout(connect=CLOUDINARY_CONNECT_TIMEOUT_S, read=CLOUDINARY_TIMEOUT_S))
+    cloudinary.uploader._http = utils.get_http_connector(cloudinary.config(), options)
+
+
+def groq_chat(budget=None, **kwargs):
+    """chat.completions.create through the Groq bulkhead, breaker and retries"""
+    from app import get_client
+    return groq_calls.call(lambda timeout: get_client().chat.completions.create(timeout=timeout, **kwargs), budget)
+
+
+def cloudinary_upload(path, budget=None, **options):
+    """cloudinary.uploader.upload through the Cloudinary bulkhead, breaker and retries"""
+    import cloudinary.uploader
+    from urllib3 import Timeout
+
+    def upload(timeout):
+        connect = min(CLOUDINARY_CONNECT_TIMEOUT_S, timeout)
+        return cloudinary.uploader.upload(path, timeout=Timeout(connect=connect, read=timeout), **options)
+    return cloudinary_calls.call(upload, budget)
+
+
+def prometheus_outbound_metrics(prefix="sparrow_outbound"):
+    """Bulkhead, breaker and call outcome state per dependency, Prometheus text format"""
+    states = {dependency.name: dependency.snapshot() for dependency in dependencies}
+    lines = [
+        f"# HELP {prefix}_in_flight Calls currently running against the dependency",
+        f"# TYPE {prefix}_in_flight gauge",
+    ]
+    lines += [f'{prefix}_in_flight{{dependency="{name}"}} {state["in_flight"]}' for name, state in states.items()]
+    lines += [
+        f"# HELP {prefix}_breaker_open 1 while the dependency's circuit breaker is open or half-open",
+        f"# TYPE {prefix}_breaker_open gauge",
+    ]
+    lines += [f'{prefix}_breaker_open{{dependency="{name}"}} {int(state["breaker"] != CLOSED)}'
+              for name, state in states.items()]
+    lines += [
+        f"# HELP {prefix}_breaker_opened_total Times the circuit breaker opened",
+        f"# TYPE {prefix}_breaker_opened_total counter",
+    ]
+    lines += [f'{prefix}_breaker_opened_total{{dependency="{name}"}} {state["breaker_opened_total"]}'
+              for name, state in states.items()]
+    lines += [
+        f"# HELP {prefix}_calls_total Calls by outcome",
+        f"# TYPE {prefix}_calls_total counter",
+    ]
+    lines += [f'{prefix}_calls_total{{dependency="{name}",outcome="{outcome}"}} {count}'
+              for name, state in states.items() for outcome, count in state["calls_total"].items()]
+    lines += [
+        f"# HELP {prefix}_retries_total Attempts retried after a transient failure",
+        f"# TYPE {prefix}_retries_total counter",
+    ]
+    lines += [f'{prefix}_retries_total{{dependency="{name}"}} {state["retries_total"]}' for name, state in states.items()]
+    return "\n".join(lines) + "\n"
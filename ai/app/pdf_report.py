@@ -0,0 +1,357 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from fpdf import FPDF
+from app.resources import pin_process, PDF_CPU_AFFINITY
+
+# Reports are rendered in a small dedicated process pool so FPDF work doesn't
+# hold the GIL on the request threads; 0 renders in-process
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+# FIXED: Updated normal ranges
+NORMAL_RANGES = {
+    'Fundamental_Frequency_Mean': {
+        'male': (85, 180),      # Hz
+        'female': (165, 255),   # Hz
+        'default': (85, 255)    # Hz
+    },
+    'Fundamental_Frequency_Std': (0, 20),     # Hz
+    'Jitter_Percent': (0, 1.04),              # % (corrected based on actual jitter)
+    'Shimmer_Percent': (0, 3.81),             # %
+    'HNR_dB': (12, 30),                       # dB (corrected for actual HNR)
+    'Voice_Period_Mean': (0.004, 0.012),      # seconds (expanded range)
+    'Voiced_Segments_Ratio': (0.4, 0.8),      
+    'Formant_Frequency': (400, 1000)          # Hz (F1 range)
+}
+
+def get_parameter_key(display_name):
+    """Convert display name to parameter key."""
+    name_mapping = {
+        'Fundamental Frequency (Mean)': 'Fundamental_Frequency_Mean',
+        'Fundamental Frequency (Std)': 'Fundamental_Frequency_Std',
+        'Jitter': 'Jitter_Percent',
+        'Shimmer': 'Shimmer_Percent',
+        'HNR': 'HNR_dB',  # Changed from Harmonic_Ratio
+        'Voice Period': 'Voice_Period_Mean',
+        'Voiced Segments Ratio': 'Voiced_Segments_Ratio',
+        'Formant Frequency': 'Formant_Frequency'
+    }
+    return name_mapping.get(display_name)
+
+def is_within_range(value, parameter_key, gender=None):
+    """Check if value is within normal range."""
+    if parameter_key not in NORMAL_RANGES:
+        print(f"Warning: No range defined for parameter {parameter_key}")
+        return True
+        
+    if parameter_key == 'Fundamental_Frequency_Mean':
+        if gender:
+            range_values = NORMAL_RANGES[parameter_key][gender]
+        else:
+            range_values = NORMAL_RANGES[parameter_key]['default']
+    else:
+        range_values = NORMAL_RANGES[parameter_key]
+    
+    return range_values[0] <= value <= range_values[1]
+
+# Constants for styling - Apple Design System
+# Apple System Colors
+SYSTEM_BLUE = (0, 122, 255)  # Apple's primary blue
+SYSTEM_GRAY_DARK = (28, 28, 30)  # Dark gray for text
+SYSTEM_GRAY_LIGHT = (142, 142, 147)  # Light gray for secondary text
+SYSTEM_GRAY_BACKGROUND = (242, 242, 247)  # Background gray
+SYSTEM_GREEN = (52, 199, 89)  # Success green
+SYSTEM_RED = (255, 59, 48)  # Error red
+SYSTEM_WHITE = (255, 255, 255)
+LOGO_PATH = "sparrow_logo.jpg"
+
+def _parse_logo():
+    """Parse the logo once per process so documents can reuse the image object"""
+    if not os.path.exists(LOGO_PATH):
+        return None
+    try:
+        parser = FPDF()._parsepng if LOGO_PATH.lower().endswith('.png') else FPDF()._parsejpg
+        return parser(LOGO_PATH)
+    except Exception as e:
+        print(f"Warning: Could not pre-load report logo: {e}")
+        return None
+
+LOGO_INFO = _parse_logo()
+
+class VoicePathologyPDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if LOGO_INFO is not None:
+            # FPDF drops the image data once it is written out, so each document gets its own copy
+            self.images[LOGO_PATH] = dict(LOGO_INFO, i=len(self.images) + 1)
+
+    def header(self):
+        # Clean header with generous white space
+        self.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
+        self.rect(0, 0, 210, 40, 'F')  # Header background
+        
+        if LOGO_INFO is not None:
+            self.image(LOGO_PATH, 15, 10, 20)
+
+        self.set_xy(40, 12)
+        self.set_font('Arial', 'B', 24)
+        self.set_text_color(*SYSTEM_GRAY_DARK)
+        self.cell(60, 12, 'Sparrow', 0, 0, 'L')
+
+        self.set_xy(15, 28)
+        self.set_font('Arial', '', 11)
+        self.set_text_color(*SYSTEM_GRAY_LIGHT)
+        self.cell(0, 8, 'Voice Pathology Analysis Report', 0, 1, 'L')
+
+        self.ln(18)  # More spacing after header
+
+    def colored_cell(self, w, h, txt, value, parameter_name, gender=None):
+        """Create a cell with color based on whether the value is within normal range"""
+        if isinstance(value, str):
+            value = float(value.replace('%', '').replace(' dB', ''))
+        
+        parameter_key = get_parameter_key(parameter_name)
+        if parameter_key and is_within_range(value, parameter_key, gender):
+            self.set_text_color(*SYSTEM_GREEN)
+        else:
+            self.set_text_color(*SYSTEM_RED)
+            
+        self.cell(w, h, txt, 0, 0, 'L')  # No border for cleaner look
+        self.set_text_color(*SYSTEM_GRAY_DARK)
+
+    def footer(self):
+        self.set_y(-18)
+        self.set_font('Arial', '', 9)
+        self.set_text_color(*SYSTEM_GRAY_LIGHT)
+        self.cell(0, 8, f'Page {self.page_no()}/{{nb}} | Sparrow Voice Analysis', 0, 0, 'C')
+
+    def chapter_title(self, title):
+        """Apple-style section header with clean typography"""
+        self.ln(8)  # Generous spacing before section
+        self.set_font('Arial', 'B', 18)
+        self.set_text_color(*SYSTEM_GRAY_DARK)
+        self.cell(0, 10, title, 0, 1, 'L')
+        
+        # Subtle underline
+        self.set_line_width(0.5)
+        self.set_draw_color(*SYSTEM_GRAY_LIGHT)
+        current_y = self.get_y()
+        self.line(15, current_y, 195, current_y)
+        
+        self.ln(12)  # Generous spacing after header
+
+    def chapter_body(self, text):
+        """Clean body text with proper line height"""
+        self.set_font('Arial', '', 12)
+        self.set_text_color(*SYSTEM_GRAY_DARK)
+        sections = text.split('**')
+        for i, section in enumerate(sections):
+            if i % 2 == 0:
+                self.set_font('Arial', '', 12)
+                self.set_text_color(*SYSTEM_GRAY_DARK)
+            else:
+                self.set_font('Arial', 'B', 12)
+                self.set_text_color(*SYSTEM_GRAY_DARK)
+            self.multi_cell(0, 6, section)  # Better line height
+            self.ln(2)  # Small spacing between paragraphs
+        self.ln(8)
+
+def _format_range(key):
+    low, high = NORMAL_RANGES[key]['default'] if key == 'Fundamental_Frequency_Mean' else NORMAL_RANGES[key]
+    return f"{low}-{high}"
+
+# Static table layout, built once: (display name, feature key, value format, normal range, unit)
+TABLE_COL_WIDTHS = [90, 35, 35, 20]
+TABLE_HEADERS = ['Parameter', 'Value', 'Normal Range', 'Unit']
+MEASUREMENT_ROWS = [
+    ('Fundamental Frequency (Mean)', 'Fundamental_Frequency_Mean', '{:.2f}', _format_range('Fundamental_Frequency_Mean'), 'Hz'),
+    ('Fundamental Frequency (Std)', 'Fundamental_Frequency_Std', '{:.2f}', _format_range('Fundamental_Frequency_Std'), 'Hz'),
+    ('Jitter', 'Jitter_Percent', '{:.2f}', _format_range('Jitter_Percent'), '%'),
+    ('Shimmer', 'Shimmer_Percent', '{:.2f}', _format_range('Shimmer_Percent'), '%'),
+    ('HNR', 'HNR_dB', '{:.2f}', _format_range('HNR_dB'), 'dB'),
+    ('Voice Period', 'Voice_Period_Mean', '{:.4f}', _format_range('Voice_Period_Mean'), 's'),
+    ('Voiced Segments Ratio', 'Voiced_Segments_Ratio', '{:.2f}', _format_range('Voiced_Segments_Ratio'), ''),
+    ('Formant Frequency', 'Formant_Frequency', '{:.2f}', _format_range('Formant_Frequency'), 'Hz'),
+]
+
+def render_pdf(payload):
+    """
+    Render a report from a plain-data payload and return the PDF bytes.
+    Runs inside the PDF worker processes, so the payload must be picklable.
+    """
+    prediction = payload['prediction']
+    probabilities = payload['probabilities']
+    report_text = payload['report_text']
+    features = payload['features']
+    gender = payload.get('gender')
+    spectrogram_path = payload.get('spectrogram_path')
+
+    pdf = VoicePathologyPDF()
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    # Patient Information Section - Apple style cards
+    pdf.chapter_title('Patient Information')
+    
+    # Card-style information boxes
+    card_y = pdf.get_y()
+    pdf.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
+    pdf.rect(15, card_y, 180, 20, 'F')  # Background card
+    
+    pdf.set_xy(20, card_y + 6)
+    pdf.set_font('Arial', '', 11)
+    pdf.set_text_color(*SYSTEM_GRAY_LIGHT)
+    pdf.cell(40, 6, 'Analysis Date:', 0, 0, 'L')
+    pdf.set_text_color(*SYSTEM_GRAY_DARK)
+    pdf.cell(0, 6, datetime.now().strftime('%Y-%m-%d'), 0, 1, 'L')
+    
+    pdf.set_xy(20, card_y + 12)
+    pdf.set_text_color(*SYSTEM_GRAY_LIGHT)
+    pdf.cell(40, 6, 'Predicted Condition:', 0, 0, 'L')
+    pdf.set_text_color(*SYSTEM_BLUE)
+    pdf.set_font('Arial', 'B', 11)
+    pdf.cell(0, 6, f"{prediction} ({probabilities[prediction]})", 0, 1, 'L')
+    
+    pdf.set_y(card_y + 20)
+    pdf.ln(12)
+
+    # Acoustic Measurements - Apple-style clean table
+    pdf.chapter_title('Acoustic Measurements')
+    
+    # Table header with subtle background
+    pdf.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
+    pdf.set_text_color(*SYSTEM_GRAY_DARK)
+    pdf.set_font('Arial', 'B', 10)
+    
+    # Header row
+    header_y = pdf.get_y()
+    pdf.rect(15, header_y, 180, 8, 'F')  # Header background
+    
+    col_widths = TABLE_COL_WIDTHS
+    
+    pdf.set_xy(18, header_y + 2)
+    for i, header in enumerate(TABLE_HEADERS):
+        pdf.cell(col_widths[i], 6, header, 0, 0, 'L')
+    pdf.ln(10)
+
+    # Measurements rows - clean, borderless design
+    pdf.set_font('Arial', '', 10)
+    measurements = [
+        [display_name, value_format.format(features[key]), normal_range, unit]
+        for display_name, key, value_format, normal_range, unit in MEASUREMENT_ROWS
+    ]
+
+    for idx, row in enumerate(measurements):
+        display_name = row[0]
+        value = float(row[1])
+        row_y = pdf.get_y()
+        
+        # Alternating row backgrounds for better readability
+        if idx % 2 == 0:
+            pdf.set_fill_color(*SYSTEM_WHITE)
+        else:
+            pdf.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
+        pdf.rect(15, row_y, 180, 8, 'F')
+        
+        pdf.set_xy(18, row_y + 2)
+        pdf.set_text_color(*SYSTEM_GRAY_DARK)
+        pdf.cell(col_widths[0], 6, row[0], 0, 0, 'L')
+        
+        # Value with color coding
+        pdf.set_xy(18 + col_widths[0], row_y + 2)
+        pdf.colored_cell(col_widths[1], 6, row[1], value, display_name, gender)
+        
+        pdf.set_xy(18 + col_widths[0] + col_widths[1], row_y + 2)
+        pdf.set_text_color(*SYSTEM_GRAY_LIGHT)
+        pdf.set_font('Arial', '', 9)
+        pdf.cell(col_widths[2], 6, row[2], 0, 0, 'L')
+        
+        pdf.set_xy(18 + col_widths[0] + col_widths[1] + col_widths[2], row_y + 2)
+        pdf.cell(col_widths[3], 6, row[3], 0, 0, 'L')
+        
+        pdf.set_font('Arial', '', 10)  # Reset font
+        pdf.set_text_color(*SYSTEM_GRAY_DARK)  # Reset color
+        pdf.ln(8)
+
+    pdf.ln(8)
+
+    # Detailed Analysis Section
+    pdf.chapter_title('Detailed Analysis')
+    pdf.chapter_body(report_text)
+
+    # Voice Spectrogram Page
+    pdf.add_page()
+    pdf.chapter_title('Voice Spectrogram')
+    if spectrogram_path and os.path.exists(spectrogram_path):
+        # Center and add padding around image
+        pdf.set_xy(15, pdf.get_y())
+        pdf.image(spectrogram_path, x=15, w=180)
+
+    data = pdf.output(dest='S')
+    # fpdf 1.7 returns a latin-1 str, fpdf2 returns a bytearray
+    return data.encode('latin-1') if isinstance(data, str) else bytes(data)
+
+def _warm_up_worker():
+    """Pool initializer: pin to the PDF cores and load the core font metrics before the first real report"""
+    pin_process(PDF_CPU_AFFINITY)
+    pdf = VoicePathologyPDF()
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 24)
+    pdf.set_font('Arial', '', 12)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pdf_pool():
+    """Lazily start the shared PDF rendering pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # forkserver keeps the workers out of the parent's TensorFlow threads. Each
+                # worker still re-imports the entry script, which is why main.py only
+                # builds the app under __main__
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['app.pdf_report'])
+                _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context,
+                                            initializer=_warm_up_worker)
+    return _pool
+
+def _replace_broken_pool(broken):
+    """Drop a pool whose worker died (OOM kill, crash in fpdf/PIL); the next get_pdf_pool() starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        # Another request may already have replaced it
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def _render_in_pool(payload):
+    pool = get_pdf_pool()
+    try:
+        return pool.submit(render_pdf, payload).result()
+    except BrokenProcessPool:
+        print("Warning: PDF worker pool broke; restarting it and retrying the render")
+        _replace_broken_pool(pool)
+        return get_pdf_pool().submit(render_pdf, payload).result()
+
+def create_pdf_report(audio_path, prediction, probabilities, report_text, features, output_pdf='medical_report.pdf', gender=None, spectrogram_path='mel_spectrogram.png'):
+    payload = {
+        'prediction': prediction,
+        'probabilities': dict(probabilities),
+        'report_text': report_text,
+        'features': dict(features),
+        'gender': gender,
+        'spectrogram_path': os.path.abspath(spectrogram_path) if spectrogram_path else None,
+    }
+    if PDF_WORKERS > 0:
+        pdf_bytes = _render_in_pool(payload)
+    else:
+        pdf_bytes = render_pdf(payload)
+
+    with open(output_pdf, 'wb') as f:
+        f.write(pdf_bytes)
+    return output_pdf
\ No newline at end of file
@@ -0,0 +1,179 @@
+# On-demand profiling of individual analysis requests.
+# A caller holding PROFILING_TOKEN can ask for one request to be profiled:
+#   X-Profile: sampling   stack sampler thread, flamegraph-compatible collapsed stacks
+#   X-Profile: cprofile   deterministic cProfile, saved as .pstats plus a text summary
+# PROFILE_SAMPLE_PERCENT additionally samples that share of ordinary traffic.
+# The profile is stored under PROFILE_DIR; its id comes back in the X-Profile-Id
+# header and GET /api/profiles/<id> serves it. Only the newest PROFILE_MAX_FILES
+# profiles are kept. Unprofiled requests go straight to the view, so there is
+# no cost when profiling is off.
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import uuid
+from collections import Counter
+from functools import wraps
+from flask import request, jsonify, make_response
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_SAMPLE_PERCENT = float(os.getenv("PROFILE_SAMPLE_PERCENT", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profiles kept under PROFILE_DIR; the oldest are deleted as new ones are written (0 = keep all)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+PROFILE_HEADER = "X-Profile"
+TOKEN_HEADER = "X-Profile-Token"
+SAMPLING = "sampling"
+CPROFILE = "cprofile"
+PROFILE_MODES = (SAMPLING, CPROFILE)
+PROFILE_EXTENSIONS = {SAMPLING: ".collapsed", CPROFILE: ".txt"}
+PROFILE_FILES = (".collapsed", ".txt", ".pstats")  # Everything a profile may leave under PROFILE_DIR
+
+# Only one cProfile may be active per process (sys.monitoring on 3.12+);
+# a second concurrent cprofile request falls back to the sampler
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread"""
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed format: 'frame;frame;frame count' per line"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profiling_authorised():
+    token = request.headers.get(TOKEN_HEADER, "")
+    return bool(PROFILING_TOKEN) and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+def profile_path(profile_id, mode):
+    return os.path.join(PROFILE_DIR, profile_id + PROFILE_EXTENSIONS[mode])
+
+
+def prune_profiles(max_profiles=PROFILE_MAX_FILES):
+    """Delete the oldest profiles beyond `max_profiles` (a cprofile run's .txt and .pstats count as one)"""
+    if max_profiles <= 0:
+        return
+    newest = {}
+    with os.scandir(PROFILE_DIR) as entries:
+        for entry in entries:
+            profile_id, extension = os.path.splitext(entry.name)
+            if extension not in PROFILE_FILES:
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue  # Pruned by a concurrent request
+            newest[profile_id] = max(mtime, newest.get(profile_id, 0.0))
+    stale = sorted(newest, key=newest.get, reverse=True)[max_profiles:]
+    for profile_id in stale:
+        for extension in PROFILE_FILES:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+def _run_sampling(view, args, kwargs, profile_id):
+    sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0).start()
+    try:
+        return view(*args, **kwargs)
+    finally:
+        sampler.stop()
+        with open(profile_path(profile_id, SAMPLING), "w") as f:
+            f.write(sampler.collapsed())
+        prune_profiles()
+
+
+def _run_cprofile(view, args, kwargs, profile_id):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return view(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _cprofile_lock.release()
+        profiler.dump_stats(os.path.join(PROFILE_DIR, profile_id + ".pstats"))
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(60)
+        with open(profile_path(profile_id, CPROFILE), "w") as f:
+            f.write(summary.getvalue())
+        prune_profiles()
+
+
+def profiled(view):
+    """Route decorator: profile the request when asked (and authorised) or when sampled"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = request.headers.get(PROFILE_HEADER, "").lower() or None
+        if mode is not None:
+            if not profiling_authorised():
+                return jsonify({'error': 'Profiling requires a valid profiling token'}), 403
+            if mode not in PROFILE_MODES:
+                return jsonify({'error': f"{PROFILE_HEADER} must be one of {', '.join(PROFILE_MODES)}"}), 400
+        elif PROFILE_SAMPLE_PERCENT > 0 and random.random() * 100 < PROFILE_SAMPLE_PERCENT:
+            mode = SAMPLING
+        else:
+            return view(*args, **kwargs)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        if mode == CPROFILE and not _cprofile_lock.acquire(blocking=False):
+            mode = SAMPLING
+        run = _run_sampling if mode == SAMPLING else _run_cprofile
+        response = make_response(run(view, args, kwargs, profile_id))
+        response.headers["X-Profile-Id"] = profile_id
+        response.headers["X-Profile-Mode"] = mode
+        return response
+    return wrapper
+
+
+def load_profile(profile_id):
+    """(text, mode) of a stored profile, or None; the id must be a uuid hex"""
+    try:
+        profile_id = uuid.UUID(hex=profile_id).hex
+    except ValueError:
+        return None
+    for mode in PROFILE_MODES:
+        path = profile_path(profile_id, mode)
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read(), mode
+    return None
+
@@ -0,0 +1,90 @@
+import numpy as np
+from app.vad import speech_fraction
+
+# Cheap checks run right after decoding so unusable audio never reaches
+# VGGish, pyin or the LLM (and the Node server can skip charging a credit)
+MIN_DURATION_S = 1.0
+MIN_SAMPLE_RATE = 8000
+MIN_RMS_DBFS = -50.0         # Reject: effectively silent
+LOW_RMS_DBFS = -35.0         # Flag: quiet but usable
+CLIP_LEVEL = 0.99
+MAX_CLIPPED_RATIO = 0.05     # Reject: heavily clipped
+WARN_CLIPPED_RATIO = 0.005   # Flag: some clipping
+MIN_VOICED_FRACTION = 0.05   # Reject: no speech
+LOW_VOICED_FRACTION = 0.2    # Flag: little speech
+
+# Reason codes shared with the Node server
+TOO_SHORT = "TOO_SHORT"
+LOW_SAMPLE_RATE = "LOW_SAMPLE_RATE"
+TOO_QUIET = "TOO_QUIET"
+LOW_LEVEL = "LOW_LEVEL"
+CLIPPED = "CLIPPED"
+SOME_CLIPPING = "SOME_CLIPPING"
+NO_SPEECH = "NO_SPEECH"
+LITTLE_SPEECH = "LITTLE_SPEECH"
+
+
+class AudioQualityError(ValueError):
+    """Raised when a recording fails the quality gate; `report` holds the reason codes"""
+    def __init__(self, report):
+        self.report = report
+        codes = ", ".join(reason["code"] for reason in report["reasons"])
+        super().__init__(f"Audio rejected by quality gate: {codes}")
+
+
+def assess_quality(y, sr, source_sr=None):
+    """
+    Check duration, level, clipping, sample rate and voiced fraction of a decoded waveform.
+    Returns {"passed", "reasons", "warnings", "metrics"}; reasons reject, warnings only flag.
+    """
+    duration = len(y) / sr if sr else 0.0
+    rms = float(np.sqrt(np.mean(np.square(y, dtype=np.float64)))) if len(y) else 0.0
+    rms_dbfs = 20.0 * np.log10(rms + 1e-12)
+    clipped_ratio = float(np.mean(np.abs(y) >= CLIP_LEVEL)) if len(y) else 0.0
+
+    voiced_fraction = 0.0
+    if len(y):
+        # Same per-frame decision as the VAD, so sustained phonation without pauses
+        # counts; the periodicity part is estimated from a strided subset of frames
+        voiced_fraction = speech_fraction(y, sr)
+
+    metrics = {
+        "duration_s": round(duration, 2),
+        "sample_rate": source_sr,
+        "rms_dbfs": round(float(rms_dbfs), 1),
+        "clipped_ratio": round(clipped_ratio, 4),
+        "voiced_fraction": round(voiced_fraction, 3),
+    }
+
+    reasons, warnings = [], []
+
+    def reject(code, message):
+        reasons.append({"code": code, "message": message})
+
+    def flag(code, message):
+        warnings.append({"code": code, "message": message})
+
+    if duration < MIN_DURATION_S:
+        reject(TOO_SHORT, f"Recording is {duration:.1f}s; at least {MIN_DURATION_S:.0f}s of audio is needed")
+    if source_sr is not None and source_sr < MIN_SAMPLE_RATE:
+        reject(LOW_SAMPLE_RATE, f"Sample rate {source_sr} Hz is below {MIN_SAMPLE_RATE} Hz")
+    if rms_dbfs < MIN_RMS_DBFS:
+        reject(TOO_QUIET, "Recording is silent or far too quiet")
+    elif rms_dbfs < LOW_RMS_DBFS:
+        flag(LOW_LEVEL, "Recording level is low; results may be less reliable")
+    if clipped_ratio > MAX_CLIPPED_RATIO:
+        reject(CLIPPED, f"{clipped_ratio:.1%} of samples are clipped")
+    elif clipped_ratio > WARN_CLIPPED_RATIO:
+        flag(SOME_CLIPPING, f"{clipped_ratio:.1%} of samples are clipped")
+    if rms_dbfs >= MIN_RMS_DBFS:
+        if voiced_fraction < MIN_VOICED_FRACTION:
+            reject(NO_SPEECH, "No speech detected in the recording")
+        elif voiced_fraction < LOW_VOICED_FRACTION:
+            flag(LITTLE_SPEECH, "Only a small part of the recording contains speech")
+
+    return {
+        "passed": not reasons,
+        "reasons": reasons,
+        "warnings": warnings,
+        "metrics": metrics,
+    }
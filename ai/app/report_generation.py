@@ -1,21 +1,31 @@
 import os
+import threading
+import time
 import numpy as np
-import tensorflow as tf
-import tensorflow_hub as hub
-# Set matplotlib backend before importing pyplot to avoid GUI warnings
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import librosa.display
-import matplotlib.pyplot as plt
-from tensorflow.keras.models import load_model
 import librosa
-from fpdf import FPDF
-from groq import Groq
 from groq import AuthenticationError, APIStatusError, APIConnectionError
 import re
-import json
 from datetime import datetime
-from app import client, model
+from app import get_model, MODEL_BACKEND
+from app.tflite_backend import TFLiteModel, tflite_path, backend_variant
+from app.audio_io import load_audio
+from app.spectrogram import render_spectrogram
+from app.pdf_report import create_pdf_report
+from app.resources import stage_limits, import_tensorflow
+from app.vad import trim_silence
+from app.quality_gate import assess_quality, AudioQualityError
+from app.memory import MemoryTracker, MemoryBudgetExceeded, analysis_memory
+from app.perturbation import perturbation_measures, pitch_track
+from app.formants import formant_summary
+from app.outbound import DependencyUnavailable, cloudinary_calls, groq_chat
+from app.similarity_index import SIMILARITY_INDEX_ENABLED, find_similar_cases
+from app.results import AnalysisResult
+from app.shadow import submit_shadow
+from app.tiers import STANDARD, FULL, Budget, plan_tier, timed_stage, stage_costs, tier_summary
+
+# 'fast' renders the spectrogram straight from the STFT with numpy;
+# 'matplotlib' keeps the original high-fidelity figure
+SPECTROGRAM_RENDERER = os.getenv("SPECTROGRAM_RENDERER", "fast")
 
 label_mapping = {
     0: "Healthy",
@@ -23,24 +33,118 @@ label_mapping = {
     2: "Vocal Polyp"
 }
 
+# pyin's default hop, passed explicitly because cycle detection maps frames back to samples
+PYIN_HOP_LENGTH = 512
+
 vggish_model_url = "https://tfhub.dev/google/vggish/1"
-try:
-    print("Loading VGGish model...")
-    vggish_model = hub.load(vggish_model_url)
-    print("VGGish model loaded successfully")
-except Exception as e:
-    print(f"Warning: Error loading VGGish model: {e}")
-    vggish_model = None
-
-def extract_audio_features(file_path, max_length=128):
-    """Extract VGGish embeddings with proper resampling to 16kHz"""
+vggish_tflite_base = "app/vggish"
+
+def load_vggish(backend=MODEL_BACKEND):
+    """Load VGGish from TF Hub, or its TFLite export when a TFLite backend is configured"""
+    if backend.startswith("tflite"):
+        return TFLiteModel(tflite_path(vggish_tflite_base, backend_variant(backend)))
+    import_tensorflow()
+    import tensorflow_hub as hub
+    return hub.load(vggish_model_url)
+
+_vggish_model = None
+_vggish_lock = threading.Lock()
+
+def get_vggish():
+    """VGGish, loaded on first use"""
+    global _vggish_model
+    if _vggish_model is None:
+        with _vggish_lock:
+            if _vggish_model is None:
+                print("Loading VGGish model...")
+                _vggish_model = load_vggish()
+                print("VGGish model loaded successfully")
+    return _vggish_model
+
+def _hub_embeddings(vggish_model, y):
+    """Run the TF Hub VGGish on a normalised 16kHz waveform; returns numpy embeddings"""
+    tf = import_tensorflow()
+    # Convert to tensorflow tensor
+    waveform = tf.constant(y, dtype=tf.float32)
+    print(f"4 - Converted to tensor with shape: {waveform.shape}")
+    
+    print("5 - Passing to VGGish model...")
+    print("5.1 - Ensuring TensorFlow eager execution is enabled...")
+    # Ensure we're in eager execution mode
+    if not tf.executing_eagerly():
+        tf.config.run_functions_eagerly(True)
+    
+    # VGGish model from TF Hub can accept raw waveforms
+    # It processes them internally. We need to ensure proper shape and execution
+    print("5.2 - Calling VGGish model with waveform...")
+    
+    # Ensure waveform is a proper tensor
+    waveform = tf.cast(waveform, tf.float32)
+    
+    # VGGish typically expects waveforms without batch dimension for direct call
+    # But some versions may require batch dimension - we'll try both
+    embeddings = None
+    error_msgs = []
+    
+    # Method 1: Try direct call (most common for TF Hub models)
+    try:
+        print("5.3a - Attempting direct model call...")
+        embeddings = vggish_model(waveform)
+        print(f"6a - Direct call succeeded! Embeddings shape: {embeddings.shape}")
+    except Exception as e1:
+        error_msg1 = str(e1)
+        error_msgs.append(f"Direct call: {error_msg1}")
+        print(f"6b - Direct call failed: {error_msg1[:200]}...")
+        
+        # Method 2: Try with batch dimension
+        try:
+            print("5.3b - Attempting call with batch dimension...")
+            waveform_batch = tf.expand_dims(waveform, axis=0)
+            embeddings = vggish_model(waveform_batch)
+            print(f"6c - Batch call succeeded! Embeddings shape: {embeddings.shape}")
+        except Exception as e2:
+            error_msg2 = str(e2)
+            error_msgs.append(f"Batch call: {error_msg2}")
+            print(f"6d - Batch call failed: {error_msg2[:200]}...")
+            
+            # Method 3: Try using signatures
+            try:
+                print("5.3c - Attempting signature call...")
+                if hasattr(vggish_model, 'signatures') and vggish_model.signatures:
+                    signature_name = list(vggish_model.signatures.keys())[0]
+                    signature = vggish_model.signatures[signature_name]
+                    embeddings = signature(waveform=waveform)
+                    print(f"6e - Signature call succeeded! Embeddings shape: {embeddings.shape}")
+                else:
+                    raise ValueError("No signatures available")
+            except Exception as e3:
+                error_msg3 = str(e3)
+                error_msgs.append(f"Signature call: {error_msg3}")
+                print(f"6f - Signature call failed: {error_msg3[:200]}...")
+                raise RuntimeError(f"All VGGish model call methods failed:\n" + "\n".join(error_msgs[:3]))
+    
+    if embeddings is None:
+        raise RuntimeError("Failed to get embeddings from VGGish model - embeddings is None")
+    
+    # Convert to numpy if needed
+    if isinstance(embeddings, dict):
+        # If it returns a dict, get the embeddings value
+        embeddings = embeddings.get('embedding', embeddings.get('output', 
+                      embeddings.get('audio_embedding', list(embeddings.values())[0])))
+    
+    return embeddings.numpy() if hasattr(embeddings, 'numpy') else np.asarray(embeddings, dtype=np.float32)
+
+def extract_audio_features(audio, max_length=128):
+    """Extract VGGish embeddings with proper resampling to 16kHz (audio is a path or a 16kHz waveform)"""
     try:
-        if vggish_model is None:
-            raise RuntimeError("VGGish model is not loaded. Please check model initialization.")
+        try:
+            vggish_model = get_vggish()
+        except Exception as e:
+            raise RuntimeError(f"VGGish model could not be loaded: {e}")
         
         print("1 - Reading file")
         # Load audio at 16kHz (VGGish requirement)
-        y, sr = librosa.load(file_path, sr=16000, mono=True)
+        y, sr = load_audio(audio, sr=16000)
         print(f"2 - Loaded audio: sample_rate={sr}, duration={len(y)/sr:.2f}s")
         
         # Normalize to [-1, 1] range
@@ -49,87 +153,20 @@ def extract_audio_features(file_path, max_length=128):
             y = y / max_val
         print("3 - Normalized waveform")
         
-        # Convert to tensorflow tensor
-        waveform = tf.constant(y, dtype=tf.float32)
-        print(f"4 - Converted to tensor with shape: {waveform.shape}")
-        
-        print("5 - Passing to VGGish model...")
-        print("5.1 - Ensuring TensorFlow eager execution is enabled...")
-        # Ensure we're in eager execution mode
-        if not tf.executing_eagerly():
-            tf.config.run_functions_eagerly(True)
-        
-        # VGGish model from TF Hub can accept raw waveforms
-        # It processes them internally. We need to ensure proper shape and execution
-        print("5.2 - Calling VGGish model with waveform...")
-        
-        # Ensure waveform is a proper tensor
-        waveform = tf.cast(waveform, tf.float32)
-        
-        # VGGish typically expects waveforms without batch dimension for direct call
-        # But some versions may require batch dimension - we'll try both
-        embeddings = None
-        error_msgs = []
-        
-        # Method 1: Try direct call (most common for TF Hub models)
-        try:
-            print("5.3a - Attempting direct model call...")
-            embeddings = vggish_model(waveform)
-            print(f"6a - Direct call succeeded! Embeddings shape: {embeddings.shape}")
-        except Exception as e1:
-            error_msg1 = str(e1)
-            error_msgs.append(f"Direct call: {error_msg1}")
-            print(f"6b - Direct call failed: {error_msg1[:200]}...")
-            
-            # Method 2: Try with batch dimension
-            try:
-                print("5.3b - Attempting call with batch dimension...")
-                waveform_batch = tf.expand_dims(waveform, axis=0)
-                embeddings = vggish_model(waveform_batch)
-                print(f"6c - Batch call succeeded! Embeddings shape: {embeddings.shape}")
-            except Exception as e2:
-                error_msg2 = str(e2)
-                error_msgs.append(f"Batch call: {error_msg2}")
-                print(f"6d - Batch call failed: {error_msg2[:200]}...")
-                
-                # Method 3: Try using signatures
-                try:
-                    print("5.3c - Attempting signature call...")
-                    if hasattr(vggish_model, 'signatures') and vggish_model.signatures:
-                        signature_name = list(vggish_model.signatures.keys())[0]
-                        signature = vggish_model.signatures[signature_name]
-                        embeddings = signature(waveform=waveform)
-                        print(f"6e - Signature call succeeded! Embeddings shape: {embeddings.shape}")
-                    else:
-                        raise ValueError("No signatures available")
-                except Exception as e3:
-                    error_msg3 = str(e3)
-                    error_msgs.append(f"Signature call: {error_msg3}")
-                    print(f"6f - Signature call failed: {error_msg3[:200]}...")
-                    raise RuntimeError(f"All VGGish model call methods failed:\n" + "\n".join(error_msgs[:3]))
-        
-        if embeddings is None:
-            raise RuntimeError("Failed to get embeddings from VGGish model - embeddings is None")
-        
-        # Convert to numpy if needed
-        if isinstance(embeddings, dict):
-            # If it returns a dict, get the embeddings value
-            embeddings = embeddings.get('embedding', embeddings.get('output', 
-                          embeddings.get('audio_embedding', list(embeddings.values())[0])))
-        
-        # Ensure we have a tensor
-        if not isinstance(embeddings, tf.Tensor):
-            embeddings = tf.constant(embeddings, dtype=tf.float32)
-        
+        if isinstance(vggish_model, TFLiteModel):
+            # The TFLite export takes and returns numpy, so TensorFlow is never imported
+            print("4 - Passing waveform to VGGish (TFLite)...")
+            embeddings = vggish_model(y.astype(np.float32))
+        else:
+            embeddings = _hub_embeddings(vggish_model, y)
+        del y
         print(f"7 - Final embeddings shape: {embeddings.shape}")
-        
+
         # Remove batch dimension if present (we want [time, features])
-        if len(embeddings.shape) == 3:  # (batch, time, features)
-            embeddings = tf.squeeze(embeddings, axis=0)  # Remove batch: (time, features)
-        elif len(embeddings.shape) == 1:  # If it's 1D, something went wrong
+        if embeddings.ndim == 3:  # (batch, time, features)
+            embeddings = np.squeeze(embeddings, axis=0)
+        elif embeddings.ndim == 1:  # If it's 1D, something went wrong
             raise ValueError(f"Unexpected 1D embeddings shape: {embeddings.shape}")
-        
-        embeddings = embeddings.numpy() if hasattr(embeddings, 'numpy') else np.array(embeddings)
         print(f"8 - Embeddings as numpy, shape: {embeddings.shape}")
 
         # Pad or truncate to max_length
@@ -147,52 +184,18 @@ def extract_audio_features(file_path, max_length=128):
         traceback.print_exc()
         raise
 
-def calculate_jitter(f0):
-    """Calculate actual jitter from pitch periods"""
-    # Remove NaN values
-    valid_f0 = f0[~np.isnan(f0)]
-    
-    if len(valid_f0) < 2:
-        return 0.0
-    
-    # Convert frequency to periods
-    periods = 1.0 / valid_f0
-    
-    # Calculate period-to-period differences
-    period_diffs = np.abs(np.diff(periods))
-    
-    # Jitter is the average period-to-period difference divided by average period
-    jitter_percent = (np.mean(period_diffs) / np.mean(periods)) * 100
-    
-    return jitter_percent
-
-def calculate_shimmer(y, sr, f0):
-    """Calculate actual shimmer from amplitude variations"""
-    valid_f0 = f0[~np.isnan(f0)]
-    
-    if len(valid_f0) < 2:
-        return 0.0
-    
-    # Get amplitude envelope
-    amplitude_envelope = np.abs(librosa.effects.harmonic(y))
-    
-    # Calculate frame-to-frame amplitude differences
-    amp_diffs = np.abs(np.diff(amplitude_envelope))
-    
-    # Shimmer is the average amplitude difference divided by average amplitude
-    shimmer_percent = (np.mean(amp_diffs) / np.mean(amplitude_envelope)) * 100
-    
-    return shimmer_percent
-
 def calculate_hnr(y, sr, f0):
     """Calculate Harmonic-to-Noise Ratio"""
     try:
         # Separate harmonic and percussive components
         harmonic, percussive = librosa.effects.hpss(y)
         
-        # Calculate power of harmonic and noise (percussive) components
+        # Calculate power of harmonic and noise (percussive) components,
+        # freeing each full-length component as soon as it's summed
         harmonic_power = np.sum(harmonic ** 2)
+        del harmonic
         noise_power = np.sum(percussive ** 2)
+        del percussive
         
         if noise_power == 0:
             return 20.0  # High HNR if no noise detected
@@ -204,41 +207,20 @@ def calculate_hnr(y, sr, f0):
     except:
         return 10.0  # Default moderate value
 
-def estimate_formants(y, sr, n_formants=3):
-    """Estimate formant frequencies using LPC"""
-    try:
-        # Pre-emphasis filter
-        pre_emphasized = librosa.effects.preemphasis(y)
-        
-        # LPC order
-        order = int(2 + sr / 1000)
-        
-        # Get LPC coefficients
-        a = librosa.lpc(pre_emphasized, order=order)
-        
-        # Find roots
-        roots = np.roots(a)
-        roots = roots[np.imag(roots) >= 0]
-        
-        # Convert to Hz
-        angles = np.arctan2(np.imag(roots), np.real(roots))
-        freqs = sorted(angles * (sr / (2 * np.pi)))
-        
-        # Return first formant
-        formants = [f for f in freqs if 50 < f < sr/2][:n_formants]
-        
-        if len(formants) > 0:
-            return formants[0]
-        else:
-            return 500.0
-    except:
-        return 500.0
+def compute_spectral_frames(y, sr):
+    """STFT magnitude and spectral bandwidth series shared by the features and the spectrogram"""
+    S = np.abs(librosa.stft(y))
+    bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr)
+    return {"S": S, "bandwidth": bandwidth}
 
-def extract_advanced_features(audio_path):
-    """Extract acoustic features with corrected calculations"""
+def extract_advanced_features(audio, spectral_frames=None):
+    """Extract acoustic features with corrected calculations (audio is a path or a 16kHz waveform)"""
     try:
         # Load audio at 16kHz for consistency
-        y, sr = librosa.load(audio_path, sr=16000)
+        y, sr = load_audio(audio, sr=16000)
+        if spectral_frames is None:
+            spectral_frames = compute_spectral_frames(y, sr)
+        S = spectral_frames["S"]
 
         # Enhanced MFCC features
         mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
@@ -246,11 +228,7 @@ def extract_advanced_features(audio_path):
         mfcc_std = mfcc.std(axis=1)
 
         # Enhanced pitch features
-        f0, voiced_flag, voiced_probs = librosa.pyin(
-            y,
-            fmin=librosa.note_to_hz('C2'),
-            fmax=librosa.note_to_hz('C7')
-        )
+        f0, voiced_flag, voiced_probs = pitch_track(y, sr, PYIN_HOP_LENGTH)
         
         # Handle NaN values
         f0_clean = f0[~np.isnan(f0)]
@@ -258,25 +236,24 @@ def extract_advanced_features(audio_path):
         f0_std = np.std(f0_clean) if len(f0_clean) > 0 else 0
 
         # Enhanced spectral features
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
-        spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
+        # All computed from the one STFT magnitude instead of four separate STFTs
+        spectral_centroid = librosa.feature.spectral_centroid(S=S, sr=sr)
+        spectral_bandwidth = spectral_frames["bandwidth"]
+        spectral_rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr)
+        spectral_contrast = librosa.feature.spectral_contrast(S=S, sr=sr)
 
         # Enhanced energy features
         rms = librosa.feature.rms(y=y)
 
-        # FIXED: Calculate actual jitter
-        jitter = calculate_jitter(f0)
-
-        # FIXED: Calculate actual shimmer
-        shimmer = calculate_shimmer(y, sr, f0)
+        # Cycle-based jitter and shimmer: glottal cycles are picked from the waveform
+        # around the pyin f0 track, then compared period to period and peak to peak
+        perturbation = perturbation_measures(y, sr, f0, PYIN_HOP_LENGTH)
 
         # FIXED: Calculate actual HNR (not spectral flatness)
         hnr = calculate_hnr(y, sr, f0)
 
-        # FIXED: Proper formant estimation
-        formant_freq = estimate_formants(y, sr)
+        # Frame-wise LPC formants over the pyin-voiced frames, summarised robustly
+        formants = formant_summary(y, sr, voiced_flag, PYIN_HOP_LENGTH)
 
         # FIXED: Safe voice period calculation
         voice_period = 1.0 / f0_mean if f0_mean > 0 and not np.isnan(f0_mean) else 0
@@ -292,12 +269,22 @@ def extract_advanced_features(audio_path):
             "Spectral_Contrast": float(np.mean(spectral_contrast)),
             "RMS_Energy_Mean": float(np.mean(rms)),
             "RMS_Energy_Std": float(np.std(rms)),
-            "Jitter_Percent": float(jitter),
-            "Shimmer_Percent": float(shimmer),
+            "Jitter_Percent": perturbation["jitter_local"],
+            "Jitter_RAP_Percent": perturbation["jitter_rap"],
+            "Jitter_PPQ5_Percent": perturbation["jitter_ppq5"],
+            "Shimmer_Percent": perturbation["shimmer_local"],
+            "Shimmer_APQ11_Percent": perturbation["shimmer_apq11"],
+            "Glottal_Cycles": perturbation["cycles"],
             "HNR_dB": float(hnr),  # Changed from Harmonic_Ratio
             "Voice_Period_Mean": float(voice_period),
             "Voiced_Segments_Ratio": float(np.mean(voiced_flag)),
-            "Formant_Frequency": float(formant_freq)
+            "Formant_Frequency": formants["f1"]["median"],
+            "Formant_F2_Frequency": formants["f2"]["median"],
+            "Formant_F3_Frequency": formants["f3"]["median"],
+            "Formant_F1_IQR": formants["f1"]["iqr"],
+            "Formant_F2_IQR": formants["f2"]["iqr"],
+            "Formant_F3_IQR": formants["f3"]["iqr"],
+            "Formant_Frames": formants["frames"]
         }
     except Exception as e:
         print(f"Error extracting advanced features: {e}")
@@ -396,7 +383,7 @@ NOTE: This analysis is based on automated acoustic measurements and should be in
 """
     return report
 
-def generate_medical_report(features, prediction, probabilities):
+def generate_medical_report(features, prediction, probabilities, timeout=None):
     prompt = f"""
     Generate a detailed voice pathology medical report with the following format:
 
@@ -437,7 +424,9 @@ def generate_medical_report(features, prediction, probabilities):
     """
 
     try:
-        completion = client.chat.completions.create(
+        # A deadline-bound request gives the LLM (retries included) only what is left of its budget
+        completion = groq_chat(
+            budget=timeout,
             model="deepseek-r1-distill-llama-70b",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.6,
@@ -448,6 +437,10 @@ def generate_medical_report(features, prediction, probabilities):
         # API key is invalid or missing
         print("⚠ API authentication failed - using rule-based fallback analysis")
         return generate_fallback_analysis(features, prediction, probabilities)
+    except DependencyUnavailable as e:
+        # Breaker open or every Groq slot taken; don't wait for it
+        print(f"⚠ Groq unavailable ({e.reason}) - using rule-based fallback analysis")
+        return generate_fallback_analysis(features, prediction, probabilities)
     except (APIStatusError, APIConnectionError) as e:
         # Other API errors (rate limit, server error, network issues)
         status_code = getattr(e, 'status_code', 'unknown')
@@ -461,273 +454,18 @@ def generate_medical_report(features, prediction, probabilities):
         # traceback.print_exc()
         return generate_fallback_analysis(features, prediction, probabilities)
 
-# FIXED: Updated normal ranges
-NORMAL_RANGES = {
-    'Fundamental_Frequency_Mean': {
-        'male': (85, 180),      # Hz
-        'female': (165, 255),   # Hz
-        'default': (85, 255)    # Hz
-    },
-    'Fundamental_Frequency_Std': (0, 20),     # Hz
-    'Jitter_Percent': (0, 1.04),              # % (corrected based on actual jitter)
-    'Shimmer_Percent': (0, 3.81),             # %
-    'HNR_dB': (12, 30),                       # dB (corrected for actual HNR)
-    'Voice_Period_Mean': (0.004, 0.012),      # seconds (expanded range)
-    'Voiced_Segments_Ratio': (0.4, 0.8),      
-    'Formant_Frequency': (400, 1000)          # Hz (F1 range)
-}
-
-def get_parameter_key(display_name):
-    """Convert display name to parameter key."""
-    name_mapping = {
-        'Fundamental Frequency (Mean)': 'Fundamental_Frequency_Mean',
-        'Fundamental Frequency (Std)': 'Fundamental_Frequency_Std',
-        'Jitter': 'Jitter_Percent',
-        'Shimmer': 'Shimmer_Percent',
-        'HNR': 'HNR_dB',  # Changed from Harmonic_Ratio
-        'Voice Period': 'Voice_Period_Mean',
-        'Voiced Segments Ratio': 'Voiced_Segments_Ratio',
-        'Formant Frequency': 'Formant_Frequency'
-    }
-    return name_mapping.get(display_name)
-
-def is_within_range(value, parameter_key, gender=None):
-    """Check if value is within normal range."""
-    if parameter_key not in NORMAL_RANGES:
-        print(f"Warning: No range defined for parameter {parameter_key}")
-        return True
-        
-    if parameter_key == 'Fundamental_Frequency_Mean':
-        if gender:
-            range_values = NORMAL_RANGES[parameter_key][gender]
-        else:
-            range_values = NORMAL_RANGES[parameter_key]['default']
-    else:
-        range_values = NORMAL_RANGES[parameter_key]
-    
-    return range_values[0] <= value <= range_values[1]
-
-# Constants for styling - Apple Design System
-# Apple System Colors
-SYSTEM_BLUE = (0, 122, 255)  # Apple's primary blue
-SYSTEM_GRAY_DARK = (28, 28, 30)  # Dark gray for text
-SYSTEM_GRAY_LIGHT = (142, 142, 147)  # Light gray for secondary text
-SYSTEM_GRAY_BACKGROUND = (242, 242, 247)  # Background gray
-SYSTEM_GREEN = (52, 199, 89)  # Success green
-SYSTEM_RED = (255, 59, 48)  # Error red
-SYSTEM_WHITE = (255, 255, 255)
-LOGO_PATH = "sparrow_logo.jpg"
-
-class VoicePathologyPDF(FPDF):
-    def header(self):
-        # Clean header with generous white space
-        self.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
-        self.rect(0, 0, 210, 40, 'F')  # Header background
-        
-        if os.path.exists(LOGO_PATH):
-            self.image(LOGO_PATH, 15, 10, 20)
-
-        self.set_xy(40, 12)
-        self.set_font('Arial', 'B', 24)
-        self.set_text_color(*SYSTEM_GRAY_DARK)
-        self.cell(60, 12, 'Sparrow', 0, 0, 'L')
-
-        self.set_xy(15, 28)
-        self.set_font('Arial', '', 11)
-        self.set_text_color(*SYSTEM_GRAY_LIGHT)
-        self.cell(0, 8, 'Voice Pathology Analysis Report', 0, 1, 'L')
-
-        self.ln(18)  # More spacing after header
-
-    def colored_cell(self, w, h, txt, value, parameter_name, gender=None):
-        """Create a cell with color based on whether the value is within normal range"""
-        if isinstance(value, str):
-            value = float(value.replace('%', '').replace(' dB', ''))
-        
-        parameter_key = get_parameter_key(parameter_name)
-        if parameter_key and is_within_range(value, parameter_key, gender):
-            self.set_text_color(*SYSTEM_GREEN)
-        else:
-            self.set_text_color(*SYSTEM_RED)
-            
-        self.cell(w, h, txt, 0, 0, 'L')  # No border for cleaner look
-        self.set_text_color(*SYSTEM_GRAY_DARK)
-
-    def footer(self):
-        self.set_y(-18)
-        self.set_font('Arial', '', 9)
-        self.set_text_color(*SYSTEM_GRAY_LIGHT)
-        self.cell(0, 8, f'Page {self.page_no()}/{{nb}} | Sparrow Voice Analysis', 0, 0, 'C')
-
-    def chapter_title(self, title):
-        """Apple-style section header with clean typography"""
-        self.ln(8)  # Generous spacing before section
-        self.set_font('Arial', 'B', 18)
-        self.set_text_color(*SYSTEM_GRAY_DARK)
-        self.cell(0, 10, title, 0, 1, 'L')
-        
-        # Subtle underline
-        self.set_line_width(0.5)
-        self.set_draw_color(*SYSTEM_GRAY_LIGHT)
-        current_y = self.get_y()
-        self.line(15, current_y, 195, current_y)
-        
-        self.ln(12)  # Generous spacing after header
-
-    def chapter_body(self, text):
-        """Clean body text with proper line height"""
-        self.set_font('Arial', '', 12)
-        self.set_text_color(*SYSTEM_GRAY_DARK)
-        sections = text.split('**')
-        for i, section in enumerate(sections):
-            if i % 2 == 0:
-                self.set_font('Arial', '', 12)
-                self.set_text_color(*SYSTEM_GRAY_DARK)
-            else:
-                self.set_font('Arial', 'B', 12)
-                self.set_text_color(*SYSTEM_GRAY_DARK)
-            self.multi_cell(0, 6, section)  # Better line height
-            self.ln(2)  # Small spacing between paragraphs
-        self.ln(8)
-
-def create_pdf_report(audio_path, prediction, probabilities, report_text, features, output_pdf='medical_report.pdf', gender=None):
-    pdf = VoicePathologyPDF()
-    pdf.alias_nb_pages()
-    pdf.add_page()
-
-    # Patient Information Section - Apple style cards
-    pdf.chapter_title('Patient Information')
-    
-    # Card-style information boxes
-    card_y = pdf.get_y()
-    pdf.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
-    pdf.rect(15, card_y, 180, 20, 'F')  # Background card
-    
-    pdf.set_xy(20, card_y + 6)
-    pdf.set_font('Arial', '', 11)
-    pdf.set_text_color(*SYSTEM_GRAY_LIGHT)
-    pdf.cell(40, 6, 'Analysis Date:', 0, 0, 'L')
-    pdf.set_text_color(*SYSTEM_GRAY_DARK)
-    pdf.cell(0, 6, datetime.now().strftime('%Y-%m-%d'), 0, 1, 'L')
-    
-    pdf.set_xy(20, card_y + 12)
-    pdf.set_text_color(*SYSTEM_GRAY_LIGHT)
-    pdf.cell(40, 6, 'Predicted Condition:', 0, 0, 'L')
-    pdf.set_text_color(*SYSTEM_BLUE)
-    pdf.set_font('Arial', 'B', 11)
-    pdf.cell(0, 6, f"{prediction} ({probabilities[prediction]})", 0, 1, 'L')
-    
-    pdf.set_y(card_y + 20)
-    pdf.ln(12)
-
-    # Acoustic Measurements - Apple-style clean table
-    pdf.chapter_title('Acoustic Measurements')
-    
-    # Table header with subtle background
-    pdf.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
-    pdf.set_text_color(*SYSTEM_GRAY_DARK)
-    pdf.set_font('Arial', 'B', 10)
-    
-    # Header row
-    header_y = pdf.get_y()
-    pdf.rect(15, header_y, 180, 8, 'F')  # Header background
-    
-    col_widths = [90, 35, 35, 20]
-    headers = ['Parameter', 'Value', 'Normal Range', 'Unit']
-    
-    pdf.set_xy(18, header_y + 2)
-    for i, header in enumerate(headers):
-        pdf.cell(col_widths[i], 6, header, 0, 0, 'L')
-    pdf.ln(10)
-
-    # Measurements rows - clean, borderless design
-    pdf.set_font('Arial', '', 10)
-    measurements = [
-        ['Fundamental Frequency (Mean)', 
-         f"{features['Fundamental_Frequency_Mean']:.2f}",
-         f"{NORMAL_RANGES['Fundamental_Frequency_Mean']['default'][0]}-{NORMAL_RANGES['Fundamental_Frequency_Mean']['default'][1]}",
-         'Hz'],
-        ['Fundamental Frequency (Std)', 
-         f"{features['Fundamental_Frequency_Std']:.2f}",
-         f"{NORMAL_RANGES['Fundamental_Frequency_Std'][0]}-{NORMAL_RANGES['Fundamental_Frequency_Std'][1]}",
-         'Hz'],
-        ['Jitter',
-         f"{features['Jitter_Percent']:.2f}",
-         f"{NORMAL_RANGES['Jitter_Percent'][0]}-{NORMAL_RANGES['Jitter_Percent'][1]}",
-         '%'],
-        ['Shimmer',
-         f"{features['Shimmer_Percent']:.2f}",
-         f"{NORMAL_RANGES['Shimmer_Percent'][0]}-{NORMAL_RANGES['Shimmer_Percent'][1]}",
-         '%'],
-        ['HNR',
-         f"{features['HNR_dB']:.2f}",
-         f"{NORMAL_RANGES['HNR_dB'][0]}-{NORMAL_RANGES['HNR_dB'][1]}",
-         'dB'],
-        ['Voice Period',
-         f"{features['Voice_Period_Mean']:.4f}",
-         f"{NORMAL_RANGES['Voice_Period_Mean'][0]}-{NORMAL_RANGES['Voice_Period_Mean'][1]}",
-         's'],
-        ['Voiced Segments Ratio',
-         f"{features['Voiced_Segments_Ratio']:.2f}",
-         f"{NORMAL_RANGES['Voiced_Segments_Ratio'][0]}-{NORMAL_RANGES['Voiced_Segments_Ratio'][1]}",
-         ''],
-        ['Formant Frequency',
-         f"{features['Formant_Frequency']:.2f}",
-         f"{NORMAL_RANGES['Formant_Frequency'][0]}-{NORMAL_RANGES['Formant_Frequency'][1]}",
-         'Hz']
-    ]
-
-    for idx, row in enumerate(measurements):
-        display_name = row[0]
-        value = float(row[1])
-        row_y = pdf.get_y()
-        
-        # Alternating row backgrounds for better readability
-        if idx % 2 == 0:
-            pdf.set_fill_color(*SYSTEM_WHITE)
-        else:
-            pdf.set_fill_color(*SYSTEM_GRAY_BACKGROUND)
-        pdf.rect(15, row_y, 180, 8, 'F')
-        
-        pdf.set_xy(18, row_y + 2)
-        pdf.set_text_color(*SYSTEM_GRAY_DARK)
-        pdf.cell(col_widths[0], 6, row[0], 0, 0, 'L')
-        
-        # Value with color coding
-        pdf.set_xy(18 + col_widths[0], row_y + 2)
-        pdf.colored_cell(col_widths[1], 6, row[1], value, display_name, gender)
-        
-        pdf.set_xy(18 + col_widths[0] + col_widths[1], row_y + 2)
-        pdf.set_text_color(*SYSTEM_GRAY_LIGHT)
-        pdf.set_font('Arial', '', 9)
-        pdf.cell(col_widths[2], 6, row[2], 0, 0, 'L')
-        
-        pdf.set_xy(18 + col_widths[0] + col_widths[1] + col_widths[2], row_y + 2)
-        pdf.cell(col_widths[3], 6, row[3], 0, 0, 'L')
-        
-        pdf.set_font('Arial', '', 10)  # Reset font
-        pdf.set_text_color(*SYSTEM_GRAY_DARK)  # Reset color
-        pdf.ln(8)
-
-    pdf.ln(8)
-
-    # Detailed Analysis Section
-    pdf.chapter_title('Detailed Analysis')
-    pdf.chapter_body(report_text)
-
-    # Voice Spectrogram Page
-    pdf.add_page()
-    pdf.chapter_title('Voice Spectrogram')
-    if os.path.exists('mel_spectrogram.png'):
-        # Center and add padding around image
-        pdf.set_xy(15, pdf.get_y())
-        pdf.image('mel_spectrogram.png', x=15, w=180)
-
-    pdf.output(output_pdf)
-
-def plot_mel_spectrogram(audio_path, output_path='mel_spectrogram.png'):
+def plot_mel_spectrogram(audio, output_path='mel_spectrogram.png', sr=22050, spectral_frames=None):
+    """High-fidelity matplotlib spectrogram; reuses `spectral_frames` when given"""
     try:
-        y, sr = librosa.load(audio_path)
+        # Only this renderer needs matplotlib; the Agg backend avoids GUI warnings
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import librosa.display
+
+        y, sr = load_audio(audio, sr=sr)
+        if spectral_frames is None:
+            spectral_frames = compute_spectral_frames(y, sr)
 
         plt.figure(figsize=(12, 8))
 
@@ -737,14 +475,13 @@ def plot_mel_spectrogram(audio_path, output_path='mel_spectrogram.png'):
 
         plt.subplot(3, 1, 2)
         # Fix warning: use np.abs() to avoid phase information warning
-        S = librosa.stft(y)
-        D = librosa.amplitude_to_db(np.abs(S), ref=np.max)
+        D = librosa.amplitude_to_db(spectral_frames["S"], ref=np.max)
         librosa.display.specshow(D, sr=sr, x_axis='time', y_axis='log')
         plt.colorbar(format='%+2.0f dB')
         plt.title('Mel Spectrogram')
 
         plt.subplot(3, 1, 3)  
-        bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
+        bandwidth = spectral_frames["bandwidth"][0]
         times = librosa.times_like(bandwidth, sr=sr)
         plt.plot(times, bandwidth, color='b', label='Spectral Bandwidth')
         plt.xlabel('Time (s)')
@@ -758,69 +495,60 @@ def plot_mel_spectrogram(audio_path, output_path='mel_spectrogram.png'):
     except Exception as e:
         print(f"Error creating spectrogram: {e}")
 
-def generate_json_report(audio_path, prediction, probabilities, report_text, features):
-    acoustic_measurements = {
-        "fundamental_frequency": {
-            "mean": round(features['Fundamental_Frequency_Mean'], 2),
-            "std": round(features['Fundamental_Frequency_Std'], 2),
-            "unit": "Hz"
-        },
-        "voice_perturbation": {
-            "jitter": {
-                "value": round(features['Jitter_Percent'], 2),
-                "unit": "%"
-            },
-            "shimmer": {
-                "value": round(features['Shimmer_Percent'], 2),
-                "unit": "%"
-            },
-            "hnr": {
-                "value": round(features['HNR_dB'], 2),
-                "unit": "dB"
-            }
-        },
-        "additional_measurements": {
-            "voice_period": {
-                "value": round(features['Voice_Period_Mean'], 4),
-                "unit": "seconds"
-            },
-            "voiced_segments_ratio": round(features['Voiced_Segments_Ratio'], 2),
-            "formant_frequency": {
-                "value": round(features['Formant_Frequency'], 2),
-                "unit": "Hz"
-            }
-        }
-    }
-    
-    report = {
-        "report_metadata": {
-            "analysis_date": datetime.now().strftime('%Y-%m-%d'),
-            "audio_file": audio_path,
-            "report_type": "Voice Pathology Analysis"
-        },
-        "diagnosis": {
-            "predicted_condition": prediction,
-            "confidence_scores": probabilities
-        },
-        "acoustic_analysis": acoustic_measurements,
-        "mfcc_features": {
-            "mean": [round(x, 4) for x in features['MFCC_Mean']],
-            "std": [round(x, 4) for x in features['MFCC_Std']]
-        },
-        "detailed_report": report_text
-    }
-    
-    return json.dumps(report, indent=2)
-
-def process_audio(audio_path):
+def process_audio(audio_path, output_pdf='medical_report.pdf', extension=None, filename=None,
+                  tier=FULL, budget=None, uploads_pdf=False, user_id=None):
+    """
+    Run the analysis pipeline up to `tier` (see app/tiers.py) and return an AnalysisResult.
+    `audio_path` may also be a file object (e.g. an upload stream); pass `extension`
+    and `filename` in that case since there's no path to read them from.
+    With a `budget`, optional stages that no longer fit are dropped; `uploads_pdf`
+    tells the planner the caller still has to upload the PDF within that budget.
+    `user_id` lets the similar-case lookup include the same user's earlier recordings.
+    """
+    budget = budget or Budget()
+    # Pinned for the whole request: a hot reload only affects requests that start after it
+    model = get_model()
+    memory = MemoryTracker.start()
+    memory_record = None
     try:
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_path}")
+        # Keep the spectrogram next to the PDF so concurrent jobs don't share one image
+        spectrogram_path = os.path.splitext(output_pdf)[0] + '_spectrogram.png'
+
+        if isinstance(audio_path, str):
+            if not os.path.exists(audio_path):
+                raise FileNotFoundError(f"Audio file not found: {audio_path}")
+            filename = filename or audio_path
         
         print("\n=== Starting audio processing ===")
+        # Decode once; every stage below works on the same 16kHz waveform
+        with memory.stage("decode"):
+            y, sr, source_sr = load_audio(audio_path, extension=extension, return_source_sr=True)
+        print(f"Decoded audio: sample_rate={sr}, duration={len(y)/sr:.2f}s")
+
+        # Reject unusable audio before any of the expensive stages run
+        audio_quality = assess_quality(y, sr, source_sr)
+        if not audio_quality["passed"]:
+            raise AudioQualityError(audio_quality)
+
+        # Only speech goes to the feature and embedding stages
+        with memory.stage("vad"):
+            y, voice_activity = trim_silence(y, sr)
+        print(f"Voice activity: kept {voice_activity['speech_duration']:.2f}s of "
+              f"{voice_activity['original_duration']:.2f}s ({voice_activity['segments']} segments)")
+
+        # The feature stages below scale with the speech actually kept; reserve their
+        # estimated footprint (recordings over the per-request limit may be truncated)
+        y, memory_record = analysis_memory.admit(y, sr)
+        print(f"Memory: estimated {memory_record['estimated_mb']:.0f} MB"
+              + (f", truncated to {memory_record['truncated_to_s']:.2f}s" if memory_record["truncated_to_s"] else ""))
+
+        with stage_limits("features"), memory.stage("spectral_frames"):
+            spectral_frames = compute_spectral_frames(y, sr)
+
         print("\nStep 1: Extracting VGGish audio features...")
         try:
-            vggish_features = extract_audio_features(audio_path)
+            with stage_limits("embedding"), memory.stage("embedding"):
+                vggish_features = extract_audio_features(y)
             print(f"✓ VGGish features extracted successfully, shape: {vggish_features.shape}")
         except Exception as e:
             print(f"✗ Error extracting VGGish features: {e}")
@@ -830,7 +558,10 @@ def process_audio(audio_path):
         
         print("\nStep 2: Extracting acoustic features...")
         try:
-            acoustic_features = extract_advanced_features(audio_path)
+            with stage_limits("features"), memory.stage("features"):
+                acoustic_features = extract_advanced_features(y, spectral_frames)
+            # Voiced ratio is defined over the whole recording, and the trimmed parts held no voicing
+            acoustic_features["Voiced_Segments_Ratio"] *= 1.0 - voice_activity["trimmed_ratio"]
             print("✓ Acoustic features extracted successfully")
         except Exception as e:
             print(f"✗ Error extracting acoustic features: {e}")
@@ -845,16 +576,21 @@ def process_audio(audio_path):
             print(f"Model type: {model_type}")
             
             # TFSMLayer expects input with batch dimension
-            vggish_features_expanded = np.expand_dims(vggish_features, axis=0)
+            vggish_features_expanded = np.expand_dims(vggish_features, axis=0).astype(np.float32)
             print(f"Input shape for model: {vggish_features_expanded.shape}")
             
-            # Convert to tensor
-            input_tensor = tf.constant(vggish_features_expanded, dtype=tf.float32)
+            if model.backend.startswith("tflite"):
+                # TFLiteModel takes numpy directly; no TensorFlow import on this path
+                input_tensor = vggish_features_expanded
+            else:
+                tf = import_tensorflow()
+                input_tensor = tf.constant(vggish_features_expanded, dtype=tf.float32)
             print(f"Input tensor shape: {input_tensor.shape}, dtype: {input_tensor.dtype}")
             
             # TFSMLayer is callable directly (not a Keras Model, so no .predict())
             # It may return a dict if using serving_default endpoint
             print("Calling model with input tensor...")
+            primary_started = time.perf_counter()
             try:
                 model_output = model(input_tensor)
                 print(f"Model call succeeded! Output type: {type(model_output)}")
@@ -873,6 +609,8 @@ def process_audio(audio_path):
                 else:
                     raise RuntimeError(f"Cannot call model. Error: {call_error}")
             
+            primary_latency = time.perf_counter() - primary_started
+
             # Handle different output formats
             if isinstance(model_output, dict):
                 # If output is a dict, get the actual predictions
@@ -883,7 +621,7 @@ def process_audio(audio_path):
                 prediction = model_output
             
             # Convert to numpy if tensor
-            if isinstance(prediction, tf.Tensor):
+            if hasattr(prediction, "numpy"):
                 prediction = prediction.numpy()
             
             print(f"Prediction shape: {prediction.shape}, values (first 5): {prediction.flatten()[:5]}")
@@ -908,6 +646,8 @@ def process_audio(audio_path):
                 raise ValueError(f"Predicted class index {predicted_class} is not in label_mapping {list(label_mapping.keys())}")
             
             predicted_class_label = label_mapping[predicted_class]
+            # Candidate classifiers see the same embedding batch, off the response path
+            submit_shadow(vggish_features_expanded, predicted_class, primary_latency, label_mapping)
             probabilities = {label_mapping[i]: f"{float(prob) * 100:.2f}%" 
                             for i, prob in enumerate(prediction_probs) if i in label_mapping}
             probabilities_sorted = dict(sorted(probabilities.items(), 
@@ -924,58 +664,108 @@ def process_audio(audio_path):
             traceback.print_exc()
             raise RuntimeError(f"Failed to make prediction: {error_msg}")
 
-        print("\nStep 4: Generating spectrogram...")
-        try:
-            plot_mel_spectrogram(audio_path)
-            print("✓ Spectrogram generated")
-        except Exception as e:
-            print(f"⚠ Warning: Error generating spectrogram: {e}")
-            # Don't fail if spectrogram generation fails
-
-        print("\nStep 5: Generating medical report...")
-        # generate_medical_report always returns a report (API or fallback)
-        # No need for try-except as it handles all errors internally
-        report_text = generate_medical_report(acoustic_features, 
-                                              predicted_class_label, 
-                                              probabilities_sorted)
-        print("✓ Medical report generated")
-
-        print("\nStep 6: Creating PDF report...")
-        try:
-            create_pdf_report(audio_path, predicted_class_label, 
-                             probabilities_sorted, report_text, acoustic_features)
-            print("✓ PDF report created")
-        except Exception as e:
-            print(f"✗ Error creating PDF: {e}")
-            import traceback
-            traceback.print_exc()
-            raise RuntimeError(f"Failed to create PDF report: {str(e)}")
-
-        print("\nStep 7: Creating JSON report...")
-        try:
-            json_report = generate_json_report(audio_path, 
-                                              predicted_class_label,
-                                              probabilities_sorted, 
-                                              report_text, 
-                                              acoustic_features)
-
-            with open('medical_report.json', 'w') as f:
-                f.write(json_report)
-            print("✓ JSON report created")
-        except Exception as e:
-            print(f"✗ Error creating JSON report: {e}")
-            import traceback
-            traceback.print_exc()
-            raise RuntimeError(f"Failed to create JSON report: {str(e)}")
+        similar_cases = None
+        if SIMILARITY_INDEX_ENABLED:
+            try:
+                similar_cases = find_similar_cases(vggish_features, predicted_class_label, user_id)
+                print(f"✓ Similar cases: {len(similar_cases['nearest'])} nearest, "
+                      f"{len(similar_cases['same_user'])} from the same user")
+            except Exception as e:
+                print(f"⚠ Warning: Similar-case lookup failed: {e}")
+
+        planned_tier = tier
+        if tier == FULL and uploads_pdf and not cloudinary_calls.available():
+            # The PDF couldn't be uploaded now, so don't spend the LLM call and render
+            # on it; the caller gets the analysis with the rule-based findings instead
+            print("⚠ Warning: Cloudinary breaker open or bulkhead full; delivering the standard tier")
+            planned_tier = STANDARD
+        delivered_tier = plan_tier(planned_tier, budget, skip_stages=() if uploads_pdf else ("upload",))
+        print(f"\nExecution tier: requested={tier}, delivered={delivered_tier}, "
+              f"remaining budget={budget.remaining():.2f}s")
+        report_text = None
+        if delivered_tier != FULL:
+            # Only the spectrogram still needs the waveform and STFT
+            y = spectral_frames = None
+
+        if delivered_tier == STANDARD:
+            print("\nStep 5: Generating rule-based analysis...")
+            with timed_stage("fallback_report"):
+                report_text = generate_fallback_analysis(acoustic_features, predicted_class_label, probabilities_sorted)
+            print("✓ Rule-based analysis generated")
+
+        if delivered_tier == FULL:
+            print("\nStep 4: Generating spectrogram...")
+            try:
+                with stage_limits("render"), timed_stage("spectrogram"), memory.stage("spectrogram"):
+                    if SPECTROGRAM_RENDERER == "matplotlib":
+                        plot_mel_spectrogram(y, spectrogram_path, sr=sr, spectral_frames=spectral_frames)
+                    else:
+                        render_spectrogram(y, sr, spectral_frames["S"], spectral_frames["bandwidth"][0], spectrogram_path)
+                print("✓ Spectrogram generated")
+            except Exception as e:
+                print(f"⚠ Warning: Error generating spectrogram: {e}")
+                # Don't fail if spectrogram generation fails
+            # Released before the LLM call, which can keep this request alive for seconds
+            y = spectral_frames = None
+
+            print("\nStep 5: Generating medical report...")
+            # generate_medical_report always returns a report (API or fallback)
+            # No need for try-except as it handles all errors internally
+            later_stages = ("pdf", "upload") if uploads_pdf else ("pdf",)
+            llm_timeout = None
+            if budget.deadline is not None:
+                llm_timeout = max(1.0, budget.remaining() - stage_costs.estimate(later_stages))
+            with timed_stage("llm_report"):
+                report_text = generate_medical_report(acoustic_features,
+                                                      predicted_class_label,
+                                                      probabilities_sorted,
+                                                      timeout=llm_timeout)
+            print("✓ Medical report generated")
+
+            print("\nStep 6: Creating PDF report...")
+            try:
+                with timed_stage("pdf"), memory.stage("pdf"):
+                    create_pdf_report(filename, predicted_class_label,
+                                     probabilities_sorted, report_text, acoustic_features,
+                                     output_pdf=output_pdf, spectrogram_path=spectrogram_path)
+                print("✓ PDF report created")
+                if os.path.exists(spectrogram_path):
+                    os.remove(spectrogram_path)
+            except Exception as e:
+                print(f"✗ Error creating PDF: {e}")
+                import traceback
+                traceback.print_exc()
+                raise RuntimeError(f"Failed to create PDF report: {str(e)}")
+
+        result = AnalysisResult(
+            audio_file=filename,
+            predicted_condition=predicted_class_label,
+            confidence_scores=probabilities_sorted,
+            features=acoustic_features,
+            report_text=report_text,
+            voice_activity=voice_activity,
+            audio_quality=audio_quality,
+            execution_tier=tier_summary(tier, delivered_tier, budget),
+            similar_cases=similar_cases,
+            pdf_path=output_pdf if delivered_tier == FULL else None,
+            model_version=model.version,
+            memory=dict(memory_record, **memory.finish()),
+        )
 
         print("\n=== Report generated successfully! ===")
-        return json_report
+        return result
         
+    except (AudioQualityError, MemoryBudgetExceeded) as e:
+        print(f"\n✗ {e}")
+        raise
     except Exception as e:
         error_msg = f"Error processing audio: {str(e)}"
         print(f"\n✗ {error_msg}")
         import traceback
         traceback.print_exc()
         raise RuntimeError(error_msg)
+    finally:
+        analysis_memory.release(memory_record)
+        memory.finish()
 
 # process_audio("Sample_1(vocal polyp).wav")
\ No newline at end of file
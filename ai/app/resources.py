@@ -0,0 +1,229 @@
+# Central CPU resource configuration for the AI process.
+# TensorFlow's intra/inter-op pools, the BLAS pools under numpy/scipy and numba
+# (pulled in by librosa) each size themselves to the whole machine by default,
+# which oversubscribes the cores as soon as several requests are in flight.
+# configure_environment() has to run before those libraries are imported,
+# so app/__init__.py calls it first.
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+RESOURCE_GOVERNOR = os.getenv("RESOURCE_GOVERNOR", "1") == "1"
+
+
+def parse_cpu_list(value):
+    """'0-3,6' -> {0, 1, 2, 3, 6}"""
+    cores = set()
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cores.update(range(int(start), int(end) + 1))
+        else:
+            cores.add(int(part))
+    return cores
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Cores the main process is pinned to (empty = no pinning), and the ones reserved for PDF workers
+CPU_AFFINITY = parse_cpu_list(os.getenv("CPU_AFFINITY", ""))
+PDF_CPU_AFFINITY = parse_cpu_list(os.getenv("PDF_CPU_AFFINITY", ""))
+
+CPU_CORES = len(CPU_AFFINITY) or available_cores()
+# Requests expected to run feature extraction at the same time
+EXPECTED_CONCURRENCY = max(1, int(os.getenv("EXPECTED_CONCURRENCY", "4")))
+PER_REQUEST_THREADS = max(1, CPU_CORES // EXPECTED_CONCURRENCY)
+
+# TensorFlow's pools are shared by every request, so they get the whole budget
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", str(CPU_CORES)))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "2"))
+# BLAS and numba pools are entered from each request thread, so they get a per-request share
+BLAS_THREADS = int(os.getenv("BLAS_THREADS", str(PER_REQUEST_THREADS)))
+NUMBA_THREADS = int(os.getenv("NUMBA_THREADS", str(PER_REQUEST_THREADS)))
+
+
+def _parse_stage_threads(value):
+    """'features=2,render=1' -> {'features': 2, 'render': 1}"""
+    stages = {}
+    for part in (value or "").split(","):
+        if "=" in part:
+            name, threads = part.split("=", 1)
+            stages[name.strip()] = max(1, int(threads))
+    return stages
+
+
+# numba threads a stage may use while it runs (BLAS is capped at BLAS_THREADS
+# for the whole process instead, see limit_blas)
+STAGE_THREADS = {
+    "embedding": PER_REQUEST_THREADS,
+    "features": PER_REQUEST_THREADS,
+    "inference": PER_REQUEST_THREADS,  # TFLite interpreter threads
+    "render": 1,
+}
+STAGE_THREADS.update(_parse_stage_threads(os.getenv("STAGE_THREADS", "")))
+
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+_threadpool_controller = None
+_controller_lock = threading.Lock()
+_blas_limited = False
+_blas_lock = threading.Lock()
+
+
+def configure_environment():
+    """Size the BLAS/OpenMP and numba pools; only effective before those libraries load"""
+    if not RESOURCE_GOVERNOR:
+        return
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(BLAS_THREADS))
+    os.environ.setdefault("NUMBA_NUM_THREADS", str(NUMBA_THREADS))
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(TF_INTRA_OP_THREADS))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(TF_INTER_OP_THREADS))
+    if CPU_AFFINITY:
+        pin_process(CPU_AFFINITY)
+
+
+def configure_tensorflow(tf):
+    """Size TensorFlow's pools; must run before the first op executes"""
+    if not RESOURCE_GOVERNOR:
+        return
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+    except RuntimeError as e:
+        # TensorFlow was already initialised by an earlier import
+        print(f"Warning: Could not set TensorFlow thread pools: {e}")
+
+
+_tensorflow_configured = False
+_tensorflow_lock = threading.Lock()
+
+
+def import_tensorflow():
+    """Import TensorFlow on first use and size its pools before any op runs"""
+    global _tensorflow_configured
+    import tensorflow as tf
+    if not _tensorflow_configured:
+        with _tensorflow_lock:
+            if not _tensorflow_configured:
+                configure_tensorflow(tf)
+                _tensorflow_configured = True
+    return tf
+
+
+def pin_process(cores):
+    """Pin the calling process to `cores` (Linux only)"""
+    if not cores:
+        return
+    try:
+        os.sched_setaffinity(0, cores)
+    except (AttributeError, OSError) as e:
+        print(f"Warning: Could not pin process to cores {sorted(cores)}: {e}")
+
+
+def _controller():
+    global _threadpool_controller
+    if _threadpool_controller is None:
+        with _controller_lock:
+            if _threadpool_controller is None:
+                from threadpoolctl import ThreadpoolController
+                _threadpool_controller = ThreadpoolController()
+    return _threadpool_controller
+
+
+def limit_blas():
+    """
+    Cap every loaded BLAS pool at BLAS_THREADS, once per process. The environment
+    variables only reach libraries loaded after configure_environment(); this
+    catches the ones that were already loaded. BLAS limits are process-wide, so
+    they are never changed per stage: overlapping stages saving and restoring
+    them would race and leave whichever value was restored last.
+    """
+    global _blas_limited
+    if _blas_limited:
+        return
+    with _blas_lock:
+        if not _blas_limited:
+            from threadpoolctl import ThreadpoolController
+            # A fresh controller sees every library loaded so far; the limit isn't
+            # used as a context manager, so it stays in place
+            ThreadpoolController().limit(limits=BLAS_THREADS, user_api="blas")
+            _blas_limited = True
+
+
+@contextmanager
+def stage_limits(stage):
+    """Cap numba threads for the duration of one pipeline stage"""
+    if not RESOURCE_GOVERNOR or stage not in STAGE_THREADS:
+        yield
+        return
+
+    limit_blas()
+    threads = STAGE_THREADS[stage]
+    numba_previous = None
+    try:
+        import numba
+        # numba's thread count is per calling thread, so concurrent stages don't interfere
+        numba_previous = numba.get_num_threads()
+        numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+    except ImportError:
+        numba = None
+
+    try:
+        yield
+    finally:
+        if numba is not None and numba_previous is not None:
+            numba.set_num_threads(numba_previous)
+
+
+def effective_settings():
+    """Thread and affinity settings actually in effect, for the diagnostics endpoint"""
+    settings = {
+        "governor_enabled": RESOURCE_GOVERNOR,
+        "cpu_cores": CPU_CORES,
+        "expected_concurrency": EXPECTED_CONCURRENCY,
+        "stage_threads": dict(STAGE_THREADS),
+        "environment": {var: os.environ.get(var) for var in BLAS_ENV_VARS + ("NUMBA_NUM_THREADS",)},
+    }
+    try:
+        settings["affinity"] = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        settings["affinity"] = None
+    # Only report TensorFlow if this process has loaded it; don't import it just for diagnostics
+    tf = sys.modules.get("tensorflow")
+    settings["tensorflow"] = {
+        "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads(),
+    } if tf is not None else None
+    try:
+        import numba
+        settings["numba"] = {
+            "max_threads": numba.config.NUMBA_NUM_THREADS,
+            "current_threads": numba.get_num_threads(),
+            "threading_layer": numba.config.THREADING_LAYER,
+        }
+    except ImportError:
+        settings["numba"] = None
+    try:
+        settings["blas"] = [
+            {key: info.get(key) for key in ("internal_api", "num_threads", "version", "filepath")}
+            for info in _controller().info()
+        ]
+    except ImportError:
+        settings["blas"] = None
+    return settings
@@ -0,0 +1,177 @@
+# In-memory result of one analysis and its wire formats.
+# process_audio returns an AnalysisResult; the HTTP layer turns it into the
+# response payload and serializes it exactly once, as compact JSON or msgpack
+# depending on the Accept header. Per-request internals (tier timings, memory)
+# stay out of the payload and are kept for GET /api/diagnostics/analyses.
+import json
+import os
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from flask import Response, request
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# Analyses whose diagnostics are kept for the diagnostics endpoint
+DIAGNOSTICS_HISTORY = int(os.getenv("DIAGNOSTICS_HISTORY", "100"))
+
+recent_diagnostics = deque(maxlen=DIAGNOSTICS_HISTORY)
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    audio_file: str
+    predicted_condition: str
+    confidence_scores: Dict[str, str]    # label -> "97.12%", highest first
+    features: Dict[str, Any]             # extract_advanced_features output
+    report_text: Optional[str] = None    # LLM or rule-based findings; None in the fast tier
+    analysis_date: str = field(default_factory=lambda: datetime.now().strftime('%Y-%m-%d'))
+    voice_activity: Optional[Dict[str, Any]] = None
+    audio_quality: Optional[Dict[str, Any]] = None
+    execution_tier: Optional[Dict[str, Any]] = None
+    similar_cases: Optional[Dict[str, Any]] = None
+    pdf_path: Optional[str] = None       # Set when the PDF was rendered
+    model_version: Optional[str] = None  # Classifier version that produced the prediction
+    memory: Optional[Dict[str, Any]] = None  # Estimated footprint and per-stage RSS / traced peaks
+    analysis_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def mfcc_summary(self) -> Dict[str, List[float]]:
+        return {
+            "mean": [round(x, 4) for x in self.features['MFCC_Mean']],
+            "std": [round(x, 4) for x in self.features['MFCC_Std']]
+        }
+
+    def formant_summary(self) -> Dict[str, Any]:
+        """F1-F3 medians and interquartile ranges over the voiced frames"""
+        features = self.features
+        return {
+            "f1": {"median": round(features['Formant_Frequency'], 2),
+                   "iqr": round(features.get('Formant_F1_IQR', 0.0), 2)},
+            "f2": {"median": round(features.get('Formant_F2_Frequency', 0.0), 2),
+                   "iqr": round(features.get('Formant_F2_IQR', 0.0), 2)},
+            "f3": {"median": round(features.get('Formant_F3_Frequency', 0.0), 2),
+                   "iqr": round(features.get('Formant_F3_IQR', 0.0), 2)},
+            "voiced_frames": features.get('Formant_Frames', 0),
+            "unit": "Hz"
+        }
+
+    def to_report(self) -> Dict[str, Any]:
+        """The full structured report (the former medical_report.json layout), served with ?detail=full"""
+        features = self.features
+        acoustic_measurements = {
+            "fundamental_frequency": {
+                "mean": round(features['Fundamental_Frequency_Mean'], 2),
+                "std": round(features['Fundamental_Frequency_Std'], 2),
+                "unit": "Hz"
+            },
+            "voice_perturbation": {
+                "jitter": {
+                    "value": round(features['Jitter_Percent'], 2),
+                    "rap": round(features.get('Jitter_RAP_Percent', 0.0), 2),
+                    "ppq5": round(features.get('Jitter_PPQ5_Percent', 0.0), 2),
+                    "unit": "%"
+                },
+                "shimmer": {
+                    "value": round(features['Shimmer_Percent'], 2),
+                    "apq11": round(features.get('Shimmer_APQ11_Percent', 0.0), 2),
+                    "unit": "%"
+                },
+                "glottal_cycles": features.get('Glottal_Cycles', 0),
+                "hnr": {
+                    "value": round(features['HNR_dB'], 2),
+                    "unit": "dB"
+                }
+            },
+            "additional_measurements": {
+                "voice_period": {
+                    "value": round(features['Voice_Period_Mean'], 4),
+                    "unit": "seconds"
+                },
+                "voiced_segments_ratio": round(features['Voiced_Segments_Ratio'], 2),
+                "formant_frequency": {
+                    "value": round(features['Formant_Frequency'], 2),
+                    "unit": "Hz"
+                },
+                "formants": self.formant_summary()
+            }
+        }
+
+        report = {
+            "report_metadata": {
+                "analysis_date": self.analysis_date,
+                "audio_file": self.audio_file,
+                "report_type": "Voice Pathology Analysis",
+                "model_version": self.model_version
+            },
+            "diagnosis": {
+                "predicted_condition": self.predicted_condition,
+                "confidence_scores": self.confidence_scores
+            },
+            "acoustic_analysis": acoustic_measurements,
+            "mfcc_features": self.mfcc_summary(),
+            "detailed_report": self.report_text
+        }
+        for key in ("voice_activity", "audio_quality", "similar_cases"):
+            value = getattr(self, key)
+            if value is not None:
+                report[key] = value
+        return report
+
+    def diagnostics(self) -> Dict[str, Any]:
+        """Internals of this run for the diagnostics endpoint, not for clients"""
+        return {
+            "analysis_id": self.analysis_id,
+            "analysis_date": self.analysis_date,
+            "model_version": self.model_version,
+            "execution_tier": self.execution_tier,
+            "memory": self.memory
+        }
+
+    def to_response(self, pdf_url=None, detail=False) -> Dict[str, Any]:
+        """Payload of /api/process_audio, in the shape the Node server stores; detail adds the full report"""
+        mfcc = self.mfcc_summary()
+        response = {
+            "Acoustic Features": {
+                "Jitter_Percent": round(self.features['Jitter_Percent'], 2),
+                "MFCC_Mean": mfcc["mean"],
+                "MFCC_Std": mfcc["std"],
+                "Shimmer_Percent": round(self.features['Shimmer_Percent'], 2)
+            },
+            "Analysis Date": self.analysis_date,
+            "Confidence Scores": {
+                label: self.confidence_scores.get(label)
+                for label in ("Healthy", "Laryngitis", "Vocal Polyp")
+            },
+            "Findings": self.report_text,
+            "Formants": self.formant_summary(),
+            "PDF_URL": pdf_url,
+            "Prediction": self.predicted_condition,
+            "Model Version": self.model_version,
+            "Analysis ID": self.analysis_id,
+            # Which tier was delivered matters to the client; its timings are diagnostics
+            "Tier": self.execution_tier["delivered"] if self.execution_tier else None,
+            "Voice Activity": self.voice_activity,
+            "Audio Quality": self.audio_quality,
+            "Similar Cases": self.similar_cases
+        }
+        if detail:
+            response["Report"] = self.to_report()
+        return response
+
+
+def wants_msgpack():
+    best = request.accept_mimetypes.best_match(("application/json",) + MSGPACK_TYPES, default="application/json")
+    return best in MSGPACK_TYPES
+
+
+def encode_response(payload, status=200):
+    """Serialize `payload` once: msgpack if the client asks for it, compact JSON otherwise"""
+    if wants_msgpack():
+        import msgpack
+        response = Response(msgpack.packb(payload, use_bin_type=True), status=status, content_type="application/msgpack")
+    else:
+        body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+        response = Response(body, status=status, content_type="application/json")
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,180 @@
+# Shadow evaluation of candidate classifiers on live traffic.
+# process_audio hands the VGGish embedding batch it already built for the primary
+# model to submit_shadow(); background threads run it through each candidate in
+# SHADOW_MODELS and compare against the primary prediction. Nothing here runs on
+# the request thread beyond a non-blocking enqueue, and when the queue is full
+# the job is dropped rather than slowing the request down.
+import os
+import queue
+import threading
+import time
+from collections import deque
+import numpy as np
+
+SHADOW_MODELS = [path.strip() for path in os.getenv("SHADOW_MODELS", "").split(",") if path.strip()]
+SHADOW_BACKEND = os.getenv("SHADOW_BACKEND", "savedmodel")
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "32"))
+LATENCY_WINDOW = 1000  # Recent calls kept for the latency percentiles
+
+SHADOW_ENABLED = bool(SHADOW_MODELS)
+
+
+def output_class(output):
+    """Class index from a classifier output (dict of outputs, tensor or array)"""
+    if isinstance(output, dict):
+        output = output[list(output.keys())[0]]
+    if hasattr(output, "numpy"):
+        output = output.numpy()
+    return int(np.argmax(np.asarray(output).reshape(-1)))
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    values = np.fromiter(samples, dtype=np.float64) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+    }
+
+
+class CandidateStats:
+    """Agreement, confusion (primary label x candidate label) and latency of one candidate"""
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.compared = 0
+        self.agreed = 0
+        self.errors = 0
+        self.confusion = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.primary_latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, primary_label, candidate_label, latency, primary_latency):
+        self.compared += 1
+        self.agreed += primary_label == candidate_label
+        row = self.confusion.setdefault(primary_label, {})
+        row[candidate_label] = row.get(candidate_label, 0) + 1
+        self.latencies.append(latency)
+        self.primary_latencies.append(primary_latency)
+
+    def summary(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "compared": self.compared,
+            "agreement": round(self.agreed / self.compared, 4) if self.compared else None,
+            "errors": self.errors,
+            "confusion": self.confusion,
+            "latency": _percentiles(self.latencies),
+            "primary_latency": _percentiles(self.primary_latencies),
+        }
+
+
+class ShadowEvaluator:
+    def __init__(self, paths, backend, workers, queue_size):
+        self.paths = paths
+        self.backend = backend
+        self.stats = {path: CandidateStats(path) for path in paths}
+        self.submitted = 0
+        self.dropped = 0
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._candidates = None
+        self._load_lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"shadow-worker-{i}", daemon=True).start()
+
+    def submit(self, inputs, primary_class, primary_latency, labels):
+        """Queue one comparison; never blocks the caller"""
+        try:
+            self._jobs.put_nowait((inputs, primary_class, primary_latency, labels))
+            with self._lock:
+                self.submitted += 1
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _load_candidates(self):
+        """Candidates are loaded in the worker, so loading them never touches a request either"""
+        with self._load_lock:
+            if self._candidates is None:
+                from app import SavedModelWrapper
+                candidates = {}
+                for path in self.paths:
+                    try:
+                        candidate = SavedModelWrapper.load(path, self.backend, "serving_default")
+                        candidate.warm_up()
+                        self.stats[path].version = candidate.version
+                        candidates[path] = candidate
+                    except Exception as e:
+                        print(f"⚠ Warning: Could not load shadow model {path}: {e}")
+                self._candidates = candidates
+        return self._candidates
+
+    def _run(self):
+        while True:
+            inputs, primary_class, primary_latency, labels = self._jobs.get()
+            try:
+                self._evaluate(inputs, primary_class, primary_latency, labels)
+            except Exception as e:
+                print(f"⚠ Warning: Shadow evaluation failed: {e}")
+            finally:
+                self._jobs.task_done()
+
+    def _evaluate(self, inputs, primary_class, primary_latency, labels):
+        candidates = self._load_candidates()
+        if candidates and not self.backend.startswith("tflite"):
+            from app.resources import import_tensorflow
+            inputs = import_tensorflow().constant(inputs)
+        primary_label = labels.get(primary_class, str(primary_class))
+
+        for path, candidate in candidates.items():
+            started = time.perf_counter()
+            try:
+                candidate_class = output_class(candidate(inputs))
+            except Exception as e:
+                print(f"⚠ Warning: Shadow model {path} failed: {e}")
+                with self._lock:
+                    self.stats[path].errors += 1
+                continue
+            latency = time.perf_counter() - started
+            with self._lock:
+                self.stats[path].record(primary_label, labels.get(candidate_class, str(candidate_class)),
+                                        latency, primary_latency)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "queued": self._jobs.qsize(),
+                "candidates": [stats.summary() for stats in self.stats.values()],
+            }
+
+
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+
+def get_evaluator():
+    global _evaluator
+    if _evaluator is None:
+        with _evaluator_lock:
+            if _evaluator is None:
+                _evaluator = ShadowEvaluator(SHADOW_MODELS, SHADOW_BACKEND, SHADOW_WORKERS, SHADOW_QUEUE_SIZE)
+    return _evaluator
+
+
+def submit_shadow(inputs, primary_class, primary_latency, labels):
+    """Compare the candidates against the primary prediction in the background"""
+    if SHADOW_ENABLED:
+        get_evaluator().submit(inputs, primary_class, primary_latency, labels)
+
+
+def shadow_summary():
+    if not SHADOW_ENABLED:
+        return {"enabled": False}
+    return get_evaluator().summary()
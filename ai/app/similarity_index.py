@@ -0,0 +1,343 @@
+# Similar-case retrieval over pooled VGGish embeddings.
+# Each analysed recording is reduced to one L2-normalised vector (mean and std of
+# its VGGish frames) and appended to a memory-mapped matrix on disk. Queries use
+# an inverted-file (IVF) index: vectors are bucketed by their nearest k-means
+# centroid and only the `nprobe` closest buckets are scored. Until enough cases
+# exist to train the centroids, the (small) matrix is scanned directly. Training
+# runs on a background thread and is swapped in when done, so adds and searches
+# never wait for k-means. Several worker processes (gunicorn -w N) can share one
+# directory: every add and search holds a flock on it and first catches up with
+# whatever the other processes committed.
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so only one process may use a directory
+    fcntl = None
+
+SIMILARITY_INDEX_ENABLED = os.getenv("SIMILARITY_INDEX_ENABLED", "1") == "1"
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", "similarity_index")
+SIMILAR_CASES_K = int(os.getenv("SIMILAR_CASES_K", "5"))
+
+EMBEDDING_DIM = 128
+VECTOR_DIM = 2 * EMBEDDING_DIM   # mean + std of the frames
+INITIAL_CAPACITY = 1024
+TRAIN_MIN_VECTORS = 1024         # Below this the index is scanned exhaustively
+RETRAIN_GROWTH = 4               # Retrain the centroids when the index has grown this much
+KMEANS_ITERATIONS = 10
+NPROBE = int(os.getenv("SIMILARITY_NPROBE", "8"))
+
+
+def _bucket(vectors, centroids):
+    """IVF lists: the row numbers nearest to each centroid"""
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    order = np.argsort(assignments, kind="stable")
+    bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+    return [list(order[bounds[i]:bounds[i + 1]]) for i in range(len(centroids))]
+
+
+def pool_embeddings(embeddings):
+    """(frames, 128) VGGish matrix -> unit-length (256,) vector, ignoring zero padding"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    frames = embeddings[np.any(embeddings != 0, axis=1)]
+    if len(frames) == 0:
+        frames = embeddings
+    pooled = np.concatenate([frames.mean(axis=0), frames.std(axis=0)])
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm > 0 else pooled
+
+
+def _kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means (cosine) on unit vectors; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        # Re-seed empty clusters so every bucket stays in use
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+
+class SimilarityIndex:
+    """
+    Append-only IVF index persisted under `directory`:
+      vectors.f32    memory-mapped (capacity, VECTOR_DIM) float32 matrix
+      cases.jsonl    one metadata record per row, in row order
+      centroids.npy  IVF centroids (once trained)
+      index.json     row count and training state, replaced atomically
+      index.lock     flock'd by whichever process is reading or writing the files
+
+    index.json is written last, so its count is the commit point: rows and case
+    records past it are from an add that didn't finish and are dropped on open.
+    """
+    def __init__(self, directory, dim=VECTOR_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._training = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(self._path("index.lock"), "a")
+
+        self.count = 0
+        self.trained_count = 0
+        self.capacity = INITIAL_CAPACITY
+        self.vectors = None
+        self.cases = []
+        self._cases_offset = 0
+        # A user's own history is small, so it's scanned exhaustively rather than through the IVF buckets
+        self.user_rows = {}
+        self.centroids = None
+        self.lists = None
+        with self._locked(exclusive=True, sync=False):
+            state = self._read_state()
+            self.count = state.get("count", 0)
+            self.trained_count = state.get("trained_count", 0)
+            self.capacity = max(INITIAL_CAPACITY, state.get("capacity", 0))
+            self.vectors = self._open_vectors(self.capacity)
+            # Truncating an interrupted add is only safe while no other process is adding
+            for case in self._read_cases():
+                self._index_case(case)
+            if self.trained_count and os.path.exists(self._path("centroids.npy")):
+                self.centroids = np.load(self._path("centroids.npy"))
+                self._build_lists()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _locked(self, exclusive, sync=True):
+        """
+        Hold the thread lock and the directory's flock (shared for reads), caught up
+        with the rows and centroids other processes have committed
+        """
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if sync:
+                    self._sync()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Pick up what other processes committed since this one last looked"""
+        state = self._read_state()
+        if state.get("capacity", 0) > self.capacity:
+            self.vectors.flush()
+            del self.vectors
+            self.capacity = state["capacity"]
+            self.vectors = self._open_vectors(self.capacity)
+
+        known = self.count
+        if state.get("count", 0) > known:
+            with open(self._path("cases.jsonl"), "rb") as f:
+                f.seek(self._cases_offset)
+                for line in f:
+                    if self.count == state["count"]:
+                        break
+                    self._cases_offset += len(line)
+                    self._index_case(json.loads(line))
+                    self.count += 1
+
+        trained_count = state.get("trained_count", 0)
+        if trained_count != self.trained_count:
+            # Another process retrained; its centroids replace ours and every row is re-bucketed
+            self.trained_count = trained_count
+            self.centroids = np.load(self._path("centroids.npy"))
+            self._build_lists()
+        elif self.centroids is not None and self.count > known:
+            new = np.asarray(self.vectors[known:self.count])
+            for row, bucket in enumerate(np.argmax(new @ self.centroids.T, axis=1), start=known):
+                self.lists[bucket].append(row)
+
+    def _index_case(self, case):
+        """Keep a committed case record in memory as the next row"""
+        row = len(self.cases)
+        self.cases.append(case)
+        if case.get("user_id"):
+            self.user_rows.setdefault(case["user_id"], []).append(row)
+
+    def _read_state(self):
+        try:
+            with open(self._path("index.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_state(self):
+        tmp = self._path("index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"count": self.count, "capacity": self.capacity,
+                       "trained_count": self.trained_count, "dim": self.dim}, f)
+        os.replace(tmp, self._path("index.json"))
+
+    def _read_cases(self):
+        """The first `count` case records, cutting cases.jsonl back to them if an add was interrupted"""
+        path = self._path("cases.jsonl")
+        cases, committed = [], 0
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    if len(cases) == self.count:
+                        break
+                    # A torn last line (no newline) never belongs to a committed row
+                    if not line.endswith(b"\n"):
+                        break
+                    cases.append(json.loads(line))
+                    committed += len(line)
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+        except FileNotFoundError:
+            return []
+        if size > committed:
+            with open(path, "r+b") as f:
+                f.truncate(committed)
+        self._cases_offset = committed
+        # Records are written before the count, so this only happens if cases.jsonl was damaged
+        self.count = len(cases)
+        return cases
+
+    def _open_vectors(self, capacity):
+        path = self._path("vectors.f32")
+        size = capacity * self.dim * 4
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _grow(self):
+        self.vectors.flush()
+        del self.vectors
+        self.capacity *= 2
+        self.vectors = self._open_vectors(self.capacity)
+
+    def _build_lists(self):
+        """Bucket every stored row under its nearest centroid"""
+        self.lists = _bucket(np.asarray(self.vectors[:self.count]), self.centroids)
+
+    def _start_training(self):
+        """Train new centroids on the rows stored so far, off the request thread (lock held)"""
+        if self._training is not None:
+            return
+        vectors = np.array(self.vectors[:self.count])
+        self._training = threading.Thread(target=self._train, args=(vectors,), daemon=True,
+                                          name="similarity-index-train")
+        self._training.start()
+
+    def _train(self, vectors):
+        """k-means and bucketing run unlocked; rows added meanwhile are bucketed at the swap"""
+        try:
+            centroids = _kmeans(vectors, max(1, int(np.sqrt(len(vectors)))))
+            lists = _bucket(vectors, centroids)
+            tmp = self._path("centroids.tmp.npy")
+            np.save(tmp, centroids)
+            with self._locked(exclusive=True):
+                if self.count > len(vectors):
+                    late = np.asarray(self.vectors[len(vectors):self.count])
+                    for row, bucket in enumerate(np.argmax(late @ centroids.T, axis=1), start=len(vectors)):
+                        lists[bucket].append(row)
+                os.replace(tmp, self._path("centroids.npy"))
+                self.centroids, self.lists = centroids, lists
+                self.trained_count = len(vectors)
+                self._write_state()
+        finally:
+            with self._lock:
+                self._training = None
+
+    def add(self, vector, metadata):
+        """Append one pooled vector; returns its case id"""
+        case = dict(metadata, case_id=uuid.uuid4().hex, analysed_at=datetime.now().isoformat(timespec="seconds"))
+        line = (json.dumps(case) + "\n").encode()
+        with self._locked(exclusive=True):
+            if self.count == self.capacity:
+                self._grow()
+            row = self.count
+            # Vector and case record first, the count last: a crash in between
+            # leaves rows past the count, which the next open discards
+            self.vectors[row] = vector
+            self.vectors.flush()
+            with open(self._path("cases.jsonl"), "ab") as f:
+                f.write(line)
+            self.count += 1
+            self._write_state()
+
+            self._cases_offset += len(line)
+            self._index_case(case)
+            if self.centroids is not None:
+                bucket = int(np.argmax(self.centroids @ vector))
+                self.lists[bucket].append(row)
+            if self.count >= max(TRAIN_MIN_VECTORS, RETRAIN_GROWTH * self.trained_count):
+                self._start_training()
+        return case["case_id"]
+
+    def _candidates(self, vector):
+        if self.centroids is None:
+            return np.arange(self.count)
+        nprobe = min(NPROBE, len(self.centroids))
+        buckets = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+        return np.fromiter((row for bucket in buckets for row in self.lists[bucket]), dtype=np.int64)
+
+    def search(self, vector, k=SIMILAR_CASES_K, user_id=None):
+        """Top-k stored cases by cosine distance, optionally restricted to one user"""
+        with self._locked(exclusive=False):
+            if user_id is not None:
+                rows = np.array(self.user_rows.get(user_id, []), dtype=np.int64)
+            else:
+                rows = self._candidates(vector)
+            if len(rows) == 0:
+                return []
+            distances = 1.0 - self.vectors[rows] @ vector
+            top = np.argsort(distances)[:k] if len(rows) <= k else np.argpartition(distances, k)[:k]
+            top = top[np.argsort(distances[top])]
+            return [self._neighbour(int(rows[i]), float(distances[i])) for i in top]
+
+    def _neighbour(self, row, distance):
+        case = self.cases[row]
+        return {
+            "case_id": case["case_id"],
+            "distance": round(distance, 4),
+            "predicted_condition": case.get("predicted_condition"),
+            "analysed_at": case.get("analysed_at"),
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex(SIMILARITY_INDEX_DIR)
+    return _index
+
+
+def find_similar_cases(embeddings, predicted_condition, user_id=None, k=SIMILAR_CASES_K):
+    """
+    Query the index with a new recording, then add it.
+    Returns the new case id plus the nearest cases overall and for the same user.
+    """
+    index = get_index()
+    vector = pool_embeddings(embeddings)
+    similar = {
+        "nearest": index.search(vector, k),
+        "same_user": index.search(vector, k, user_id=user_id) if user_id else [],
+    }
+    similar["case_id"] = index.add(vector, {"predicted_condition": predicted_condition, "user_id": user_id})
+    return similar
@@ -0,0 +1,152 @@
+import struct
+import zlib
+import numpy as np
+
+# Image layout (pixels)
+IMAGE_WIDTH = 1200
+WAVEFORM_HEIGHT = 200
+SPECTROGRAM_HEIGHT = 400
+BANDWIDTH_HEIGHT = 200
+PANEL_GAP = 12
+
+BACKGROUND = (255, 255, 255)
+WAVEFORM_COLOR = (0, 191, 191)    # matplotlib 'c'
+BANDWIDTH_COLOR = (0, 0, 255)     # matplotlib 'b'
+AXIS_COLOR = (200, 200, 200)
+
+# Anchor points of the magma colormap (the librosa specshow default for dB data)
+MAGMA_ANCHORS = np.array([
+    [0, 0, 4],
+    [40, 11, 84],
+    [101, 21, 110],
+    [159, 42, 99],
+    [212, 72, 66],
+    [245, 125, 21],
+    [250, 193, 39],
+    [252, 253, 191],
+], dtype=np.float32)
+
+
+def build_colormap(anchors=MAGMA_ANCHORS, size=256):
+    """Linearly interpolate colour anchors into a (size, 3) uint8 lookup table"""
+    positions = np.linspace(0, 1, len(anchors))
+    samples = np.linspace(0, 1, size)
+    lut = np.stack([np.interp(samples, positions, anchors[:, c]) for c in range(3)], axis=1)
+    return lut.astype(np.uint8)
+
+
+COLORMAP = build_colormap()
+
+
+def encode_png(image, compress_level=1):
+    """Encode an (H, W, 3) uint8 array as an 8-bit RGB PNG"""
+    height, width, _ = image.shape
+    # Every scanline is prefixed with filter type 0 (None)
+    raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', header),
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level)),
+        chunk(b'IEND', b''),
+    ])
+
+
+def _column_spans(values, height, lo, hi):
+    """Map a per-column value range onto pixel rows (row 0 is the top of the panel)"""
+    scale = (height - 1) / (hi - lo) if hi > lo else 0.0
+    rows = (height - 1) - np.round((np.asarray(values) - lo) * scale)
+    return np.clip(rows, 0, height - 1).astype(np.int32)
+
+
+def _fill_spans(panel, top, bottom, color):
+    """Fill, for every column x, rows top[x]..bottom[x] with `color`"""
+    rows = np.arange(panel.shape[0])[:, None]
+    mask = (rows >= top[None, :]) & (rows <= bottom[None, :])
+    panel[mask] = color
+
+
+def render_waveform(y, width=IMAGE_WIDTH, height=WAVEFORM_HEIGHT):
+    """Min/max envelope of the waveform, one column per pixel"""
+    panel = np.empty((height, width, 3), dtype=np.uint8)
+    panel[:] = BACKGROUND
+    if len(y) == 0:
+        return panel
+
+    # reduceat over equal-width column slices (a single sample when y is shorter than the image)
+    starts = (np.arange(width, dtype=np.int64) * len(y)) // width
+    col_max = np.maximum.reduceat(y, starts)
+    col_min = np.minimum.reduceat(y, starts)
+
+    peak = float(np.max(np.abs(y))) or 1.0
+    top = _column_spans(col_max, height, -peak, peak)
+    bottom = _column_spans(col_min, height, -peak, peak)
+    panel[height // 2, :] = AXIS_COLOR
+    _fill_spans(panel, top, bottom, WAVEFORM_COLOR)
+    return panel
+
+
+def render_stft(S, sr, width=IMAGE_WIDTH, height=SPECTROGRAM_HEIGHT, top_db=80.0):
+    """Log-frequency dB spectrogram of an STFT magnitude, mapped through the colormap"""
+    n_bins, n_frames = S.shape
+    ref = float(np.max(S)) if S.size else 0.0
+    if ref <= 0 or n_frames == 0:
+        panel = np.empty((height, width, 3), dtype=np.uint8)
+        panel[:] = COLORMAP[0]
+        return panel
+
+    # Only gather the pixels we need before the (comparatively costly) log
+    bin_hz = (sr / 2) / (n_bins - 1)
+    freqs = np.geomspace(bin_hz, sr / 2, height)[::-1]
+    row_bins = np.clip(np.round(freqs / bin_hz).astype(np.int64), 1, n_bins - 1)
+    col_frames = np.minimum((np.arange(width) * n_frames) // width, n_frames - 1)
+    magnitude = S[row_bins[:, None], col_frames[None, :]]
+
+    db = 20.0 * np.log10(np.maximum(magnitude, 1e-10) / ref)
+    db = np.clip(db, -top_db, 0.0)
+    index = ((db + top_db) * (255.0 / top_db)).astype(np.uint8)
+    return COLORMAP[index]
+
+
+def render_bandwidth(bandwidth, width=IMAGE_WIDTH, height=BANDWIDTH_HEIGHT):
+    """Spectral bandwidth over time as a connected line"""
+    panel = np.empty((height, width, 3), dtype=np.uint8)
+    panel[:] = BACKGROUND
+    if len(bandwidth) == 0:
+        return panel
+
+    columns = np.interp(np.linspace(0, len(bandwidth) - 1, width),
+                        np.arange(len(bandwidth)), bandwidth)
+    rows = _column_spans(columns, height, 0.0, max(float(np.max(columns)), 1.0))
+    previous = np.concatenate([rows[:1], rows[:-1]])
+    panel[height - 1, :] = AXIS_COLOR
+    _fill_spans(panel, np.minimum(rows, previous), np.maximum(rows, previous), BANDWIDTH_COLOR)
+    return panel
+
+
+def render_spectrogram(y, sr, S, bandwidth, output_path='mel_spectrogram.png'):
+    """
+    Lightweight replacement for plot_mel_spectrogram.
+    Draws the waveform envelope, spectrogram and bandwidth panels straight from
+    the already computed STFT magnitude and bandwidth series and writes a PNG.
+    """
+    gap = np.empty((PANEL_GAP, IMAGE_WIDTH, 3), dtype=np.uint8)
+    gap[:] = BACKGROUND
+    image = np.concatenate([
+        render_waveform(y),
+        gap,
+        render_stft(S, sr),
+        gap,
+        render_bandwidth(bandwidth),
+    ], axis=0)
+
+    with open(output_path, 'wb') as f:
+        f.write(encode_png(image))
+    return output_path
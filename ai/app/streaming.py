@@ -0,0 +1,270 @@
+# Real-time voice monitoring over a WebSocket.
+# The client streams mono PCM chunks; each connection owns a StreamSession that
+# keeps the most recent audio and per-frame measurements in ring buffers. Every
+# frame (2048 samples, hop 512, the framing extract_advanced_features uses) is
+# analysed once, when it is complete, and the rolling values over the last
+# STREAM_WINDOW_S seconds are emitted every STREAM_EMIT_MS of audio:
+#   f0       yin over the pyin search range; voiced where the frame is periodic at that lag
+#   jitter   cycle-based local jitter/shimmer (app.perturbation) over the window
+#   shimmer
+#   HNR      harmonic/percussive power after HPSS median filtering (as calculate_hnr)
+#   RMS      frame RMS energy
+# Nothing is recomputed for frames that were already analysed, so the cost per
+# chunk is proportional to the audio it carries, not to the window length.
+import json
+import os
+import threading
+import time
+import numpy as np
+import librosa
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import median_filter
+from scipy.signal import get_window
+from app.perturbation import perturbation_measures
+
+STREAM_SAMPLE_RATE = 16000
+STREAM_WINDOW_S = float(os.getenv("STREAM_WINDOW_S", "2.0"))
+STREAM_EMIT_MS = float(os.getenv("STREAM_EMIT_MS", "250"))
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "32"))
+STREAM_IDLE_TIMEOUT_S = float(os.getenv("STREAM_IDLE_TIMEOUT_S", "30"))
+MAX_CHUNK_BYTES = 256 * 1024
+
+FRAME_LENGTH = 2048       # librosa's default frame, as in extract_advanced_features
+HOP_LENGTH = 512          # PYIN_HOP_LENGTH
+HPSS_KERNEL = 31          # librosa.effects.hpss default kernel (frames in time, bins in frequency)
+FMIN = librosa.note_to_hz('C2')
+FMAX = librosa.note_to_hz('C7')
+VOICING_THRESHOLD = 0.5   # Normalised autocorrelation at the yin lag needed to call a frame voiced
+SILENCE_RMS = 1e-3        # Frames quieter than this are never voiced
+
+PCM_FORMATS = {"s16le": np.dtype("<i2"), "f32le": np.dtype("<f4")}
+
+
+class StreamError(ValueError):
+    """Malformed configuration or audio from a streaming client"""
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring over the last `capacity` rows of an unbounded stream.
+    Rows are addressed by their absolute position in the stream.
+    """
+    def __init__(self, capacity, shape=(), dtype=np.float32, fill=0):
+        self.capacity = capacity
+        self.data = np.full((capacity,) + tuple(shape), fill, dtype=dtype)
+        self.total = 0
+
+    def append(self, rows):
+        # Rows that would be overwritten within this same append are skipped, but still counted
+        skipped = max(0, len(rows) - self.capacity)
+        self.total += skipped
+        rows = rows[skipped:]
+        start = self.total % self.capacity
+        first = min(len(rows), self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        self.data[:len(rows) - first] = rows[first:]
+        self.total += len(rows)
+
+    def read(self, start, stop):
+        """Rows [start, stop) as a contiguous copy; they must still be held"""
+        if start < self.total - self.capacity or stop > self.total or start > stop:
+            raise IndexError(f"rows {start}:{stop} not in buffer (holding {max(0, self.total - self.capacity)}:{self.total})")
+        indices = np.arange(start, stop) % self.capacity
+        return self.data[indices]
+
+
+class StreamSession:
+    """Incremental feature state of one streaming connection"""
+    def __init__(self, sample_rate=STREAM_SAMPLE_RATE, pcm_format="s16le",
+                 window_s=STREAM_WINDOW_S, emit_ms=STREAM_EMIT_MS):
+        if pcm_format not in PCM_FORMATS:
+            raise StreamError(f"format must be one of {', '.join(PCM_FORMATS)}")
+        if not 8000 <= sample_rate <= 192000:
+            raise StreamError("sample_rate must be between 8000 and 192000")
+        self.sr = STREAM_SAMPLE_RATE
+        self.dtype = PCM_FORMATS[pcm_format]
+        self.resampler = None
+        if sample_rate != STREAM_SAMPLE_RATE:
+            import soxr
+            self.resampler = soxr.ResampleStream(sample_rate, STREAM_SAMPLE_RATE, 1, dtype="float32")
+        self._pending = b""  # Bytes of an incomplete sample split across chunks
+
+        self.window_frames = max(1, int(window_s * self.sr) // HOP_LENGTH)
+        self.emit_samples = max(HOP_LENGTH, int(emit_ms * self.sr / 1000))
+        # Audio is consumed in emit-sized steps, so the ring needs the window plus one step
+        self.audio = RingBuffer((self.window_frames + 2) * HOP_LENGTH + FRAME_LENGTH + self.emit_samples)
+        self.frames = 0  # Frames analysed so far
+        self.f0 = RingBuffer(self.window_frames, dtype=np.float64, fill=np.nan)
+        self.rms = RingBuffer(self.window_frames)
+        # Magnitude and frequency-filtered columns wait here until the time-axis
+        # median (HPSS_KERNEL frames centred on the column) can be taken
+        step_frames = self.emit_samples // HOP_LENGTH + 2
+        self.magnitudes = RingBuffer(HPSS_KERNEL + step_frames, shape=(FRAME_LENGTH // 2 + 1,))
+        self.percussive = RingBuffer(HPSS_KERNEL + step_frames, shape=(FRAME_LENGTH // 2 + 1,))
+        # One entry per column whose HPSS masks are final (frame index - HPSS_KERNEL // 2)
+        self.harmonic_power = RingBuffer(self.window_frames, dtype=np.float64)
+        self.noise_power = RingBuffer(self.window_frames, dtype=np.float64)
+        self.fft_window = get_window("hann", FRAME_LENGTH).astype(np.float32)
+        self.next_emit = self.emit_samples
+        self.processing_s = 0.0
+
+    def _decode(self, chunk):
+        chunk = self._pending + bytes(chunk)
+        usable = len(chunk) - len(chunk) % self.dtype.itemsize
+        self._pending = chunk[usable:]
+        samples = np.frombuffer(chunk[:usable], dtype=self.dtype)
+        if self.dtype.kind == "i":
+            samples = samples.astype(np.float32) / 32768.0
+        else:
+            samples = samples.astype(np.float32)
+        if self.resampler is not None:
+            samples = self.resampler.resample_chunk(samples)
+        return samples
+
+    def feed(self, chunk):
+        """Add a PCM chunk; returns the updates that became due (possibly none)"""
+        if len(chunk) > MAX_CHUNK_BYTES:
+            raise StreamError(f"chunks must be at most {MAX_CHUNK_BYTES} bytes")
+        started = time.perf_counter()
+        samples = self._decode(chunk)
+
+        updates = []
+        for offset in range(0, len(samples), self.emit_samples):
+            self.audio.append(samples[offset:offset + self.emit_samples])
+            ready = (self.audio.total - FRAME_LENGTH) // HOP_LENGTH + 1
+            while self.frames < ready:
+                # Analyse up to the next emission point so every update sees exactly its frames
+                due_frame = max(self.frames + 1, (self.next_emit - FRAME_LENGTH) // HOP_LENGTH + 1)
+                stop = min(ready, due_frame)
+                self._analyse(self.frames, stop)
+                self.frames = stop
+                if (self.frames - 1) * HOP_LENGTH + FRAME_LENGTH >= self.next_emit:
+                    updates.append(self.snapshot())
+                    self.next_emit += self.emit_samples
+        self.processing_s += time.perf_counter() - started
+        return updates
+
+    def _analyse(self, start, stop):
+        """Per-frame measurements for frames [start, stop)"""
+        segment = self.audio.read(start * HOP_LENGTH, (stop - 1) * HOP_LENGTH + FRAME_LENGTH)
+        frames = librosa.util.frame(segment, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH)
+
+        self.rms.append(np.sqrt(np.mean(frames ** 2, axis=0)))
+        self.f0.append(self._pitch(segment, frames))
+
+        # librosa.effects.hpss on the magnitude STFT: the harmonic estimate is a
+        # median across time, the percussive one a median across frequency
+        magnitude = np.abs(np.fft.rfft(frames * self.fft_window[:, None], axis=0)).T
+        self.magnitudes.append(magnitude)
+        self.percussive.append(median_filter(magnitude, size=(1, HPSS_KERNEL), mode="reflect"))
+        # A column is final once HPSS_KERNEL // 2 frames exist on either side of it
+        context = HPSS_KERNEL // 2
+        first = max(start - context, context)
+        if first >= stop - context:
+            return
+        block = self.magnitudes.read(first - context, stop)
+        harmonic = np.median(sliding_window_view(block, HPSS_KERNEL, axis=0), axis=-1)
+        magnitude = block[context:context + len(harmonic)]
+        percussive = self.percussive.read(first, stop - context)
+        # Soft masks with power 2 and margin 1, the hpss defaults
+        h2, p2 = harmonic ** 2, percussive ** 2
+        total = h2 + p2
+        mask = np.divide(h2, total, out=np.full_like(total, 0.5), where=total > 0)
+        self.harmonic_power.append(np.sum((magnitude * mask) ** 2, axis=1))
+        self.noise_power.append(np.sum((magnitude * (1 - mask)) ** 2, axis=1))
+
+    def _pitch(self, segment, frames):
+        """yin f0 per frame, NaN where the frame isn't periodic at the detected lag"""
+        f0 = librosa.yin(segment, fmin=FMIN, fmax=FMAX, sr=self.sr, frame_length=FRAME_LENGTH,
+                         hop_length=HOP_LENGTH, center=False)[:frames.shape[1]]
+        lags = np.clip(np.round(self.sr / f0).astype(int), 1, FRAME_LENGTH - 1)
+        voiced = np.zeros(len(f0), dtype=bool)
+        for i, lag in enumerate(lags):
+            a, b = frames[:-lag, i], frames[lag:, i]
+            energy = np.sqrt(np.dot(a, a) * np.dot(b, b))
+            voiced[i] = energy > 0 and np.dot(a, b) / energy >= VOICING_THRESHOLD
+        rms = np.sqrt(np.mean(frames ** 2, axis=0))
+        return np.where(voiced & (rms > SILENCE_RMS), f0, np.nan)
+
+    def snapshot(self):
+        """Rolling values over the last window of analysed frames"""
+        first = max(0, self.frames - self.window_frames)
+        f0 = self.f0.read(first, self.frames)
+        voiced = f0[np.isfinite(f0)]
+
+        # Frame i is centred on sample i * HOP_LENGTH + FRAME_LENGTH // 2, so the
+        # audio starting at the first frame's centre lines up with the f0 track
+        # the way perturbation_measures expects (frame k centred on k * hop)
+        offset = first * HOP_LENGTH + FRAME_LENGTH // 2
+        audio = self.audio.read(offset, min(self.audio.total, offset + len(f0) * HOP_LENGTH))
+        perturbation = perturbation_measures(audio, self.sr, f0, HOP_LENGTH)
+
+        # HNR trails the other values by HPSS_KERNEL // 2 frames (~0.5 s), the
+        # look-ahead the time-axis median needs
+        hnr = None
+        columns = self.harmonic_power.total
+        if columns:
+            hnr_first = max(0, columns - self.window_frames)
+            harmonic = self.harmonic_power.read(hnr_first, columns).sum()
+            noise = self.noise_power.read(hnr_first, columns).sum()
+            hnr = 20.0 if noise == 0 else float(np.clip(10 * np.log10(max(harmonic, 1e-12) / noise), 0, 30))
+
+        received_s = self.audio.total / self.sr
+        # Stream position of the end of the last analysed frame, the same however the audio was chunked
+        analysed_s = ((self.frames - 1) * HOP_LENGTH + FRAME_LENGTH) / self.sr if self.frames else 0.0
+        return {
+            "type": "features",
+            "time_s": round(analysed_s, 3),
+            "window_s": round(len(f0) * HOP_LENGTH / self.sr, 3),
+            "f0_hz": round(float(np.mean(voiced)), 2) if len(voiced) else None,
+            "voiced_ratio": round(len(voiced) / len(f0), 3) if len(f0) else 0.0,
+            "jitter_percent": round(perturbation["jitter_local"], 3),
+            "shimmer_percent": round(perturbation["shimmer_local"], 3),
+            "glottal_cycles": perturbation["cycles"],
+            "hnr_db": round(hnr, 2) if hnr is not None else None,
+            "rms": round(float(np.mean(self.rms.read(first, self.frames))), 5),
+            "realtime_factor": round(self.processing_s / received_s, 4) if received_s else None,
+        }
+
+
+_sessions = threading.BoundedSemaphore(STREAM_MAX_SESSIONS)
+
+
+def serve_stream(ws):
+    """
+    WebSocket protocol: an optional JSON text message first,
+      {"sample_rate": 48000, "format": "s16le" | "f32le"}
+    (16 kHz s16le when omitted), then binary PCM chunks (mono). The server sends a
+    JSON "features" message every STREAM_EMIT_MS of audio; the text message "end"
+    closes the stream after a final update.
+    """
+    if not _sessions.acquire(blocking=False):
+        ws.send(json.dumps({"type": "error", "error": "Too many concurrent streams", "code": "OVERLOADED"}))
+        return
+    try:
+        session = StreamSession()
+        while True:
+            message = ws.receive(timeout=STREAM_IDLE_TIMEOUT_S)
+            if message is None:
+                ws.send(json.dumps({"type": "error", "error": "Stream idle timeout"}))
+                return
+            if isinstance(message, str):
+                if message.strip() == "end":
+                    if session.frames:
+                        ws.send(json.dumps(dict(session.snapshot(), type="final")))
+                    return
+                if session.audio.total:
+                    raise StreamError("configuration must be sent before any audio")
+                try:
+                    config = json.loads(message)
+                    session = StreamSession(int(config.get("sample_rate", STREAM_SAMPLE_RATE)),
+                                            config.get("format", "s16le"))
+                except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+                    raise StreamError(f"invalid configuration: {e}")
+                continue
+            for update in session.feed(message):
+                ws.send(json.dumps(update))
+    except StreamError as e:
+        ws.send(json.dumps({"type": "error", "error": str(e)}))
+    finally:
+        _sessions.release()
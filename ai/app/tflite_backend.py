@@ -0,0 +1,88 @@
+import os
+import threading
+import numpy as np
+from app.resources import RESOURCE_GOVERNOR, STAGE_THREADS
+
+# Threads per TFLite interpreter (0 lets TFLite decide)
+TFLITE_THREADS = int(os.getenv("TFLITE_THREADS", str(STAGE_THREADS["inference"] if RESOURCE_GOVERNOR else 0)))
+
+# Quantized variants produced by export_tflite.py
+TFLITE_VARIANTS = ("fp16", "int8")
+
+# Prefix of the custom-op names select TF ops are stored under
+FLEX_MARKER = b"Flex"
+
+
+def backend_variant(backend):
+    """Map a backend name to its export variant: tflite-int8 -> int8, a bare tflite -> fp16"""
+    return backend.split("-", 1)[1] if "-" in backend else "fp16"
+
+
+def tflite_path(model_path, variant):
+    """Location of an exported model: app/lsm_model3 -> app/lsm_model3_fp16.tflite"""
+    return f"{model_path.rstrip('/')}_{variant}.tflite"
+
+
+def uses_flex_ops(model_path):
+    """
+    True when the model contains select TensorFlow ops. They are stored as custom
+    ops named Flex<Op>, which only tf.lite.Interpreter (with the bundled flex
+    delegate) can run; tflite_runtime fails on them at allocate_tensors(). A stray
+    match in the weights only costs loading the full interpreter.
+    """
+    tail = b""
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            # Carry the last few bytes over so a name split across chunks still matches
+            if FLEX_MARKER in tail + chunk:
+                return True
+            tail = chunk[-(len(FLEX_MARKER) - 1):]
+    return False
+
+
+def _make_interpreter(model_path, num_threads):
+    # The standalone runtime doesn't drag in all of TensorFlow, so it's used when
+    # installed and the model is builtins-only. export_tflite.py allows select TF
+    # ops (the Bi-LSTM and VGGish's STFT front-end), which need the full interpreter
+    Interpreter = None
+    if not uses_flex_ops(model_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            pass
+    if Interpreter is None:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads or None)
+
+
+class TFLiteModel:
+    """
+    Callable TFLite model with the same call convention as the SavedModel signatures:
+    takes one float32 input (array or tensor) and returns a numpy array.
+    """
+    def __init__(self, model_path, num_threads=TFLITE_THREADS):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"TFLite model not found: {model_path}. Run export_tflite.py first.")
+        self.model_path = model_path
+        self._interpreter = _make_interpreter(model_path, num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._input_shape = tuple(self._input['shape'])
+        # A single interpreter isn't safe to invoke from several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, inputs):
+        x = np.asarray(inputs, dtype=np.float32)
+        with self._lock:
+            if tuple(x.shape) != self._input_shape:
+                # VGGish takes variable-length waveforms
+                self._interpreter.resize_tensor_input(self._input['index'], x.shape)
+                self._interpreter.allocate_tensors()
+                self._input = self._interpreter.get_input_details()[0]
+                self._output = self._interpreter.get_output_details()[0]
+                self._input_shape = tuple(x.shape)
+            self._interpreter.set_tensor(self._input['index'], x)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output['index']).copy()
@@ -0,0 +1,140 @@
+# Execution tiers for process_audio.
+#   fast     - features + prediction
+#   standard - fast + rule-based written analysis (generate_fallback_analysis)
+#   full     - standard with the LLM report instead, plus spectrogram, PDF and upload
+# Callers pick a tier and may send a deadline; optional stages whose estimated
+# cost no longer fits the remaining budget are dropped and the tier actually
+# delivered is recorded in the result.
+import os
+import threading
+import time
+
+FAST = "fast"
+STANDARD = "standard"
+FULL = "full"
+TIERS = (FAST, STANDARD, FULL)
+DEFAULT_TIER = os.getenv("DEFAULT_TIER", FULL)
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+# Stages each tier adds on top of the one below it
+TIER_STAGES = {
+    FAST: (),
+    STANDARD: ("fallback_report",),
+    FULL: ("llm_report", "spectrogram", "pdf", "upload"),
+}
+
+# Starting cost estimates in seconds; refined from observed durations as requests run
+DEFAULT_STAGE_COSTS = {
+    "fallback_report": 0.01,
+    "llm_report": float(os.getenv("LLM_STAGE_ESTIMATE_S", "8")),
+    "spectrogram": 0.3,
+    "pdf": 1.0,
+    "upload": 2.0,
+}
+COST_SMOOTHING = 0.2  # Weight of the newest observation in the moving average
+
+
+def parse_tier(value):
+    """Validate a tier name; None/empty means the default tier"""
+    tier = (value or DEFAULT_TIER).strip().lower()
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier '{value}'; expected one of {', '.join(TIERS)}")
+    return tier
+
+
+class StageCosts:
+    """Exponential moving average of how long each optional stage takes"""
+    def __init__(self, defaults):
+        self._costs = dict(defaults)
+        self._lock = threading.Lock()
+
+    def estimate(self, stages):
+        with self._lock:
+            return sum(self._costs.get(stage, 0.0) for stage in stages)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            previous = self._costs.get(stage, seconds)
+            self._costs[stage] = (1 - COST_SMOOTHING) * previous + COST_SMOOTHING * seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: round(cost, 3) for stage, cost in self._costs.items()}
+
+
+stage_costs = StageCosts(DEFAULT_STAGE_COSTS)
+
+
+class Budget:
+    """Time left for one request; unlimited when no deadline was given"""
+    def __init__(self, deadline_ms=None, started=None):
+        self.started = started if started is not None else time.monotonic()
+        self.deadline_ms = deadline_ms
+        self.deadline = self.started + deadline_ms / 1000.0 if deadline_ms else None
+
+    @classmethod
+    def from_header(cls, value, started=None):
+        if not value:
+            return cls(started=started)
+        try:
+            deadline_ms = int(value)
+        except ValueError:
+            raise ValueError(f"{DEADLINE_HEADER} must be an integer number of milliseconds")
+        if deadline_ms <= 0:
+            raise ValueError(f"{DEADLINE_HEADER} must be positive")
+        return cls(deadline_ms, started)
+
+    def remaining(self):
+        if self.deadline is None:
+            return float("inf")
+        return self.deadline - time.monotonic()
+
+    def elapsed_ms(self):
+        return int((time.monotonic() - self.started) * 1000)
+
+
+def plan_tier(requested, budget, skip_stages=()):
+    """
+    Highest tier up to `requested` whose remaining stages fit the budget.
+    `skip_stages` are run by the caller outside this estimate (or not at all).
+    """
+    planned = FAST
+    needed = []
+    for tier in TIERS[1:TIERS.index(requested) + 1]:
+        needed += [stage for stage in TIER_STAGES[tier] if stage not in skip_stages]
+        # The rule-based report is replaced by the LLM one in the full tier
+        stages = [stage for stage in needed if not (tier == FULL and stage == "fallback_report")]
+        if stage_costs.estimate(stages) > budget.remaining():
+            break
+        planned = tier
+    return planned
+
+
+class timed_stage:
+    """Context manager that feeds a stage's duration back into the cost estimates"""
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            stage_costs.record(self.stage, time.monotonic() - self.started)
+        return False
+
+
+def tier_summary(requested, delivered, budget):
+    """What the diagnostics record about the execution tier"""
+    return {
+        "requested": requested,
+        "delivered": delivered,
+        "dropped_stages": [
+            stage for tier in TIERS[TIERS.index(delivered) + 1:TIERS.index(requested) + 1]
+            for stage in TIER_STAGES[tier]
+        ],
+        "deadline_ms": budget.deadline_ms,
+        "elapsed_ms": budget.elapsed_ms(),
+    }
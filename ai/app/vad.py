@@ -0,0 +1,170 @@
+import os
+import numpy as np
+
+# Voice activity detection run before the feature and embedding stages, so
+# pyin, HPSS, LPC and VGGish only see speech instead of the whole recording
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+
+FRAME_MS = 25
+HOP_MS = 10
+ENERGY_MARGIN_DB = 10.0     # Speech must sit this far above the estimated noise floor
+DYNAMIC_RANGE_DB = 50.0     # ...and within this range of the loudest frame
+MAX_VOICED_ZCR = 0.25       # Zero-crossing rate above which a frame needs extra energy
+FRICATIVE_BOOST_DB = 6.0    # Extra energy required for high-ZCR (unvoiced) frames
+HANGOVER_MS = 200           # Keep this much context around speech
+MIN_SPEECH_MS = 100         # Drop blips shorter than this
+ABSOLUTE_FLOOR_DB = -60.0   # Frames quieter than this are never speech
+PERIODICITY_MS = 40         # Autocorrelation window: two periods at PITCH_FMIN
+PITCH_FMIN = 70.0
+PITCH_FMAX = 500.0
+PERIODICITY_THRESHOLD = 0.5  # Normalised autocorrelation peak that makes a frame voiced
+PERIODICITY_CHUNK = 2048     # Frames per batched FFT
+SPEECH_FRACTION_FRAMES = 400  # Periodicity checks spent estimating the speech fraction
+
+
+def frame_features(y, sr):
+    """Per-frame energy (dB) and zero-crossing rate, fully vectorized"""
+    frame = int(sr * FRAME_MS / 1000)
+    hop = int(sr * HOP_MS / 1000)
+    if len(y) < frame:
+        y = np.pad(y, (0, frame - len(y)))
+    frames = np.lib.stride_tricks.sliding_window_view(y, frame)[::hop]
+    energy_db = 10.0 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return energy_db, zcr, hop
+
+
+def periodicity(y, sr, frames=None):
+    """
+    Per-frame peak of the normalised autocorrelation over PITCH_FMIN-PITCH_FMAX
+    lags (about 1 for a periodic frame, near 0 for noise), on the frames of
+    frame_features (or only the frame indices in `frames`). Lags inside the
+    zero-lag lobe are skipped, so low-frequency rumble doesn't pass for voice.
+    """
+    frame = int(sr * FRAME_MS / 1000)
+    hop = int(sr * HOP_MS / 1000)
+    length = int(sr * PERIODICITY_MS / 1000)
+    n_frames = 1 + (max(len(y), frame) - frame) // hop
+    padded = np.pad(np.asarray(y, dtype=np.float64), (0, (n_frames - 1) * hop + length - len(y)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, length)[::hop][:n_frames]
+    if frames is not None:
+        windows = windows[frames]
+
+    min_lag = max(1, int(sr / PITCH_FMAX))
+    max_lag = min(int(sr / PITCH_FMIN), length - 1)
+    lags = np.arange(max_lag + 1)
+    n_fft = 1 << int(np.ceil(np.log2(length + max_lag)))  # No circular wrap up to max_lag
+    peaks = np.zeros(len(windows))
+    for start in range(0, len(windows), PERIODICITY_CHUNK):
+        w = windows[start:start + PERIODICITY_CHUNK]
+        w = w - w.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(w, n=n_fft, axis=1)
+        r = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=n_fft, axis=1)[:, :max_lag + 1]
+        # Energy of the two overlapping parts at each lag, from a running sum of squares
+        energy = np.concatenate([np.zeros((len(w), 1)), np.cumsum(w ** 2, axis=1)], axis=1)
+        head = energy[:, length - lags]
+        tail = energy[:, -1:] - energy[:, lags]
+        nccf = r / np.sqrt(head * tail + 1e-20)
+        past_lobe = np.maximum.accumulate(nccf < 0, axis=1)
+        peaks[start:start + PERIODICITY_CHUNK] = np.where(past_lobe, nccf, 0.0)[:, min_lag:].max(axis=1)
+    return peaks
+
+
+def _energy_decision(y, sr):
+    """
+    Speech mask from energy and ZCR alone, plus the audible frames it left out,
+    which are speech if periodic
+    """
+    energy_db, zcr, hop = frame_features(y, sr)
+    loudest = energy_db.max()
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + ENERGY_MARGIN_DB, loudest - DYNAMIC_RANGE_DB)
+
+    voiced = (energy_db > threshold) & (zcr <= MAX_VOICED_ZCR)
+    unvoiced = energy_db > threshold + FRICATIVE_BOOST_DB
+    # The noise floor comes from the quietest frames, so without any silence (a
+    # sustained vowel) it sits at speech level; audible periodic frames are voice
+    # whatever it says
+    speech = voiced | unvoiced
+    audible = energy_db > max(ABSOLUTE_FLOOR_DB, loudest - DYNAMIC_RANGE_DB)
+    return speech, np.flatnonzero(audible & ~speech), hop
+
+
+def speech_frames(y, sr):
+    """Per-frame speech mask and the hop, before smoothing"""
+    speech, candidates, hop = _energy_decision(y, sr)
+    if len(candidates):
+        speech[candidates] = periodicity(y, sr, candidates) >= PERIODICITY_THRESHOLD
+    return speech, hop
+
+
+def speech_fraction(y, sr, max_checked=SPEECH_FRACTION_FRAMES):
+    """
+    Share of frames speech_frames would mark as speech. Only `max_checked` evenly
+    spaced candidates get the periodicity check, and the share of them that pass
+    stands in for the rest, so the cost no longer grows with the recording.
+    """
+    speech, candidates, _ = _energy_decision(y, sr)
+    periodic = 0.0
+    if len(candidates):
+        checked = candidates[::-(-len(candidates) // max_checked)]
+        periodic = np.mean(periodicity(y, sr, checked) >= PERIODICITY_THRESHOLD) * len(candidates)
+    return float((np.count_nonzero(speech) + periodic) / len(speech))
+
+
+def _dilate(mask, width):
+    """Extend every True run by `width` frames on both sides"""
+    if width <= 0 or not mask.any():
+        return mask
+    kernel = np.ones(2 * width + 1)
+    return np.convolve(mask.astype(float), kernel, mode='same') > 0
+
+
+def _runs(mask):
+    """(start, end) frame indices of the True runs in `mask`"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def detect_speech(y, sr):
+    """Return the speech regions of `y` as (start, end) sample indices"""
+    speech, hop = speech_frames(y, sr)
+
+    min_frames = max(1, MIN_SPEECH_MS // HOP_MS)
+    for start, end in _runs(speech):
+        if end - start < min_frames:
+            speech[start:end] = False
+    speech = _dilate(speech, HANGOVER_MS // HOP_MS)
+
+    frame = int(sr * FRAME_MS / 1000)
+    return [(start * hop, min(len(y), (end - 1) * hop + frame)) for start, end in _runs(speech)]
+
+
+def trim_silence(y, sr):
+    """
+    Concatenate the speech regions of `y`.
+    Returns the trimmed waveform and stats for the report; the original is
+    returned untouched when VAD is disabled or finds no speech.
+    """
+    duration = len(y) / sr
+    stats = {
+        "enabled": VAD_ENABLED,
+        "original_duration": round(duration, 2),
+        "speech_duration": round(duration, 2),
+        "trimmed_ratio": 0.0,
+        "segments": 1,
+    }
+    if not VAD_ENABLED or len(y) == 0:
+        return y, stats
+
+    regions = detect_speech(y, sr)
+    if not regions:
+        stats["segments"] = 0
+        return y, stats
+
+    speech = np.concatenate([y[start:end] for start, end in regions])
+    stats["speech_duration"] = round(len(speech) / sr, 2)
+    stats["trimmed_ratio"] = round(1.0 - len(speech) / len(y), 4)
+    stats["segments"] = len(regions)
+    return speech, stats
@@ -0,0 +1,90 @@
+"""
+Measure how the CPU-bound analysis stages scale with concurrent requests,
+with and without the resource governor (app/resources.py).
+
+    python benchmark_resources.py --duration 10 --concurrency 1 2 4 8
+
+Each mode runs in a fresh interpreter because thread pools are sized at import time.
+Stages run under stage_limits() as they do in process_audio. --features-only skips
+the VGGish embedding (and with it TensorFlow).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from synthetic_audio import synthetic_voice
+
+
+def run_child(args):
+    from app.report_generation import extract_advanced_features, extract_audio_features
+    from app.resources import stage_limits
+
+    def analyse(y):
+        started = time.perf_counter()
+        if not args.features_only:
+            with stage_limits("embedding"):
+                extract_audio_features(y)
+        with stage_limits("features"):
+            extract_advanced_features(y)
+        return time.perf_counter() - started
+
+    y = synthetic_voice(args.duration)
+    analyse(y)  # warm-up: numba JIT, TF graph tracing
+
+    results = []
+    for concurrency in args.concurrency:
+        jobs = concurrency * args.rounds
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(analyse, [y] * jobs))
+        wall = time.perf_counter() - started
+        results.append({
+            "concurrency": concurrency,
+            "throughput_per_min": round(jobs / wall * 60, 2),
+            "p50_s": round(float(np.percentile(latencies, 50)), 3),
+            "p95_s": round(float(np.percentile(latencies, 95)), 3),
+        })
+    print("BENCHMARK_RESULT " + json.dumps(results))
+
+
+def run_mode(args, governor):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child",
+           "--duration", str(args.duration), "--rounds", str(args.rounds),
+           "--concurrency", *map(str, args.concurrency)]
+    if args.features_only:
+        cmd.append("--features-only")
+    env = dict(os.environ, RESOURCE_GOVERNOR=governor)
+    output = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith("BENCHMARK_RESULT "):
+            return json.loads(line[len("BENCHMARK_RESULT "):])
+    raise RuntimeError("Benchmark child produced no result")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU scaling benchmark with and without the resource governor")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of audio per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rounds", type=int, default=2, help="Requests per worker at each concurrency level")
+    parser.add_argument("--features-only", action="store_true", help="Skip the VGGish embedding stage")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = {mode: run_mode(args, governor) for mode, governor in (("default", "0"), ("governed", "1"))}
+
+    print(f"\n{'concurrency':>11} | {'default req/min':>15} {'p95 (s)':>8} | {'governed req/min':>16} {'p95 (s)':>8}")
+    for default, governed in zip(results["default"], results["governed"]):
+        print(f"{default['concurrency']:>11} | {default['throughput_per_min']:>15} {default['p95_s']:>8} | "
+              f"{governed['throughput_per_min']:>16} {governed['p95_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
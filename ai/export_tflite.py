@@ -0,0 +1,189 @@
+"""
+Export the lsm_model3 classifier and VGGish to TFLite (float16 and int8) and
+write an accuracy-parity report against the SavedModel outputs.
+
+    python export_tflite.py --embeddings calibration/embeddings --audio calibration/audio
+
+--embeddings is a directory of stored VGGish embeddings (.npy, shape (128, 128)),
+used to calibrate the int8 classifier and to compare classifier outputs.
+--audio is a directory of recordings used to calibrate and compare VGGish; when
+--embeddings is omitted the classifier set is built from these recordings.
+
+Serve the exports with MODEL_BACKEND=tflite-fp16 or MODEL_BACKEND=tflite-int8.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+import tensorflow as tf
+import tensorflow_hub as hub
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.audio_io import load_audio, SUPPORTED_EXTENSIONS
+from app.tflite_backend import TFLiteModel, tflite_path, TFLITE_VARIANTS
+
+CLASSIFIER_PATH = "app/lsm_model3"
+VGGISH_URL = "https://tfhub.dev/google/vggish/1"
+VGGISH_BASE = "app/vggish"
+REPORT_PATH = "tflite_parity_report.json"
+MAX_LENGTH = 128
+
+
+def load_embeddings(directory):
+    files = sorted(glob.glob(os.path.join(directory, "*.npy")))
+    return [np.load(f).astype(np.float32) for f in files]
+
+
+def load_waveforms(directory):
+    """Decode and peak-normalize recordings the same way extract_audio_features does"""
+    waveforms = []
+    for f in sorted(os.listdir(directory)):
+        if f.rsplit('.', 1)[-1].lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        y, _ = load_audio(os.path.join(directory, f))
+        peak = np.max(np.abs(y)) if len(y) else 0
+        waveforms.append(y / peak if peak > 0 else y)
+    return waveforms
+
+
+def pad_embeddings(embeddings, max_length=MAX_LENGTH):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.shape[0] < max_length:
+        return np.pad(embeddings, ((0, max_length - embeddings.shape[0]), (0, 0)))
+    return embeddings[:max_length]
+
+
+def first_output(output):
+    if isinstance(output, dict):
+        output = list(output.values())[0]
+    return output.numpy() if hasattr(output, 'numpy') else np.asarray(output)
+
+
+def configure(converter, variant, representative_data):
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        def representative_dataset():
+            for sample in representative_data:
+                yield [sample]
+        converter.representative_dataset = representative_dataset
+    # The Bi-LSTM and VGGish's STFT front-end need a few TF ops; these run through
+    # the flex delegate bundled with tf.lite.Interpreter
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+        tf.lite.OpsSet.SELECT_TF_OPS,
+    ]
+    return converter
+
+
+def export(converter, output_path):
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    print(f"✓ Wrote {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+    return output_path
+
+
+def timed(fn, inputs):
+    outputs, started = [], time.perf_counter()
+    for x in inputs:
+        outputs.append(first_output(fn(x)))
+    elapsed_ms = (time.perf_counter() - started) * 1000 / max(len(inputs), 1)
+    return outputs, elapsed_ms
+
+
+def classifier_parity(reference_fn, candidate, embeddings):
+    batches = [np.expand_dims(e, 0) for e in embeddings]
+    reference, reference_ms = timed(lambda x: reference_fn(tf.constant(x)), batches)
+    outputs, candidate_ms = timed(candidate, batches)
+    diffs = [np.abs(r - o) for r, o in zip(reference, outputs)]
+    agreement = [int(np.argmax(r) == np.argmax(o)) for r, o in zip(reference, outputs)]
+    return {
+        "samples": len(batches),
+        "top1_agreement": float(np.mean(agreement)),
+        "max_abs_diff": float(max(d.max() for d in diffs)),
+        "mean_abs_diff": float(np.mean([d.mean() for d in diffs])),
+        "savedmodel_ms": round(reference_ms, 2),
+        "tflite_ms": round(candidate_ms, 2),
+    }
+
+
+def vggish_parity(vggish, candidate, waveforms):
+    reference, reference_ms = timed(lambda x: vggish(tf.constant(x)), waveforms)
+    outputs, candidate_ms = timed(candidate, waveforms)
+    cosines, diffs = [], []
+    for r, o in zip(reference, outputs):
+        norms = np.linalg.norm(r, axis=1) * np.linalg.norm(o, axis=1)
+        cosines.append(np.mean(np.sum(r * o, axis=1) / np.maximum(norms, 1e-12)))
+        diffs.append(np.abs(r - o))
+    return {
+        "samples": len(waveforms),
+        "mean_cosine_similarity": float(np.mean(cosines)),
+        "min_cosine_similarity": float(np.min(cosines)),
+        "max_abs_diff": float(max(d.max() for d in diffs)),
+        "mean_abs_diff": float(np.mean([d.mean() for d in diffs])),
+        "savedmodel_ms": round(reference_ms, 2),
+        "tflite_ms": round(candidate_ms, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export lsm_model3 and VGGish to TFLite with a parity report")
+    parser.add_argument("--embeddings", help="Directory of stored VGGish embeddings (.npy)")
+    parser.add_argument("--audio", help="Directory of recordings for VGGish calibration and parity")
+    parser.add_argument("--variants", nargs="+", default=list(TFLITE_VARIANTS), choices=TFLITE_VARIANTS)
+    parser.add_argument("--skip-vggish", action="store_true")
+    parser.add_argument("--report", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    waveforms = load_waveforms(args.audio) if args.audio else []
+    vggish = None if args.skip_vggish and args.embeddings else hub.load(VGGISH_URL)
+
+    if args.embeddings:
+        embeddings = load_embeddings(args.embeddings)
+    else:
+        embeddings = [pad_embeddings(first_output(vggish(tf.constant(w)))) for w in waveforms]
+    if not embeddings:
+        parser.error("No calibration data: pass --embeddings and/or --audio")
+
+    report = {"classifier": {}, "vggish": {}}
+
+    print("\n=== Classifier ===")
+    saved_model = tf.saved_model.load(CLASSIFIER_PATH)
+    reference_fn = saved_model.signatures["serving_default"]
+    calibration = [np.expand_dims(e, 0) for e in embeddings]
+    for variant in args.variants:
+        converter = configure(tf.lite.TFLiteConverter.from_saved_model(CLASSIFIER_PATH), variant, calibration)
+        path = export(converter, tflite_path(CLASSIFIER_PATH, variant))
+        report["classifier"][variant] = classifier_parity(reference_fn, TFLiteModel(path), embeddings)
+        report["classifier"][variant]["size_mb"] = round(os.path.getsize(path) / 1e6, 2)
+
+    if not args.skip_vggish:
+        if not waveforms:
+            parser.error("VGGish export needs --audio recordings (or pass --skip-vggish)")
+        print("\n=== VGGish ===")
+        concrete = tf.function(lambda waveform: vggish(waveform)).get_concrete_function(
+            tf.TensorSpec([None], tf.float32, name="waveform"))
+        for variant in args.variants:
+            converter = configure(tf.lite.TFLiteConverter.from_concrete_functions([concrete], vggish),
+                                  variant, [w.astype(np.float32) for w in waveforms])
+            path = export(converter, tflite_path(VGGISH_BASE, variant))
+            report["vggish"][variant] = vggish_parity(vggish, TFLiteModel(path), waveforms)
+            report["vggish"][variant]["size_mb"] = round(os.path.getsize(path) / 1e6, 2)
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n=== Parity report ===")
+    for name, variants in report.items():
+        for variant, stats in variants.items():
+            print(f"{name:10s} {variant:5s} " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+    print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Golden-output equivalence check for the acoustic features.
+
+    python feature_equivalence.py record --audio fixtures/audio
+    python feature_equivalence.py compare --backend mypackage.fast_features:extract
+
+`record` runs a fixture corpus (the recordings in --audio plus built-in synthetic
+voices) through the reference extract_advanced_features and stores the outputs
+in --golden. `compare` runs a candidate backend over the same corpus, checks
+every feature against the golden value within its tolerance and against the
+NORMAL_RANGES verdict the PDF report prints, times candidate and reference on
+this machine, and writes a report. It exits with status 1 when anything is out
+of tolerance, so it can gate changes to the feature code.
+
+A backend is any `module:function` taking a 16 kHz float32 waveform and returning
+a dict with (a subset of) extract_advanced_features' keys; backends covering one
+stage only (pitch, HPSS, ...) are compared on the keys they return. Without
+--backend, compare re-runs the current extract_advanced_features, which checks
+an edit to the reference code itself.
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.audio_io import load_audio, SUPPORTED_EXTENSIONS
+from app.pdf_report import NORMAL_RANGES, is_within_range
+from app.report_generation import extract_advanced_features
+from synthetic_audio import VOWEL_A, synthetic_voice
+
+GOLDEN_PATH = "golden_features.json"
+REPORT_PATH = "feature_equivalence_report.json"
+SR = 16000
+
+# (absolute, relative) tolerance per feature: |candidate - golden| <= abs + rel * |golden|.
+# Clinical features are held to a fraction of their NORMAL_RANGES width.
+TOLERANCES = {
+    "Fundamental_Frequency_Mean": (0.5, 0.005),
+    "Fundamental_Frequency_Std": (0.5, 0.02),
+    "Jitter_Percent": (0.05, 0.02),
+    "Jitter_RAP_Percent": (0.05, 0.02),
+    "Jitter_PPQ5_Percent": (0.05, 0.02),
+    "Shimmer_Percent": (0.1, 0.02),
+    "Shimmer_APQ11_Percent": (0.1, 0.02),
+    "Glottal_Cycles": (2, 0.02),
+    "HNR_dB": (0.3, 0.02),
+    "Voice_Period_Mean": (0.0, 0.005),
+    "Voiced_Segments_Ratio": (0.01, 0.0),
+    "Formant_Frequency": (10.0, 0.02),
+    "Formant_F2_Frequency": (15.0, 0.02),
+    "Formant_F3_Frequency": (20.0, 0.02),
+    "Formant_F1_IQR": (10.0, 0.05),
+    "Formant_F2_IQR": (15.0, 0.05),
+    "Formant_F3_IQR": (20.0, 0.05),
+    "Formant_Frames": (2, 0.02),
+    "Spectral_Centroid": (0.0, 0.01),
+    "Spectral_Bandwidth": (0.0, 0.01),
+    "Spectral_Rolloff": (0.0, 0.01),
+    "Spectral_Contrast": (0.0, 0.01),
+    "RMS_Energy_Mean": (0.0, 0.01),
+    "RMS_Energy_Std": (0.0, 0.02),
+    "MFCC_Mean": (0.1, 0.01),   # per coefficient
+    "MFCC_Std": (0.1, 0.01),
+}
+DEFAULT_TOLERANCE = (0.0, 0.01)
+
+
+SYNTHETIC_FIXTURES = {
+    "synthetic/male_steady": dict(duration=5, f0=120),
+    "synthetic/female_steady": dict(duration=5, f0=210, seed=1),
+    "synthetic/rough": dict(duration=5, f0=135, jitter=0.015, shimmer=0.08, noise=0.05, seed=2),
+    "synthetic/breathy": dict(duration=5, f0=180, noise=0.2, seed=3),
+    "synthetic/pauses": dict(duration=8, f0=150, pauses=True, seed=4),
+    "synthetic/long": dict(duration=60, f0=125, jitter=0.005, shimmer=0.03, seed=5),
+    # Resonator-shaped /a/ (F1-F3 at 700/1220/2600 Hz) so the formant tracker has real targets
+    "synthetic/vowel_a": dict(duration=5, f0=120, formants=VOWEL_A, harmonics=40, noise=0.001, seed=6),
+}
+
+
+def load_corpus(audio_dir=None, synthetic=True):
+    """{fixture name: 16 kHz waveform}"""
+    corpus = {}
+    if synthetic:
+        corpus.update({name: synthetic_voice(**params) for name, params in SYNTHETIC_FIXTURES.items()})
+    if audio_dir:
+        for f in sorted(os.listdir(audio_dir)):
+            if f.rsplit('.', 1)[-1].lower() in SUPPORTED_EXTENSIONS:
+                corpus[f] = load_audio(os.path.join(audio_dir, f))[0]
+    return corpus
+
+
+def waveform_digest(y):
+    return hashlib.sha256(np.ascontiguousarray(y, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+
+def load_backend(spec):
+    """'package.module:function' -> callable"""
+    if spec is None:
+        return extract_advanced_features
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError("--backend must look like package.module:function")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def run_timed(fn, y, repeat):
+    """Outputs of the last run and the median wall time in ms"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = fn(y)
+        times.append((time.perf_counter() - started) * 1000)
+    return output, float(np.median(times))
+
+
+def deviation(name, candidate, golden):
+    """(worst |difference|, within tolerance) for a scalar or vector feature"""
+    abs_tol, rel_tol = TOLERANCES.get(name, DEFAULT_TOLERANCE)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    golden = np.asarray(golden, dtype=np.float64)
+    if candidate.shape != golden.shape:
+        return float("inf"), False
+    diff = np.abs(candidate - golden)
+    ok = bool(np.all(diff <= abs_tol + rel_tol * np.abs(golden)))
+    return float(diff.max()) if diff.size else 0.0, ok
+
+
+def range_flip(name, candidate, golden):
+    """True when the candidate lands on the other side of a NORMAL_RANGES bound"""
+    if name not in NORMAL_RANGES:
+        return False
+    return is_within_range(candidate, name) != is_within_range(golden, name)
+
+
+def record(args):
+    corpus = load_corpus(args.audio, not args.no_synthetic)
+    if not corpus:
+        sys.exit("Empty corpus: pass --audio or drop --no-synthetic")
+    extract_advanced_features(corpus[next(iter(corpus))])  # warm-up: numba JIT, librosa caches
+
+    fixtures = {}
+    for name, y in corpus.items():
+        features, ms = run_timed(extract_advanced_features, y, args.repeat)
+        fixtures[name] = {
+            "digest": waveform_digest(y),
+            "duration_s": round(len(y) / SR, 2),
+            "reference_ms": round(ms, 1),
+            "features": features,
+        }
+        print(f"✓ {name} ({len(y) / SR:.1f}s, {ms:.0f} ms)")
+
+    with open(args.golden, "w") as f:
+        json.dump({"recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"), "sample_rate": SR,
+                   "fixtures": fixtures}, f, indent=2)
+    print(f"\nGolden outputs for {len(fixtures)} fixtures written to {args.golden}")
+
+
+def compare(args):
+    with open(args.golden) as f:
+        golden = json.load(f)["fixtures"]
+    corpus = load_corpus(args.audio, not args.no_synthetic)
+    candidate_fn = load_backend(args.backend)
+    for override in args.tolerance:
+        name, _, value = override.partition("=")
+        abs_tol, _, rel_tol = value.partition(",")
+        TOLERANCES[name] = (float(abs_tol), float(rel_tol) if rel_tol else 0.0)
+
+    missing = sorted(set(golden) - set(corpus))
+    if missing:
+        sys.exit(f"Fixtures in {args.golden} not found in the corpus: {', '.join(missing)}")
+    warm = corpus[next(iter(golden))]
+    candidate_fn(warm)
+    extract_advanced_features(warm)
+
+    features, timings, failures = {}, [], []
+    for name, entry in golden.items():
+        y = corpus[name]
+        if waveform_digest(y) != entry["digest"]:
+            failures.append(f"{name}: fixture audio changed since the golden outputs were recorded")
+            continue
+        output, candidate_ms = run_timed(candidate_fn, y, args.repeat)
+        _, reference_ms = run_timed(extract_advanced_features, y, args.repeat)
+        timings.append({"fixture": name, "duration_s": entry["duration_s"],
+                        "reference_ms": round(reference_ms, 1), "candidate_ms": round(candidate_ms, 1),
+                        "speedup": round(reference_ms / candidate_ms, 2) if candidate_ms > 0 else None})
+
+        for key, expected in entry["features"].items():
+            if key not in output:
+                continue
+            worst, ok = deviation(key, output[key], expected)
+            flipped = range_flip(key, output[key], expected)
+            stats = features.setdefault(key, {"max_abs_diff": 0.0, "worst_fixture": None,
+                                              "tolerance": TOLERANCES.get(key, DEFAULT_TOLERANCE),
+                                              "failures": 0, "range_flips": 0})
+            if worst >= stats["max_abs_diff"]:
+                stats["max_abs_diff"], stats["worst_fixture"] = worst, name
+            if not ok:
+                stats["failures"] += 1
+                failures.append(f"{name}: {key} = {output[key]} (golden {expected})")
+            if flipped:
+                stats["range_flips"] += 1
+                failures.append(f"{name}: {key} crosses a NORMAL_RANGES bound ({expected} -> {output[key]})")
+
+    reference_total = sum(t["reference_ms"] for t in timings)
+    candidate_total = sum(t["candidate_ms"] for t in timings)
+    report = {
+        "backend": args.backend or "app.report_generation:extract_advanced_features",
+        "passed": not failures,
+        "features": features,
+        "timings": timings,
+        "total_speedup": round(reference_total / candidate_total, 2) if candidate_total > 0 else None,
+        "failures": failures,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'feature':<28} {'max |diff|':>12} {'tolerance':>14} {'fails':>6} {'flips':>6}")
+    for key, stats in features.items():
+        abs_tol, rel_tol = stats["tolerance"]
+        tolerance = f"{abs_tol:g}+{rel_tol * 100:g}%"
+        print(f"{key:<28} {stats['max_abs_diff']:>12.5g} {tolerance:>14} {stats['failures']:>6} {stats['range_flips']:>6}")
+    print(f"\n{'fixture':<28} {'seconds':>8} {'reference ms':>13} {'candidate ms':>13} {'speedup':>8}")
+    for t in timings:
+        print(f"{t['fixture']:<28} {t['duration_s']:>8} {t['reference_ms']:>13} {t['candidate_ms']:>13} {t['speedup']:>8}")
+    print(f"\nTotal speedup: {report['total_speedup']}x")
+    for failure in failures:
+        print(f"✗ {failure}")
+    print(f"\n{'✓ Equivalent' if not failures else f'✗ {len(failures)} deviations'}; report written to {args.report}")
+    return 0 if not failures else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-output equivalence check for the acoustic features")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ("record", "compare"):
+        p = sub.add_parser(command)
+        p.add_argument("--audio", help="Directory of fixture recordings (added to the synthetic voices)")
+        p.add_argument("--no-synthetic", action="store_true", help="Use only the recordings in --audio")
+        p.add_argument("--golden", default=GOLDEN_PATH)
+        p.add_argument("--repeat", type=int, default=3, help="Runs per fixture; the median time is kept")
+    compare_parser = sub.choices["compare"]
+    compare_parser.add_argument("--backend", help="Candidate as module:function (default: current reference)")
+    compare_parser.add_argument("--tolerance", action="append", default=[], metavar="FEATURE=ABS[,REL]",
+                                help="Override a feature's tolerance")
+    compare_parser.add_argument("--report", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
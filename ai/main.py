@@ -1,3 +1,4 @@
+import os
 from dotenv import load_dotenv
 from flask_cors import CORS #Cross Origin Resource sharing
 
@@ -5,8 +6,16 @@ load_dotenv()
 
 from app import create_app
 
-app = create_app()
-CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+def build_app():
+    app = create_app()
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    return app
+
+
+# Worker processes started with spawn/forkserver (the PDF pool) re-import this
+# script as __mp_main__, so the app is only built when it is run directly.
+# WSGI servers load it from wsgi.py instead.
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8080, use_reloader=False)
\ No newline at end of file
+    app = build_app()
+    app.run(host='0.0.0.0', port=int(os.getenv("AI_PORT", "8080")), use_reloader=False)
@@ -0,0 +1,509 @@
+"""
+End-to-end load and soak test for the AI service and the WhatsApp gateway,
+with local stand-ins for Groq, Cloudinary and Twilio so no credits or quota are used.
+
+    python soak_test.py --launch --duration 3600 --rate process_audio=0.5 --rate chat=2 --rate whatsapp=0.2
+    python soak_test.py --stubs-only      # just the stubs; prints the env to point a service at them
+
+The stubs speak just enough of each API for the real SDKs:
+  Groq        POST /openai/v1/chat/completions           (GROQ_BASE_URL)
+  Cloudinary  POST /v1_1/<cloud>/raw/upload               (CLOUDINARY_UPLOAD_PREFIX)
+  Twilio      POST /2010-04-01/Accounts/<sid>/Messages.json (TWILIO_API_URL)
+              GET  /media/<name>                          (the voice note behind MediaUrl0)
+Each one takes injected latency and an error rate (--groq-latency, --groq-error-rate, ...).
+
+With --launch, main.py and (when WhatsApp traffic is requested) whatsapp.py are
+started against the stubs. Requests are fired open-loop at the target rates
+(Poisson arrivals), so a slow service doesn't lower the offered load; latency is
+measured from each request's scheduled start. WhatsApp requests are timed end to
+end, from the webhook until the gateway's report message reaches the Twilio stub.
+The report has latency percentiles, error and shed rates per endpoint, and the AI
+service's RSS over time (from /api/metrics) with its growth rate.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import requests
+import soundfile as sf
+
+from synthetic_audio import synthetic_voice
+
+ENDPOINTS = ("process_audio", "chat", "whatsapp")
+STUB_CLOUD_NAME = "soak-test"
+STUB_ACCOUNT_SID = "AC" + "0" * 32
+REPORT_PATH = "soak_report.json"
+CANNED_REPORT = (
+    "1. Voice Quality Assessment: Stable phonation with mild perturbation.\n"
+    "2. Possible Causes: Vocal fatigue.\n"
+    "3. Recommendations: Hydration and voice rest.\n"
+    "4. When to Seek Medical Attention: If hoarseness persists beyond two weeks."
+)
+
+
+class Fault:
+    """Injected behaviour of one stub: latency (mean seconds, ±50%) and error rate"""
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def apply(self):
+        """Sleep the injected latency; True when this call should fail"""
+        if self.latency > 0:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        return random.random() < self.error_rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+    stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def count(self, outcome):
+        with self.stub.lock:
+            self.stub.calls[outcome] += 1
+
+
+class GroqHandler(StubHandler):
+    def do_POST(self):
+        self.read_body()
+        if not self.path.endswith("/chat/completions"):
+            return self.send_json(404, {"error": {"message": "unknown endpoint"}})
+        if self.stub.fault.apply():
+            self.count("error")
+            return self.send_json(500, {"error": {"message": "injected failure", "type": "internal_server_error"}})
+        self.count("ok")
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": CANNED_REPORT}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 60, "total_tokens": 160},
+        })
+
+
+class CloudinaryHandler(StubHandler):
+    def do_POST(self):
+        size = len(self.read_body())
+        if not re.match(rf"^/v1_1/{STUB_CLOUD_NAME}/\w+/upload", self.path):
+            return self.send_json(404, {"error": {"message": "unknown endpoint"}})
+        if self.stub.fault.apply():
+            self.count("error")
+            return self.send_json(500, {"error": {"message": "injected failure"}})
+        self.count("ok")
+        public_id = uuid.uuid4().hex
+        self.send_json(200, {
+            "public_id": public_id,
+            "resource_type": "raw",
+            "bytes": size,
+            "secure_url": f"{self.stub.url}/files/{public_id}.pdf",
+        })
+
+
+class TwilioHandler(StubHandler):
+    def do_GET(self):
+        if not self.path.startswith("/media/"):
+            return self.send_json(404, {"message": "not found"})
+        if self.stub.fault.apply():
+            self.count("media_error")
+            return self.send_json(500, {"message": "injected failure"})
+        self.count("media")
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(self.stub.media)))
+        self.end_headers()
+        self.wfile.write(self.stub.media)
+
+    def do_POST(self):
+        form = {k: v[0] for k, v in parse_qs(self.read_body().decode()).items()}
+        if not self.path.endswith("/Messages.json"):
+            return self.send_json(404, {"message": "not found"})
+        if self.stub.fault.apply():
+            self.count("error")
+            return self.send_json(500, {"code": 20500, "message": "injected failure", "status": 500})
+        self.count("ok")
+        if self.stub.on_message:
+            self.stub.on_message(form.get("To"), form.get("MediaUrl"))
+        self.send_json(201, {
+            "sid": "SM" + uuid.uuid4().hex,
+            "account_sid": STUB_ACCOUNT_SID,
+            "to": form.get("To"),
+            "from": form.get("From"),
+            "body": form.get("Body"),
+            "status": "queued",
+            "num_media": "1" if form.get("MediaUrl") else "0",
+        })
+
+
+class StubServer:
+    """One stub API on its own port, served from a background thread"""
+    def __init__(self, handler, port, fault, **attributes):
+        self.fault = fault
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.on_message = None
+        self.__dict__.update(attributes)
+        handler_class = type(handler.__name__, (handler,), {"stub": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def start_stubs(args, media):
+    return {
+        "groq": StubServer(GroqHandler, args.stub_port, Fault(args.groq_latency, args.groq_error_rate)),
+        "cloudinary": StubServer(CloudinaryHandler, args.stub_port + 1,
+                                 Fault(args.cloudinary_latency, args.cloudinary_error_rate)),
+        "twilio": StubServer(TwilioHandler, args.stub_port + 2,
+                             Fault(args.twilio_latency, args.twilio_error_rate), media=media),
+    }
+
+
+def stub_environment(stubs):
+    """Environment that points the AI service and the gateway at the stubs"""
+    return {
+        "GROQ_API_KEY": "stub",
+        "GROQ_BASE_URL": stubs["groq"].url,
+        "CLOUDINARY_CLOUD_NAME": STUB_CLOUD_NAME,
+        "CLOUDINARY_API_KEY": "stub",
+        "CLOUDINARY_API_SECRET": "stub",
+        "CLOUDINARY_UPLOAD_PREFIX": stubs["cloudinary"].url,
+        "TWILIO_ACCOUNT_SID": STUB_ACCOUNT_SID,
+        "TWILIO_AUTH_TOKEN": "stub",
+        "TWILIO_API_URL": stubs["twilio"].url,
+    }
+
+
+def wav_bytes(path=None, duration=8.0):
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    buffer = io.BytesIO()
+    sf.write(buffer, synthetic_voice(duration), 16000, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.outcomes = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, latency, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+            if outcome == "ok":
+                self.latencies.append(latency)
+
+    def summary(self, elapsed):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            outcomes = dict(self.outcomes)
+        total = sum(outcomes.values())
+        summary = {
+            "requests": total,
+            "achieved_rps": round(total / elapsed, 3) if elapsed else 0.0,
+            "outcomes": outcomes,
+            "error_rate": round(1 - (outcomes.get("ok", 0) + outcomes.get("shed", 0)) / total, 4) if total else None,
+            "shed_rate": round(outcomes.get("shed", 0) / total, 4) if total else None,
+        }
+        if len(latencies):
+            summary["latency_ms"] = {f"p{p}": round(float(np.percentile(latencies, p)), 1) for p in (50, 90, 95, 99)}
+            summary["latency_ms"]["max"] = round(float(latencies.max()), 1)
+        return summary
+
+
+def classify(status):
+    if 200 <= status < 300:
+        return "ok"
+    if status in (429, 503):
+        return "shed"  # Admission control or the memory budget turned it away
+    return f"http_{status}"
+
+
+class LoadDriver:
+    def __init__(self, args, audio):
+        self.args = args
+        self.audio = audio
+        self.stats = {name: EndpointStats() for name in ENDPOINTS}
+        self.stats["whatsapp_webhook"] = EndpointStats()
+        self.pool = ThreadPoolExecutor(max_workers=args.max_in_flight, thread_name_prefix="soak")
+        self.local = threading.local()
+        self.pending = {}  # WhatsApp sender -> scheduled start, until the report message arrives
+        self.pending_lock = threading.Lock()
+        self.sequence = 0
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def timed(self, name, scheduled, send):
+        try:
+            status = send().status_code
+            outcome = classify(status)
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        self.stats[name].record(time.monotonic() - scheduled, outcome)
+        return outcome
+
+    def process_audio(self, scheduled):
+        self.timed("process_audio", scheduled, lambda: self.session().post(
+            f"{self.args.service_url}/api/process_audio",
+            files={"audio": ("soak.wav", self.audio, "audio/wav")},
+            data={"tier": self.args.tier}, timeout=self.args.timeout))
+
+    def chat(self, scheduled):
+        self.timed("chat", scheduled, lambda: self.session().post(
+            f"{self.args.service_url}/api/chat",
+            json={"message": "How can I keep my voice healthy while teaching?"}, timeout=self.args.timeout))
+
+    def whatsapp(self, scheduled):
+        with self.pending_lock:
+            self.sequence += 1
+            sender = f"whatsapp:+1555{self.sequence:07d}"
+            self.pending[sender] = scheduled
+        outcome = self.timed("whatsapp_webhook", scheduled, lambda: self.session().post(
+            f"{self.args.gateway_url}/whatsapp",
+            data={"From": sender, "To": "whatsapp:+15550000000", "Body": "",
+                  "MediaUrl0": f"{self.media_url}/media/{uuid.uuid4().hex}.wav",
+                  "MediaContentType0": "audio/wav"},
+            timeout=self.args.timeout))
+        if outcome != "ok":
+            with self.pending_lock:
+                self.pending.pop(sender, None)
+            self.stats["whatsapp"].record(0.0, outcome)
+
+    def on_twilio_message(self, to, media_url):
+        """The gateway replied to a sender; a report carries the PDF as media"""
+        with self.pending_lock:
+            scheduled = self.pending.pop(to, None)
+        if scheduled is not None:
+            self.stats["whatsapp"].record(time.monotonic() - scheduled, "ok" if media_url else "failed_reply")
+
+    def generate(self, name, rate, stop_at):
+        """Open-loop Poisson arrivals at `rate` per second"""
+        fire = getattr(self, name)
+        scheduled = time.monotonic()
+        while True:
+            scheduled += random.expovariate(rate)
+            if scheduled >= stop_at:
+                return
+            time.sleep(max(0.0, scheduled - time.monotonic()))
+            self.pool.submit(fire, scheduled)
+
+    def finish(self, grace):
+        """Wait for outstanding requests, then count WhatsApp reports that never arrived"""
+        self.pool.shutdown(wait=True)
+        deadline = time.monotonic() + grace
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(0.5)
+        with self.pending_lock:
+            for _ in self.pending:
+                self.stats["whatsapp"].record(0.0, "no_reply")
+            self.pending.clear()
+
+
+class RssSampler:
+    """AI service RSS over time, scraped from /api/metrics"""
+    def __init__(self, service_url, interval):
+        self.url = f"{service_url}/api/metrics"
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._started = time.monotonic()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                text = requests.get(self.url, timeout=5).text
+                match = re.search(r"^process_resident_memory_bytes (\d+)", text, re.MULTILINE)
+                if match:
+                    self.samples.append((time.monotonic() - self._started, int(match.group(1)) / 2 ** 20))
+            except requests.RequestException:
+                pass
+
+    def stop(self):
+        self._stop.set()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        times, rss = np.array(self.samples).T
+        summary = {
+            "samples": len(rss),
+            "start_mb": round(float(rss[0]), 1),
+            "end_mb": round(float(rss[-1]), 1),
+            "peak_mb": round(float(rss.max()), 1),
+            "growth_mb": round(float(rss[-1] - rss[0]), 1),
+        }
+        if len(rss) >= 3 and times[-1] > times[0]:
+            # Least-squares slope; steady growth over a long soak points at a leak
+            summary["slope_mb_per_hour"] = round(float(np.polyfit(times, rss, 1)[0] * 3600), 2)
+        return summary
+
+
+def wait_until_ready(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"{url} exited during startup (status {process.returncode})")
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(1)
+    sys.exit(f"{url} not ready after {timeout}s")
+
+
+def launch(args, env):
+    """Start the AI service (and the gateway when needed) against the stubs"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    service_port = urlparse(args.service_url).port or 8080
+    # Own process groups: the gateway runs Flask's reloader, which forks a child
+    processes = [subprocess.Popen([sys.executable, "main.py"], cwd=here, start_new_session=True,
+                                  env=dict(os.environ, **env, AI_PORT=str(service_port)))]
+    print(f"Starting AI service on {args.service_url} (models load first, this can take a while)...")
+    wait_until_ready(f"{args.service_url}/api/metrics", processes[0], args.startup_timeout)
+    if args.rates.get("whatsapp"):
+        gateway_port = urlparse(args.gateway_url).port or 8081
+        processes.append(subprocess.Popen([sys.executable, "whatsapp.py"], cwd=here, start_new_session=True, env=dict(
+            os.environ, **env, AI_SERVICE_URL=args.service_url, WHATSAPP_PORT=str(gateway_port))))
+        wait_until_ready(args.gateway_url, processes[-1], 60)
+    return processes
+
+
+def parse_rates(values):
+    rates = {}
+    for value in values:
+        name, _, rate = value.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{name}'; expected one of {', '.join(ENDPOINTS)}")
+        rates[name] = float(rate)
+    return rates
+
+
+def print_progress(driver, elapsed, rss):
+    parts = []
+    for name in ENDPOINTS:
+        summary = driver.stats[name].summary(elapsed)
+        if summary["requests"]:
+            p95 = summary.get("latency_ms", {}).get("p95")
+            parts.append(f"{name}: {summary['requests']} req, err {summary['error_rate']:.1%}, p95 {p95} ms")
+    if rss.samples:
+        parts.append(f"RSS {rss.samples[-1][1]:.0f} MB")
+    print(f"[{elapsed:6.0f}s] " + " | ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load/soak test against local Groq, Cloudinary and Twilio stubs")
+    parser.add_argument("--rate", action="append", default=[], metavar="ENDPOINT=RPS",
+                        help=f"Target requests per second for {', '.join(ENDPOINTS)}")
+    parser.add_argument("--duration", type=float, default=300, help="Seconds of load")
+    parser.add_argument("--launch", action="store_true", help="Start main.py / whatsapp.py against the stubs")
+    parser.add_argument("--stubs-only", action="store_true", help="Run the stubs and print their environment")
+    parser.add_argument("--service-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--gateway-url", default="http://127.0.0.1:8081")
+    parser.add_argument("--audio", help="Recording to upload (default: 8 s synthetic voice)")
+    parser.add_argument("--tier", default="full", choices=("fast", "standard", "full"))
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Client-side concurrency cap")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--rss-interval", type=float, default=5)
+    parser.add_argument("--progress-interval", type=float, default=60)
+    parser.add_argument("--stub-port", type=int, default=9100, help="Groq stub port; Cloudinary +1, Twilio +2")
+    for name in ("groq", "cloudinary", "twilio"):
+        parser.add_argument(f"--{name}-latency", type=float, default=0.0, help=f"Mean seconds added by the {name} stub")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help=f"Share of {name} calls that fail")
+    parser.add_argument("--report", default=REPORT_PATH)
+    args = parser.parse_args()
+    args.rates = parse_rates(args.rate) if args.rate else {"process_audio": 0.2, "chat": 1.0}
+
+    audio = wav_bytes(args.audio)
+    stubs = start_stubs(args, audio)
+    env = stub_environment(stubs)
+    if args.stubs_only:
+        print("\n".join(f"export {key}={value}" for key, value in env.items()))
+        print("\nStubs running; Ctrl+C to stop")
+        threading.Event().wait()
+
+    processes = launch(args, env) if args.launch else []
+    driver = LoadDriver(args, audio)
+    driver.media_url = stubs["twilio"].url
+    stubs["twilio"].on_message = driver.on_twilio_message
+    rss = RssSampler(args.service_url, args.rss_interval)
+
+    print(f"Load for {args.duration:.0f}s at " + ", ".join(f"{k}={v}/s" for k, v in args.rates.items()))
+    started = time.monotonic()
+    stop_at = started + args.duration
+    generators = [threading.Thread(target=driver.generate, args=(name, rate, stop_at), daemon=True)
+                  for name, rate in args.rates.items() if rate > 0]
+    for generator in generators:
+        generator.start()
+    try:
+        while any(generator.is_alive() for generator in generators):
+            time.sleep(min(args.progress_interval, max(0.1, stop_at - time.monotonic())))
+            print_progress(driver, time.monotonic() - started, rss)
+        driver.finish(grace=args.timeout)
+    finally:
+        rss.stop()
+        for process in processes:
+            os.killpg(process.pid, signal.SIGTERM)
+
+    elapsed = time.monotonic() - started
+    report = {
+        "duration_s": round(elapsed, 1),
+        "target_rps": args.rates,
+        "endpoints": {name: stats.summary(elapsed) for name, stats in driver.stats.items()
+                      if stats.outcomes},
+        "stub_calls": {name: dict(stub.calls) for name, stub in stubs.items()},
+        "rss": rss.summary(),
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'endpoint':<18} {'requests':>8} {'rps':>7} {'errors':>7} {'shed':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, summary in report["endpoints"].items():
+        latency = summary.get("latency_ms", {})
+        print(f"{name:<18} {summary['requests']:>8} {summary['achieved_rps']:>7} {summary['error_rate']:>7.2%} "
+              f"{summary['shed_rate']:>6.2%} {latency.get('p50', '-'):>8} {latency.get('p95', '-'):>8} "
+              f"{latency.get('p99', '-'):>8} {latency.get('max', '-'):>8}")
+    if report["rss"]:
+        r = report["rss"]
+        print(f"\nAI service RSS: {r['start_mb']} → {r['end_mb']} MB (peak {r['peak_mb']} MB, "
+              f"{r.get('slope_mb_per_hour', 'n/a')} MB/h)")
+    print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
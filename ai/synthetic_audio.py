@@ -0,0 +1,48 @@
+"""
+Synthetic voices for the tooling scripts (feature_equivalence.py,
+benchmark_resources.py, soak_test.py), so they all exercise the same signal.
+Only numpy and scipy: benchmark_resources imports this before the app is loaded.
+"""
+import numpy as np
+from scipy.signal import lfilter
+
+SR = 16000
+
+# (frequency, bandwidth) in Hz of F1-F3 for an adult male /a/
+VOWEL_A = ((700, 130), (1220, 70), (2600, 160))
+
+
+def resonate(y, formants, sr=SR):
+    """Pass `y` through a cascade of two-pole resonators, one per (frequency, bandwidth)"""
+    for frequency, bandwidth in formants:
+        r = np.exp(-np.pi * bandwidth / sr)
+        theta = 2 * np.pi * frequency / sr
+        y = lfilter([1 - r], [1, -2 * r * np.cos(theta), r * r], y)
+    return y
+
+
+def synthetic_voice(duration, f0=140.0, jitter=0.0, shimmer=0.0, noise=0.02, pauses=False,
+                    formants=None, harmonics=9, seed=0, sr=SR):
+    """
+    Harmonic voice with slow vibrato, optional cycle-to-cycle period/amplitude
+    perturbation, breath noise and pauses. With `formants` the source is shaped by
+    resonators at those (frequency, bandwidth) pairs; give it enough `harmonics`
+    to reach the highest one.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    inst_f0 = f0 * (1 + 0.02 * np.sin(2 * np.pi * 4 * t))  # Slow vibrato
+    # Period and amplitude are perturbed once per glottal cycle, as jitter and shimmer measure them
+    cycle = (np.cumsum(inst_f0) / sr).astype(int)
+    period_scale = 1 + jitter * rng.standard_normal(cycle[-1] + 1)
+    amplitude_scale = 1 + shimmer * rng.standard_normal(cycle[-1] + 1)
+    phase = 2 * np.pi * np.cumsum(inst_f0 / period_scale[cycle]) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, harmonics + 1)) * amplitude_scale[cycle]
+    if formants:
+        y = resonate(y, formants, sr)
+        y /= np.max(np.abs(y))
+    y += noise * rng.standard_normal(n)
+    if pauses:
+        y[int(0.3 * n):int(0.4 * n)] = noise * rng.standard_normal(int(0.4 * n) - int(0.3 * n))
+    return (y / np.max(np.abs(y))).astype(np.float32)
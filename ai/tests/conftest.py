@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service imports its modules as `app.*` from the ai/ directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from app import admission
+from app.admission import PRIORITY, STANDARD, AdmissionController
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def queued(controller, lane):
+    with controller._lock:
+        return len(controller.queues[lane])
+
+
+def test_freed_slots_go_to_priority_first_then_in_arrival_order():
+    controller = AdmissionController(1, max_queue=4, max_priority_queue=4, queue_timeout=5.0)
+    assert controller.acquire(STANDARD) is None
+    order = []
+
+    def request(name, lane):
+        assert controller.acquire(lane) is None
+        order.append(name)
+
+    threads = []
+    for name, lane in (("s1", STANDARD), ("s2", STANDARD), ("p1", PRIORITY)):
+        thread = threading.Thread(target=request, args=(name, lane))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: queued(controller, lane) == {"s1": 1, "s2": 2, "p1": 1}[name])
+
+    for expected in range(1, 4):
+        controller.release()
+        wait_until(lambda: len(order) == expected)
+    assert order == ["p1", "s1", "s2"]
+    # Each handoff kept the slot occupied rather than freeing and re-taking it
+    assert controller.in_flight == 1
+    for thread in threads:
+        thread.join()
+
+
+def test_full_queue_sheds_immediately():
+    controller = AdmissionController(1, max_queue=0, max_priority_queue=1, queue_timeout=5.0)
+    assert controller.acquire(STANDARD) is None
+    assert controller.acquire(STANDARD) == "queue_full"
+    assert controller.snapshot()["shed_total"]["queue_full"] == 1
+
+
+def test_timed_out_waiter_leaves_the_queue_and_the_slot_is_freed():
+    controller = AdmissionController(1, max_queue=1, max_priority_queue=1, queue_timeout=0.01)
+    assert controller.acquire(STANDARD) is None
+    assert controller.acquire(STANDARD) == "queue_timeout"
+    assert queued(controller, STANDARD) == 0
+    controller.release()
+    assert controller.in_flight == 0
+
+
+def test_slot_handed_over_as_the_wait_times_out_is_not_lost(monkeypatch):
+    controller = AdmissionController(1, max_queue=1, max_priority_queue=1, queue_timeout=0.01)
+
+    class RacingEvent(threading.Event):
+        def wait(self, timeout=None):
+            # The wait runs out, and before the waiter gets the lock back the
+            # running request finishes and hands it the slot
+            super().wait(timeout)
+            releaser = threading.Thread(target=controller.release)
+            releaser.start()
+            releaser.join()
+            return False
+
+    class RacingWaiter(admission._Waiter):
+        def __init__(self):
+            super().__init__()
+            self.event = RacingEvent()
+
+    monkeypatch.setattr(admission, "_Waiter", RacingWaiter)
+    assert controller.acquire(STANDARD) is None
+    assert controller.acquire(STANDARD) is None  # Admitted via the handoff, not shed
+    assert controller.in_flight == 1
+    assert controller.snapshot()["shed_total"]["queue_timeout"] == 0
+    controller.release()
+    assert controller.in_flight == 0
@@ -0,0 +1,82 @@
+import httpx
+import pytest
+from cloudinary.exceptions import BadRequest, Error
+from groq import APIConnectionError, BadRequestError, InternalServerError
+
+from app import outbound
+from app.outbound import CLOSED, HALF_OPEN, OPEN, Dependency, _cloudinary_client_error, _groq_client_error
+
+
+class ClientError(Exception):
+    pass
+
+
+class ServiceDown(Exception):
+    pass
+
+
+def make_dependency(max_concurrency=2):
+    return Dependency("test", timeout=1.0, max_concurrency=max_concurrency, bulkhead_wait=0.01, retries=0,
+                      transient=lambda e: isinstance(e, ServiceDown),
+                      client_error=lambda e: isinstance(e, ClientError))
+
+
+def open_breaker(dependency, monkeypatch):
+    """Open the breaker with its reset time already up, so the next call is the trial"""
+    monkeypatch.setattr(dependency.breaker, "reset_timeout", 0.0)
+    dependency.breaker.state = OPEN
+
+
+def raise_(error):
+    def fn(timeout):
+        raise error
+    return fn
+
+
+def test_client_error_closes_the_breaker(monkeypatch):
+    dependency = make_dependency()
+    open_breaker(dependency, monkeypatch)
+    with pytest.raises(ClientError):
+        dependency.call(raise_(ClientError()))
+    assert dependency.breaker.state == CLOSED
+    assert dependency.calls["failed"] == 1
+
+
+def test_local_error_neither_closes_nor_blocks_the_breaker(monkeypatch):
+    dependency = make_dependency()
+    open_breaker(dependency, monkeypatch)
+    with pytest.raises(FileNotFoundError):
+        dependency.call(raise_(FileNotFoundError("report.pdf")))
+    # Still half-open, and the trial slot is free for the next call
+    assert dependency.breaker.state == HALF_OPEN
+    assert dependency.breaker.allow()
+
+
+def test_available_reflects_breaker_and_bulkhead(monkeypatch):
+    monkeypatch.setattr(outbound, "RETRY_BASE_S", 0.0)
+    dependency = make_dependency(max_concurrency=1)
+    assert dependency.available()
+
+    dependency.in_flight = 1
+    assert not dependency.available()
+    dependency.in_flight = 0
+
+    for _ in range(outbound.BREAKER_FAILURES):
+        with pytest.raises(ServiceDown):
+            dependency.call(raise_(ServiceDown()))
+    assert dependency.breaker.state == OPEN
+    assert not dependency.available()
+    # Peeking doesn't use up the trial call
+    monkeypatch.setattr(dependency.breaker, "reset_timeout", 0.0)
+    assert dependency.available() and dependency.available()
+    assert dependency.breaker.allow()
+
+
+def test_sdk_client_errors_are_recognised():
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    assert _groq_client_error(BadRequestError("bad", response=httpx.Response(400, request=request), body=None))
+    assert not _groq_client_error(InternalServerError("down", response=httpx.Response(500, request=request), body=None))
+    assert not _groq_client_error(APIConnectionError(request=request))
+    assert not _groq_client_error(ValueError("bug"))
+    assert _cloudinary_client_error(BadRequest("Invalid file"))
+    assert not _cloudinary_client_error(Error("socket closed"))
@@ -0,0 +1,39 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import pdf_report
+
+PAYLOAD = {
+    "prediction": "Healthy",
+    "probabilities": {"Healthy": 0.9, "Laryngitis": 0.06, "Vocal Polyp": 0.04},
+    "report_text": "Voice parameters are within normal limits.",
+    "features": {
+        "Fundamental_Frequency_Mean": 140.0,
+        "Fundamental_Frequency_Std": 8.0,
+        "Jitter_Percent": 0.5,
+        "Shimmer_Percent": 2.1,
+        "HNR_dB": 20.0,
+        "Voice_Period_Mean": 0.007,
+        "Voiced_Segments_Ratio": 0.6,
+        "Formant_Frequency": 650.0,
+    },
+    "gender": None,
+    "spectrogram_path": None,
+}
+
+
+def test_render_survives_a_dead_worker():
+    pool = pdf_report.get_pdf_pool()
+    try:
+        # A worker dying (OOM kill, segfault) breaks the executor for every later submit
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        pdf_bytes = pdf_report._render_in_pool(PAYLOAD)
+        assert pdf_bytes[:4] == b"%PDF"
+        assert pdf_report.get_pdf_pool() is not pool
+    finally:
+        pdf_report.get_pdf_pool().shutdown()
+        pdf_report._pool = None
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.perturbation import perturbation_measures, pitch_track
+
+SR = 16000
+HOP_LENGTH = 512
+
+
+def sustained_vowel(duration=3.0, f0=125.0, jitter=0.0, shimmer=0.0, seed=0):
+    """
+    Harmonic vowel built cycle by cycle: each period and peak amplitude is drawn
+    with the given relative standard deviation (e.g. jitter=0.01 for 1 %).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * SR)
+    y = np.zeros(n)
+    t = 0.0
+    while True:
+        period = SR / f0 * (1 + jitter * rng.standard_normal())
+        amplitude = 1 + shimmer * rng.standard_normal()
+        start = int(round(t))
+        length = int(round(t + period)) - start
+        if start + length > n:
+            break
+        phase = 2 * np.pi * np.arange(length) / length
+        y[start:start + length] = amplitude * sum(np.sin(k * phase) / k for k in range(1, 10))
+        t += period
+    return (0.5 * y / np.abs(y).max()).astype(np.float32)
+
+
+def measure(y):
+    f0, _, _ = pitch_track(y, SR, HOP_LENGTH)
+    return f0, perturbation_measures(y, SR, f0, HOP_LENGTH)
+
+
+def test_periodic_vowel_has_no_perturbation():
+    f0, perturbation = measure(sustained_vowel())
+    assert np.nanmedian(f0) == pytest.approx(125.0, rel=0.02)
+    assert perturbation["cycles"] > 300
+    assert perturbation["jitter_local"] < 0.2
+    assert perturbation["shimmer_local"] < 0.5
+
+
+def test_injected_jitter_and_shimmer_are_recovered():
+    _, perturbation = measure(sustained_vowel(jitter=0.01, shimmer=0.05))
+    assert 0.6 < perturbation["jitter_local"] < 1.5
+    assert 3.5 < perturbation["shimmer_local"] < 7.5
+
+
+def test_jitter_alone_does_not_leak_into_shimmer():
+    _, perturbation = measure(sustained_vowel(jitter=0.02))
+    assert 1.2 < perturbation["jitter_local"] < 3.0
+    assert perturbation["shimmer_local"] < 1.0
+
+
+@pytest.mark.parametrize("f0_hz", [150.0, 220.0])
+def test_pure_tone_has_no_jitter(f0_hz):
+    # Neither period is a whole number of samples at 16 kHz, so this only holds
+    # with sub-sample peak positions
+    t = np.arange(3 * SR) / SR
+    _, perturbation = measure((0.5 * np.sin(2 * np.pi * f0_hz * t)).astype(np.float32))
+    assert perturbation["cycles"] > 400
+    for key in ("jitter_local", "jitter_rap", "jitter_ppq5"):
+        assert perturbation[key] < 0.01
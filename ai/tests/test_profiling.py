@@ -0,0 +1,35 @@
+import os
+
+from app import profiling
+
+
+def write_profile(directory, profile_id, extensions, mtime):
+    for extension in extensions:
+        path = os.path.join(directory, profile_id + extension)
+        with open(path, "w") as f:
+            f.write("main.py:run 1\n")
+        os.utime(path, (mtime, mtime))
+
+
+def test_oldest_profiles_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    write_profile(tmp_path, "a" * 32, [".collapsed"], 1000)
+    write_profile(tmp_path, "b" * 32, [".txt", ".pstats"], 2000)
+    write_profile(tmp_path, "c" * 32, [".collapsed"], 3000)
+    write_profile(tmp_path, "d" * 32, [".txt", ".pstats"], 4000)
+    (tmp_path / "notes.md").write_text("not a profile")
+
+    profiling.prune_profiles(max_profiles=2)
+
+    assert sorted(os.listdir(tmp_path)) == ["c" * 32 + ".collapsed", "d" * 32 + ".pstats",
+                                            "d" * 32 + ".txt", "notes.md"]
+    assert profiling.load_profile("d" * 32)[1] == profiling.CPROFILE
+    assert profiling.load_profile("a" * 32) is None
+
+
+def test_zero_keeps_every_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    for i in range(5):
+        write_profile(tmp_path, f"{i:032x}", [".collapsed"], 1000 + i)
+    profiling.prune_profiles(max_profiles=0)
+    assert len(os.listdir(tmp_path)) == 5
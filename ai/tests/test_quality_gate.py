@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+
+from app.quality_gate import assess_quality, NO_SPEECH, TOO_QUIET
+
+SR = 16000
+
+
+def vowel(duration=3.0, f0=140.0, level=0.5):
+    t = np.arange(int(duration * SR)) / SR
+    y = sum(np.sin(2 * np.pi * k * f0 * t) / k for k in range(1, 10))
+    return (level * y / np.abs(y).max()).astype(np.float32)
+
+
+def codes(report):
+    return {reason["code"] for reason in report["reasons"]}
+
+
+def test_loud_continuous_vowel_passes():
+    report = assess_quality(vowel(level=0.9), SR, source_sr=SR)
+    assert report["passed"], report
+    assert report["metrics"]["voiced_fraction"] > 0.95
+    assert not report["warnings"]
+
+
+def test_vowel_with_pauses_passes():
+    rng = np.random.default_rng(0)
+    y = vowel()
+    y[SR:2 * SR] = 0.001 * rng.standard_normal(SR)
+    report = assess_quality(y, SR, source_sr=SR)
+    assert report["passed"], report
+    assert 0.5 < report["metrics"]["voiced_fraction"] < 0.8
+
+
+def test_noise_without_speech_is_rejected():
+    rng = np.random.default_rng(1)
+    report = assess_quality((0.1 * rng.standard_normal(3 * SR)).astype(np.float32), SR, source_sr=SR)
+    assert NO_SPEECH in codes(report)
+
+
+def test_silence_is_rejected_as_too_quiet():
+    report = assess_quality(np.zeros(3 * SR, dtype=np.float32), SR, source_sr=SR)
+    assert codes(report) == {TOO_QUIET}
+
+
+def test_gate_cost_does_not_grow_with_periodicity_checks():
+    # A minute of sustained phonation: every frame would need the periodicity check
+    y = vowel(duration=60.0)
+    assess_quality(y[:SR], SR, source_sr=SR)
+    started = time.perf_counter()
+    report = assess_quality(y, SR, source_sr=SR)
+    assert time.perf_counter() - started < 0.1
+    assert report["metrics"]["voiced_fraction"] > 0.95
@@ -0,0 +1,47 @@
+from app.results import AnalysisResult
+
+FEATURES = {
+    "Fundamental_Frequency_Mean": 121.4, "Fundamental_Frequency_Std": 3.2,
+    "Jitter_Percent": 0.41, "Jitter_RAP_Percent": 0.22, "Jitter_PPQ5_Percent": 0.25,
+    "Shimmer_Percent": 2.7, "Shimmer_APQ11_Percent": 1.9, "Glottal_Cycles": 310,
+    "HNR_dB": 18.3, "Voice_Period_Mean": 0.0082, "Voiced_Segments_Ratio": 0.91,
+    "Formant_Frequency": 702.3, "Formant_F2_Frequency": 1218.9, "Formant_F3_Frequency": 2604.1,
+    "Formant_F1_IQR": 14.2, "Formant_F2_IQR": 21.7, "Formant_F3_IQR": 33.0, "Formant_Frames": 88,
+    "MFCC_Mean": [1.0] * 13, "MFCC_Std": [0.5] * 13,
+}
+
+
+def make_result():
+    return AnalysisResult(
+        audio_file="a.wav", predicted_condition="Healthy",
+        confidence_scores={"Healthy": "91.00%", "Laryngitis": "6.00%", "Vocal Polyp": "3.00%"},
+        features=FEATURES, report_text="ok", model_version="lsm_model3-abc",
+        execution_tier={"requested": "full", "delivered": "standard", "dropped_stages": ["llm_report"],
+                        "deadline_ms": 2000, "elapsed_ms": 1850},
+        memory={"estimated_mb": 40.0, "stages": {"features": {"rss_delta_mb": 12.0}}},
+    )
+
+
+def test_response_carries_formants_but_not_internals():
+    response = make_result().to_response("https://example/report.pdf")
+    assert response["Formants"]["f2"] == {"median": 1218.9, "iqr": 21.7}
+    assert response["Formants"]["voiced_frames"] == 88
+    assert response["Tier"] == "standard"
+    assert "Memory Usage" not in response and "Execution Tier" not in response
+    assert "Report" not in response
+
+
+def test_full_detail_adds_the_structured_report():
+    result = make_result()
+    report = result.to_response(detail=True)["Report"]
+    assert report["acoustic_analysis"]["voice_perturbation"]["jitter"]["rap"] == 0.22
+    assert report["acoustic_analysis"]["additional_measurements"]["formants"] == result.formant_summary()
+    assert "memory" not in report and "execution_tier" not in report
+
+
+def test_diagnostics_keep_timings_and_memory():
+    result = make_result()
+    diagnostics = result.diagnostics()
+    assert diagnostics["analysis_id"] == result.to_response()["Analysis ID"]
+    assert diagnostics["execution_tier"]["elapsed_ms"] == 1850
+    assert diagnostics["memory"]["estimated_mb"] == 40.0
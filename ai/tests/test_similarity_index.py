@@ -0,0 +1,127 @@
+import json
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from app import similarity_index
+from app.similarity_index import SimilarityIndex, VECTOR_DIM
+
+
+def unit_vectors(n, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, VECTOR_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def wait_for_training(index):
+    training = index._training
+    if training is not None:
+        training.join(timeout=30)
+
+
+def test_interrupted_add_is_dropped_on_open(tmp_path):
+    vectors = unit_vectors(4)
+    index = SimilarityIndex(str(tmp_path))
+    ids = [index.add(v, {"predicted_condition": "Healthy"}) for v in vectors[:3]]
+
+    # Crash after the case record was written but before index.json was replaced,
+    # then a second one halfway through writing a record
+    with open(os.path.join(tmp_path, "cases.jsonl"), "a") as f:
+        f.write(json.dumps({"case_id": "orphan"}) + "\n")
+        f.write('{"case_id": "tor')
+
+    reopened = SimilarityIndex(str(tmp_path))
+    assert reopened.count == 3
+    assert [case["case_id"] for case in reopened.cases] == ids
+    with open(os.path.join(tmp_path, "cases.jsonl")) as f:
+        assert len(f.read().splitlines()) == 3
+
+    new_id = reopened.add(vectors[3], {"predicted_condition": "Laryngitis"})
+    again = SimilarityIndex(str(tmp_path))
+    assert again.search(vectors[3], k=1)[0]["case_id"] == new_id
+    assert again.search(vectors[0], k=1)[0]["case_id"] == ids[0]
+
+
+def test_training_runs_off_the_request_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity_index, "TRAIN_MIN_VECTORS", 32)
+    release = threading.Event()
+    kmeans = similarity_index._kmeans
+
+    def slow_kmeans(vectors, n_clusters):
+        release.wait(timeout=30)
+        return kmeans(vectors, n_clusters)
+    monkeypatch.setattr(similarity_index, "_kmeans", slow_kmeans)
+
+    vectors = unit_vectors(40, seed=1)
+    index = SimilarityIndex(str(tmp_path))
+    ids = [index.add(v, {}) for v in vectors[:32]]
+    assert index._training is not None
+
+    # k-means is stuck, yet adds and (exhaustive) searches go through
+    ids += [index.add(v, {}) for v in vectors[32:]]
+    assert index.centroids is None
+    assert index.search(vectors[35], k=1)[0]["case_id"] == ids[35]
+
+    release.set()
+    wait_for_training(index)
+    assert index.centroids is not None
+    assert index.trained_count == 32
+    # Rows added while training ran were bucketed at the swap
+    assert sorted(int(row) for bucket in index.lists for row in bucket) == list(range(40))
+    for row in (0, 35, 39):
+        assert index.search(vectors[row], k=1)[0]["case_id"] == ids[row]
+
+    reopened = SimilarityIndex(str(tmp_path))
+    assert reopened.trained_count == 32
+    assert reopened.centroids is not None
+
+
+def test_instances_see_each_others_adds(tmp_path):
+    # Two instances on one directory stand in for two gunicorn workers
+    vectors = unit_vectors(6, seed=2)
+    first = SimilarityIndex(str(tmp_path))
+    second = SimilarityIndex(str(tmp_path))
+
+    a = first.add(vectors[0], {"user_id": "u1"})
+    b = second.add(vectors[1], {"user_id": "u1"})
+    c = first.add(vectors[2], {})
+
+    for index in (first, second):
+        assert index.search(vectors[1], k=1)[0]["case_id"] == b
+        assert index.count == 3
+        assert index.search(vectors[2], k=1)[0]["case_id"] == c
+        assert {n["case_id"] for n in index.search(vectors[0], k=5, user_id="u1")} == {a, b}
+
+    with open(os.path.join(tmp_path, "cases.jsonl")) as f:
+        assert len(f.read().splitlines()) == 3
+
+
+def _add_from_process(directory, seed, n, queue):
+    index = SimilarityIndex(directory)
+    queue.put([index.add(v, {"seed": seed}) for v in unit_vectors(n, seed=seed)])
+
+
+def test_concurrent_processes_keep_the_index_consistent(tmp_path, monkeypatch):
+    # Enough rows to grow the matrix while the other process is appending
+    monkeypatch.setattr(similarity_index, "INITIAL_CAPACITY", 16)
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers = [context.Process(target=_add_from_process, args=(str(tmp_path), seed, 40, queue))
+               for seed in (3, 4)]
+    for worker in workers:
+        worker.start()
+    ids = [case_id for _ in workers for case_id in queue.get(timeout=60)]
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    index = SimilarityIndex(str(tmp_path))
+    assert index.count == 80
+    assert sorted(case["case_id"] for case in index.cases) == sorted(ids)
+    # Each row's vector belongs to the case record stored next to it
+    for seed in (3, 4):
+        for vector in unit_vectors(40, seed=seed)[::7]:
+            nearest = index.search(vector, k=1)[0]
+            assert nearest["distance"] < 1e-5
+            assert index.cases[[c["case_id"] for c in index.cases].index(nearest["case_id"])]["seed"] == seed
@@ -0,0 +1,50 @@
+import pytest
+
+from app import tiers
+from app.tiers import DEFAULT_STAGE_COSTS, FAST, FULL, STANDARD, Budget, StageCosts, parse_tier, plan_tier
+
+
+@pytest.fixture(autouse=True)
+def fresh_costs(monkeypatch):
+    # Estimates learned by other tests (or earlier requests) don't leak in
+    monkeypatch.setattr(tiers, "stage_costs", StageCosts(DEFAULT_STAGE_COSTS))
+
+
+def budget_of(seconds):
+    return Budget(deadline_ms=int(seconds * 1000))
+
+
+def test_no_deadline_delivers_the_requested_tier():
+    for tier in (FAST, STANDARD, FULL):
+        assert plan_tier(tier, Budget()) == tier
+
+
+def test_tier_degrades_as_the_budget_shrinks():
+    # full needs llm_report + spectrogram + pdf + upload = 8 + 0.3 + 1 + 2 s by default
+    assert plan_tier(FULL, budget_of(30)) == FULL
+    assert plan_tier(FULL, budget_of(5)) == STANDARD
+    assert plan_tier(FULL, budget_of(0.001)) == FAST
+
+
+def test_skipped_stages_are_left_out_of_the_estimate():
+    assert plan_tier(FULL, budget_of(10.5)) == STANDARD
+    assert plan_tier(FULL, budget_of(10.5), skip_stages=("upload",)) == FULL
+
+
+def test_never_exceeds_the_requested_tier():
+    assert plan_tier(STANDARD, budget_of(60)) == STANDARD
+    assert plan_tier(FAST, budget_of(60)) == FAST
+
+
+def test_observed_durations_move_the_estimate():
+    for _ in range(30):
+        tiers.stage_costs.record("llm_report", 1.0)
+    assert tiers.stage_costs.estimate(["llm_report"]) == pytest.approx(1.0, abs=0.05)
+    assert plan_tier(FULL, budget_of(5)) == FULL
+
+
+def test_parse_tier():
+    assert parse_tier(None) == tiers.DEFAULT_TIER
+    assert parse_tier(" Fast ") == FAST
+    with pytest.raises(ValueError):
+        parse_tier("premium")
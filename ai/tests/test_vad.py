@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.signal import lfilter
+
+from app.vad import detect_speech, speech_fraction, speech_frames, trim_silence
+
+SR = 16000
+
+
+def vowel(duration=3.0, f0=140.0):
+    t = np.arange(int(duration * SR)) / SR
+    y = sum(np.sin(2 * np.pi * k * f0 * t) / k for k in range(1, 10))
+    return (0.5 * y / np.abs(y).max()).astype(np.float32)
+
+
+def test_continuous_vowel_is_kept_whole():
+    y = vowel()
+    regions = detect_speech(y, SR)
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert start == 0 and end > 0.99 * len(y)
+
+    speech, stats = trim_silence(y, SR)
+    assert stats["segments"] == 1
+    assert stats["trimmed_ratio"] < 0.01
+    assert len(speech) > 0.99 * len(y)
+
+
+def test_noisy_continuous_vowel_is_kept_whole():
+    rng = np.random.default_rng(0)
+    y = vowel() + 0.05 * rng.standard_normal(3 * SR).astype(np.float32)
+    _, stats = trim_silence(y, SR)
+    assert stats["segments"] == 1
+    assert stats["trimmed_ratio"] < 0.01
+
+
+def test_silence_between_phrases_is_trimmed():
+    rng = np.random.default_rng(1)
+    y = vowel()
+    y[SR:2 * SR] = 0.001 * rng.standard_normal(SR)
+    speech, stats = trim_silence(y, SR)
+    assert stats["segments"] == 2
+    # The second of silence goes, apart from the 200 ms hangover kept on either side
+    assert 0.5 * SR < len(y) - len(speech) < 0.7 * SR
+
+
+def test_noise_is_not_speech():
+    rng = np.random.default_rng(2)
+    white = 0.1 * rng.standard_normal(3 * SR)
+    rumble = lfilter([1.0], [1.0, -0.995], rng.standard_normal(3 * SR))
+    rumble *= 0.3 / np.abs(rumble).max()
+    for y in (white, rumble):
+        assert detect_speech(y, SR) == []
+
+
+def test_speech_fraction_estimate_matches_the_full_mask():
+    # Alternating vowel and loud noise leaves many frames to the periodicity check
+    rng = np.random.default_rng(3)
+    y = np.concatenate([vowel(1.0, 110.0 + 10 * i) if i % 3 else 0.2 * rng.standard_normal(SR).astype(np.float32)
+                        for i in range(30)])
+    speech, _ = speech_frames(y, SR)
+    assert abs(speech_fraction(y, SR, max_checked=200) - np.mean(speech)) < 0.03
+    assert speech_fraction(y, SR, max_checked=len(speech)) == np.mean(speech)
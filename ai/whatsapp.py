@@ -1,64 +1,32 @@
 from twilio.rest import Client
-from flask import Flask, request, send_file
+from flask import Flask, request
 from twilio.twiml.messaging_response import MessagingResponse
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 from werkzeug.utils import secure_filename
-from werkzeug.utils import secure_filename
 from urllib.parse import urlparse
 import mimetypes
 import magic
-from pydub import AudioSegment
-
-
-def convert_to_wav(input_path):
-    """Convert any audio file to WAV format"""
-    try:
-        # Get the file extension
-        file_extension = os.path.splitext(input_path)[1].lower()
-        
-        # Load the audio file based on its format
-        if file_extension == '.mp3':
-            audio = AudioSegment.from_mp3(input_path)
-        elif file_extension == '.ogg':
-            audio = AudioSegment.from_ogg(input_path)
-        elif file_extension == '.flac':
-            audio = AudioSegment.from_file(input_path, format='flac')
-        elif file_extension == '.wav':
-            return input_path  # Already WAV format
-        elif file_extension == '.m4a':
-            audio = AudioSegment.from_file(input_path, format='m4a')
-        else:
-            # Try to load the file using the extension as format
-            audio = AudioSegment.from_file(input_path, format=file_extension[1:])
-        
-        # Generate output path
-        output_path = os.path.splitext(input_path)[0] + '.wav'
-        
-        # Export as WAV
-        audio.export(output_path, format='wav')
-        
-        # Remove the original file if conversion successful
-        if os.path.exists(output_path) and input_path != output_path:
-            os.remove(input_path)
-            
-        return output_path
-    
-    except Exception as e:
-        app.logger.error(f"Error converting audio to WAV: {str(e)}")
-        return input_path
 
+# The gateway is a lightweight process: it never imports the analysis stack
+# (TensorFlow, librosa, ...). Voice notes are handed to the AI service's
+# /api/process_audio, which returns the report with its Cloudinary PDF link.
+AI_SERVICE_URL = os.getenv("AI_SERVICE_URL", "http://localhost:8080").rstrip("/")
+ANALYSIS_TIMEOUT = (5, 300)   # (connect, read) seconds; a full analysis can take a while
+ANALYSIS_RETRIES = int(os.getenv("ANALYSIS_RETRIES", "3"))   # Attempts when the service sheds load
+MAX_RETRY_WAIT = 60
 
 # Directory to save received media files
 MEDIA_DIR = "received_media"
 os.makedirs(MEDIA_DIR, exist_ok=True)
 
-DEFAULT_REPORT_PATH = "reports"
-os.makedirs(DEFAULT_REPORT_PATH,exist_ok=True)
-
 # # Directory to save received audio files
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -109,9 +77,23 @@ AUDIO_MAGIC_PATTERNS = [
 ]
 
 
+# Shared libmagic handle; building one loads the magic database from disk
+mime_detector = magic.Magic(mime=True)
+
+# Pooled keep-alive session for media downloads so repeated fetches from the
+# Twilio media host reuse the same TCP/TLS connection
+http_session = requests.Session()
+http_session.headers.update({'User-Agent': 'Mozilla/5.0'})
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+MEDIA_CHUNK_SIZE = 64 * 1024  # 64KB per read while streaming media to disk
+MEDIA_SNIFF_SIZE = 2048       # Leading bytes handed to libmagic
+MEDIA_TIMEOUT = (5, 30)       # (connect, read) seconds
+
+
 def detect_file_type(content):
-    mime = magic.Magic(mime=True)
-    file_type = mime.from_buffer(content)
+    file_type = mime_detector.from_buffer(content)
     # Also check magic numbers
     for pattern in AUDIO_MAGIC_PATTERNS:
         if content.startswith(pattern):
@@ -139,7 +121,6 @@ def generate_filename(original_url, sender_number, media_type = None):
     
     # If no filename in URL, create a timestamp-based name
     if not original_filename:
-        from datetime import datetime
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         original_filename = f"audio_{timestamp}"
     
@@ -147,12 +128,8 @@ def generate_filename(original_url, sender_number, media_type = None):
     base_name = os.path.splitext(original_filename)[0]
     
     # Get the appropriate extension
-    if media_type is None : 
-        extension = ""
-    extension = get_file_extension(media_type)
+    extension = get_file_extension(media_type) if media_type else ".bin"
     
-    # Always use .wav extension since we're converting everything to WAV
-    extension = '.wav'
     # Create the new filename
     new_filename = f"{base_name}_{sender_number}{extension}"
     
@@ -160,6 +137,25 @@ def generate_filename(original_url, sender_number, media_type = None):
     return secure_filename(new_filename)
 
 
+def download_media(url, filepath):
+    """
+    Stream a media URL to disk in a single request.
+    The file type is sniffed from the first bytes while the rest is written in chunks.
+    Returns the detected type.
+    """
+    head = b""
+    with http_session.get(url, stream=True, timeout=MEDIA_TIMEOUT) as media_response:
+        media_response.raise_for_status()
+        with open(filepath, "wb") as f:
+            for chunk in media_response.iter_content(chunk_size=MEDIA_CHUNK_SIZE):
+                if not chunk:
+                    continue
+                if len(head) < MEDIA_SNIFF_SIZE:
+                    head += chunk[:MEDIA_SNIFF_SIZE - len(head)]
+                f.write(chunk)
+    return detect_file_type(head)
+
+
 def get_authenticated_url(url):
     app.logger.info(f"{url}")
     parsed = urlparse(url)
@@ -174,10 +170,114 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
     raise ValueError("TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN environment variables are required")
 client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+TWILIO_API_URL = os.getenv("TWILIO_API_URL")  # Points the REST client at a stand-in (soak_test.py)
+if TWILIO_API_URL:
+    client.api.base_url = TWILIO_API_URL.rstrip("/")
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Voice notes are analysed off the request thread so the webhook can answer
+# Twilio straight away; results are pushed back through the REST client
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "2"))
+analysis_pool = ThreadPoolExecutor(max_workers=WHATSAPP_WORKERS, thread_name_prefix="whatsapp-worker")
+
+
+class AudioRejected(Exception):
+    """The analysis service's quality gate rejected the recording"""
+    def __init__(self, reasons):
+        self.reasons = reasons
+        super().__init__(", ".join(reason.get("code", "") for reason in reasons))
+
+
+class AnalysisBusy(Exception):
+    """The analysis service kept shedding the request"""
+
+
+def request_analysis(filepath):
+    """
+    Send a downloaded voice note to the analysis service and return its report.
+    Load-shed responses (429/503) are retried after their Retry-After.
+    """
+    for attempt in range(ANALYSIS_RETRIES):
+        with open(filepath, "rb") as audio:
+            response = http_session.post(
+                f"{AI_SERVICE_URL}/api/process_audio",
+                files={"audio": (os.path.basename(filepath), audio)},
+                timeout=ANALYSIS_TIMEOUT,
+            )
+        if response.status_code in (429, 503):
+            if attempt == ANALYSIS_RETRIES - 1:
+                break  # Out of attempts; don't hold up the reply with a pointless wait
+            wait = min(MAX_RETRY_WAIT, int(response.headers.get("Retry-After", "5")))
+            app.logger.info(f"Analysis service busy, retrying in {wait}s")
+            time.sleep(wait)
+            continue
+        if response.status_code == 422:
+            raise AudioRejected(response.json().get("reasons", []))
+        response.raise_for_status()
+        return response.json()
+    raise AnalysisBusy("Analysis service is overloaded")
+
+
+def send_whatsapp(to_number, from_number, body, media_url=None):
+    """Send an out-of-band WhatsApp message through the Twilio REST client"""
+    kwargs = {"to": to_number, "from_": from_number, "body": body}
+    if media_url:
+        kwargs["media_url"] = [media_url]
+    return client.messages.create(**kwargs)
+
+
+def analyse_voice_note(auth_url, media_url, media_type, sender_number, bot_number):
+    """Worker job: download, hand to the analysis service and reply with the sender's PDF"""
+    filepath = None
+    try:
+        filename = generate_filename(media_url, sender_number, media_type)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+        app.logger.info(f"Downloading audio file as: {filename}")
+        try:
+            detected_type = download_media(auth_url, filepath)
+        except requests.RequestException as e:
+            app.logger.error(f"Error downloading audio: {str(e)}")
+            send_whatsapp(sender_number, bot_number, "Sorry, there was an error downloading your audio file. Please try again.")
+            return
+        app.logger.info(f"Detected file type: {detected_type}")
+
+        # Compressed voice notes (OGG/Opus, M4A, ...) are decoded directly by the analysis service
+        report = request_analysis(filepath)
+        pdf_url = report.get("PDF_URL")
+        if not pdf_url:
+            raise RuntimeError("PDF report not generated")
+
+        send_whatsapp(sender_number, bot_number, "Here's your voice analysis report:", pdf_url)
+        app.logger.info(f"Report sent to {sender_number}: {pdf_url}")
+
+    except AudioRejected as e:
+        app.logger.info(f"Voice note from {sender_number} rejected: {str(e)}")
+        reasons = "\n".join(f"- {reason.get('message', reason.get('code'))}" for reason in e.reasons)
+        send_whatsapp(sender_number, bot_number, f"We couldn't analyse this recording:\n{reasons}\nPlease record again in a quiet place.")
+
+    except AnalysisBusy:
+        app.logger.error(f"Analysis service overloaded; giving up on voice note from {sender_number}")
+        send_whatsapp(sender_number, bot_number, "We're handling a lot of recordings right now. Please send your voice note again in a few minutes.")
+
+    except Exception as e:
+        app.logger.error(f"Error processing audio: {str(e)}")
+        send_whatsapp(sender_number, bot_number, "Sorry, we couldn't analyse your audio. Please try again later.")
+
+    finally:
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
+
+
+def run_job(*args):
+    """Run a worker job, making sure a failed reply never kills the pool thread"""
+    try:
+        analyse_voice_note(*args)
+    except Exception as e:
+        app.logger.error(f"WhatsApp worker failed: {str(e)}")
+
 
 @app.route("/whatsapp", methods=["POST"])
 def whatsapp_reply():
@@ -194,65 +294,18 @@ def whatsapp_reply():
         app.logger.info(f"Media URL: {media_url}")
         app.logger.info(f"Media type: {media_type}")
 
+        bot_number = request.form.get("To")
+
         response = MessagingResponse()
 
-        if True :
-            try:
-                auth_url = get_authenticated_url(media_url) 
-                app.logger.info(f"debug only 1")
-                app.logger.info("Downloading audio file...")
-                media_content = requests.get(
-                    auth_url,
-                    headers={'User-Agent': 'Mozilla/5.0'}
-                )
-                media_content.raise_for_status()
-
-                # Now we can use media_content
-                content = media_content.content
-                detected_type = detect_file_type(content)
-                app.logger.info(f"Detected file type: {detected_type}")
-                
-                # Generate appropriate filename
-                if media_type is None : 
-                    filename = "audio"
-                    # filename = generate_filename(media_url, sender_number)
-                filename = generate_filename(media_url, sender_number, media_type)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-                # Log the file details
-                app.logger.info(f"Saving file as: {filename}")
-                app.logger.info(f"Media type detected: {media_type}")
-
-                # Download the file
-                app.logger.info("Downloading audio file...")
-                media_content = requests.get(
-                    auth_url,
-                    headers={'User-Agent': 'Mozilla/5.0'}
-                )
-                media_content.raise_for_status()
-
-                # Save the file
-                with open(filepath, "wb") as f:
-                    f.write(media_content.content)
-                
-                # app.logger.info(f"File saved successfully at: {filepath}")
-                wav_filepath = convert_to_wav(filepath)
-                app.logger.info(f"File converted and saved as WAV at: {wav_filepath}")
-                
-                if os.path.exists(DEFAULT_REPORT_PATH):
-                    message = response.message("Audio received! Here's your report:")
-                    pdf_url = f"https://{request.host}/download-pdf"
-                    message.media(pdf_url)
-                else:
-                    response.message("Audio received! However, the report is not available at the moment.")
-
-            except requests.RequestException as e:
-                app.logger.error(f"Error downloading audio: {str(e)}")
-                response.message("Sorry, there was an error processing your audio file. Please try again.")
-            
-            except Exception as e:
-                app.logger.error(f"Error processing audio: {str(e)}")
-                response.message("An unexpected error occurred. Please try again later.")
+        if not media_url:
+            response.message("Please send a voice note to get your voice analysis report.")
+            return str(response)
+
+        # Acknowledge right away and let a worker do the download and analysis
+        auth_url = get_authenticated_url(media_url)
+        analysis_pool.submit(run_job, auth_url, media_url, media_type, sender_number, bot_number)
+        response.message("Audio received! We're analysing your voice and will send your report shortly.")
 
         return str(response)
 
@@ -262,22 +315,6 @@ def whatsapp_reply():
 
 
 
-@app.route("/download-pdf", methods=["GET"])
-def download_pdf():
-    """Endpoint to serve the PDF file."""
-    try:
-        if not os.path.exists(DEFAULT_REPORT_PATH):
-            return "PDF file not found", 404
-        return send_file(
-            DEFAULT_REPORT_PATH,
-            as_attachment=True,
-            download_name="medical_report.pdf"
-        )
-    except Exception as e:
-        app.logger.error(f"Error serving PDF: {str(e)}")
-        return "Error serving PDF file", 500
-
-
 @app.route("/upload", methods=["POST"])
 def upload_file():
     """Handles file uploads via a simple HTML form."""
@@ -293,17 +330,8 @@ def upload_file():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         return "File uploaded successfully!"
-    
-    if file:
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Convert uploaded file to WAV
-        wav_filepath = convert_to_wav(filepath)
-        return f"File uploaded and converted to WAV successfully at {wav_filepath}!"
-
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=8080)
\ No newline at end of file
+    # The AI service itself listens on 8080
+    app.run(debug=True, port=int(os.getenv("WHATSAPP_PORT", "8081")))
\ No newline at end of file
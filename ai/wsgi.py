@@ -0,0 +1,4 @@
+# WSGI entry point for production servers, e.g. `gunicorn wsgi:app`
+from main import build_app
+
+app = build_app()
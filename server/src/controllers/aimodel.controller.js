@@ -1,5 +1,6 @@
 import { asyncHandler } from "../utils/asyncHandler.js";
 import VoiceHealthReport from "../models/voiceHealthReport.model.js";
+import User from "../models/user.model.js";
 import moment from 'moment-timezone'
 import axios from 'axios';
 import fs from "fs";
@@ -56,9 +57,15 @@ export const diagnose = asyncHandler(async (req, res) => {
     try {
         const formData = new FormData();
         formData.append("audio", fs.createReadStream(filePath));
+        // Lets the AI service look up this user's earlier recordings as similar cases
+        formData.append("user_id", String(req.user.userId));
 
         const flaskResponse = await axios.post(`${process.env.AI_MODEL_URL}/api/process_audio`, formData, {
-            headers: formData.getHeaders(),
+            headers: {
+                ...formData.getHeaders(),
+                // Premium users go through the AI service's priority lane
+                ...(req.isPremium ? { "X-Request-Priority": "paid" } : {}),
+            },
         });
 
         fs.unlink(filePath, (err) => {
@@ -103,6 +110,50 @@ export const diagnose = asyncHandler(async (req, res) => {
             if (err) console.error("Error deleting file:", err);
         });
 
+        // Audio rejected by the AI service's quality gate: no analysis ran, so give the credit back
+        const aiError = error.response?.data;
+        const aiStatus = error.response?.status;
+        if (aiStatus === 422 && aiError?.code === "AUDIO_QUALITY_REJECTED") {
+            if (!req.isPremium) {
+                await User.findByIdAndUpdate(req.user.userId, { $inc: { credits: 1 } });
+            }
+            return res.status(422).json({
+                success: false,
+                message: "Recording could not be analysed. No credit was charged.",
+                code: aiError.code,
+                reasons: aiError.reasons
+            });
+        }
+
+        // Recording too long for the AI service's per-request memory limit: refused before analysis
+        if (aiStatus === 413 && aiError?.code === "RECORDING_TOO_LONG") {
+            if (!req.isPremium) {
+                await User.findByIdAndUpdate(req.user.userId, { $inc: { credits: 1 } });
+            }
+            return res.status(413).json({
+                success: false,
+                message: "Recording is too long to analyse. Please upload a shorter one. No credit was charged.",
+                code: aiError.code
+            });
+        }
+
+        // AI service shed the request under load: nothing ran, refund and pass Retry-After on
+        if ((aiStatus === 429 || aiStatus === 503) && aiError?.code === "OVERLOADED") {
+            if (!req.isPremium) {
+                await User.findByIdAndUpdate(req.user.userId, { $inc: { credits: 1 } });
+            }
+            const retryAfter = error.response.headers?.["retry-after"];
+            if (retryAfter) {
+                res.set("Retry-After", retryAfter);
+            }
+            return res.status(503).json({
+                success: false,
+                message: "The analysis service is busy. Please try again shortly. No credit was charged.",
+                code: aiError.code,
+                retryAfter: retryAfter ? Number(retryAfter) : undefined
+            });
+        }
+
         res.status(500).json({ success: false, message: "Internal server error" });
     }
 });